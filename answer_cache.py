@@ -0,0 +1,204 @@
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ttl_cache import TTLCache
+from config import ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD
+
+# 归一化查询时去掉的首尾标点
+_PUNCTUATION = re.compile(r"^[\s\W_]+|[\s\W_]+$")
+
+
+class SemanticAnswerCache:
+    """语义答案缓存：相似的独立问题直接复用之前生成的回答
+
+    先按归一化后的问题文本精确匹配（不需要调用embedding接口），
+    未命中时计算问题的embedding，用一次矩阵乘法与当前知识库版本下缓存的所有问题比较
+    余弦相似度，最高相似度达到 threshold 即命中。归一化后的问题向量保存在一个矩阵中，
+    写入、淘汰和版本切换时更新对应的行，查找时不再重新拼接。条目按 LRU 淘汰并在 ttl 秒
+    未访问后过期；知识库版本变化（重新构建）后旧版本的条目全部失效。
+    """
+
+    INITIAL_ROWS = 64
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl: Optional[float] = ANSWER_CACHE_TTL,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+    ):
+        self.threshold = threshold
+        # (知识库版本, 归一化后的问题) -> {"query", "embedding", "answer", "doc_ids"}
+        self._cache = TTLCache(max_entries, ttl, on_evict=self._on_evict)
+        self._version: Optional[str] = None
+        # 淘汰回调可能在持有锁的线程中触发（例如查找时通过 get 刷新条目），使用可重入锁
+        self._lock = threading.RLock()
+        # 当前版本各条目的问题向量：_matrix 的第 i 行对应 _row_keys[i]，_valid 标记在用的行，
+        # 空出的行记录在 _free 中供之后写入复用
+        self._matrix: Optional[np.ndarray] = None
+        self._valid = np.zeros(0, dtype=bool)
+        self._row_keys: List[Optional[Tuple[str, str]]] = []
+        self._rows: Dict[Tuple[str, str], int] = {}
+        self._free: List[int] = []
+        self.lookups = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.stores = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """合并空白、统一大小写并去掉首尾标点（如 "什么是词向量？" 与 "什么是词向量"）"""
+        return _PUNCTUATION.sub("", " ".join(query.split()).casefold())
+
+    def _use_version(self, version: str) -> None:
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    self._cache.clear()
+                self._version = version
+                self._reset_matrix()
+
+    def _reset_matrix(self) -> None:
+        self._matrix = None
+        self._valid = np.zeros(0, dtype=bool)
+        self._row_keys = []
+        self._rows = {}
+        self._free = []
+
+    def _add_row(self, key: Tuple[str, str], embedding: np.ndarray) -> None:
+        """写入或覆盖条目的问题向量（需持有锁）"""
+        if self._matrix is not None and self._matrix.shape[1] != embedding.shape[0]:
+            # 向量维度变化（更换了embedding模型），之前的向量不可比
+            self._reset_matrix()
+        row = self._rows.get(key)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                row = len(self._row_keys)
+                if self._matrix is None or row >= len(self._matrix):
+                    capacity = max(self.INITIAL_ROWS, 2 * row)
+                    matrix = np.zeros((capacity, embedding.shape[0]), dtype=np.float32)
+                    valid = np.zeros(capacity, dtype=bool)
+                    if self._matrix is not None:
+                        matrix[:row] = self._matrix[:row]
+                        valid[:row] = self._valid[:row]
+                    self._matrix, self._valid = matrix, valid
+                self._row_keys.append(None)
+            self._rows[key] = row
+            self._row_keys[row] = key
+        self._matrix[row] = embedding
+        self._valid[row] = True
+
+    def _remove_row(self, key: Tuple[str, str]) -> None:
+        """释放条目占用的行（需持有锁）"""
+        row = self._rows.pop(key, None)
+        if row is not None:
+            self._valid[row] = False
+            self._row_keys[row] = None
+            self._free.append(row)
+
+    def _on_evict(self, key: Tuple[str, str], value: Dict) -> None:
+        with self._lock:
+            self._remove_row(key)
+
+    def _best_match(
+        self, version: str, embedding: np.ndarray
+    ) -> Tuple[Optional[Tuple[str, str]], float]:
+        """与当前版本缓存的所有问题向量比较，返回 (最相似条目的键, 相似度)"""
+        with self._lock:
+            if version != self._version or self._matrix is None or not self._rows:
+                return None, 0.0
+            if self._matrix.shape[1] != embedding.shape[0]:
+                return None, 0.0
+            size = len(self._row_keys)
+            scores = self._matrix[:size] @ embedding
+            scores[~self._valid[:size]] = -np.inf
+            best = int(np.argmax(scores))
+            return self._row_keys[best], float(scores[best])
+
+    def lookup(
+        self, version: str, query: str, embed: Callable[[str], List[float]]
+    ) -> Tuple[Optional[Dict], Optional[np.ndarray]]:
+        """查找缓存的回答，返回 (命中的条目, 问题的embedding)
+
+        精确命中时不计算embedding；embedding接口出错时视为未命中，且不返回embedding
+        """
+        self._use_version(version)
+        with self._lock:
+            self.lookups += 1
+
+        entry = self._cache.get((version, self.normalize(query)))
+        if entry is not None:
+            with self._lock:
+                self.exact_hits += 1
+            return entry, entry["embedding"]
+
+        try:
+            embedding = np.asarray(embed(query), dtype=np.float32)
+        except Exception as e:
+            print(f"答案缓存计算embedding失败: {e}")
+            return None, None
+        norm = np.linalg.norm(embedding)
+        if not norm:
+            return None, None
+        embedding = embedding / norm
+
+        key, score = self._best_match(version, embedding)
+        if key is not None and score >= self.threshold:
+            # 通过 get 刷新该条目的访问顺序
+            entry = self._cache.get(key)
+            if entry is not None:
+                with self._lock:
+                    self.semantic_hits += 1
+                print(
+                    f"[Debug] 答案缓存语义命中: {query} ≈ {entry['query']} "
+                    f"(相似度 {score:.3f})"
+                )
+                return entry, embedding
+            # 条目恰好在写入向量之前被淘汰，释放它的行
+            with self._lock:
+                self._remove_row(key)
+        return None, embedding
+
+    def put(
+        self,
+        version: str,
+        query: str,
+        embedding: np.ndarray,
+        answer: str,
+        doc_ids: List[str],
+    ) -> None:
+        self._use_version(version)
+        key = (version, self.normalize(query))
+        self._cache.put(
+            key,
+            {"query": query, "embedding": embedding, "answer": answer, "doc_ids": list(doc_ids)},
+        )
+        with self._lock:
+            # 写入期间版本已切换时，条目已随旧版本清空
+            if version == self._version and key in self._cache:
+                self._add_row(key, embedding)
+            self.stores += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._reset_matrix()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            return {
+                "entries": len(self._cache),
+                "lookups": self.lookups,
+                "hits": hits,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.lookups - hits,
+                "stores": self.stores,
+                "evictions": self._cache.evictions,
+                "hit_rate": round(hits / self.lookups, 3) if self.lookups else 0.0,
+            }
@@ -8,9 +8,14 @@ import os
 import json
 import re
 import shutil
+import asyncio
 import importlib
-from rag_agent import RAGAgent
+from rag_agent import RAGAgent, create_llm_cache
 from process_data import main as build_kb_main
+from build_jobs import BuildJobManager
+from session_store import SessionStore
+from answer_cache import SemanticAnswerCache
+from reranker import CrossEncoderReranker
 import config
 
 app = FastAPI()
@@ -24,15 +29,87 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 允许前端读取 /chat 返回的各阶段耗时
+    expose_headers=[
+        "Server-Timing",
+        "X-Speculative-Retrieval",
+        "X-Answer-Cache",
+        "X-Context-Tokens",
+    ],
 )
 
 # 全局 RAG Agent 实例
 rag_agent = None
 
+# 后台知识库构建任务
+build_jobs = BuildJobManager()
+
+# 各对话的上下文窗口和各类缓存，重新初始化 Agent 时保留
+sessions = SessionStore()
+answer_cache = SemanticAnswerCache() if config.ANSWER_CACHE_MAX_ENTRIES > 0 else None
+llm_cache = (
+    create_llm_cache(config.VECTOR_DB_PATH) if config.LLM_CACHE_MAX_ENTRIES > 0 else None
+)
+# 重排模型只加载一次，重新初始化 Agent 时复用
+reranker = CrossEncoderReranker() if config.RERANK_MODEL else None
+
+
+def _create_agent() -> RAGAgent:
+    return RAGAgent(
+        model=config.MODEL_NAME,
+        fast_model=config.FAST_MODEL_NAME,
+        sessions=sessions,
+        answer_cache=answer_cache,
+        llm_cache=llm_cache,
+        reranker=reranker,
+    )
+
+
+def _replace_agent() -> None:
+    """创建新的 Agent 替换全局实例，旧的 Agent 在正在使用它的请求结束后关闭"""
+    global rag_agent
+    old, rag_agent = rag_agent, _create_agent()
+    if old:
+        old.close()
+
+
+def _acquire_agent() -> Optional[RAGAgent]:
+    """取得当前的全局 Agent 并登记使用；恰好被替换时改用新的 Agent"""
+    while True:
+        agent = rag_agent
+        if agent is None or agent.acquire():
+            return agent
+
+
+class AgentStreamingResponse(StreamingResponse):
+    """使用 Agent 的流式响应，响应结束后释放 Agent
+
+    在 __call__ 结束时释放，而不是在响应体生成器的 finally 中：客户端在开始读取响应体之前
+    断开、或响应头发送失败时生成器不会启动，也不会执行后台任务，但 __call__ 总会返回或抛出
+    """
+
+    def __init__(self, content, agent: RAGAgent, **kwargs):
+        super().__init__(content, **kwargs)
+        self._agent: Optional[RAGAgent] = agent
+
+    def release(self) -> None:
+        """释放 Agent，多次调用只生效一次"""
+        agent, self._agent = self._agent, None
+        if agent is not None:
+            agent.release()
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
 
 class ChatRequest(BaseModel):
     query: str
     history: Optional[List[Dict[str, str]]] = []
+    # 客户端生成的会话ID，同一个对话的多轮请求使用相同的ID
+    session_id: Optional[str] = None
 
 
 class ChatResponse(BaseModel):
@@ -45,25 +122,73 @@ async def startup_event():
     # 只有当向量库存在时才初始化 Agent，否则等待构建
     if os.path.exists(config.VECTOR_DB_PATH):
         try:
-            rag_agent = RAGAgent(model=config.MODEL_NAME)
+            rag_agent = _create_agent()
             print("RAG Agent initialized successfully.")
         except Exception as e:
             print(f"Failed to initialize RAG Agent: {e}")
+    # 在后台预先加载重排模型，避免第一个请求等待模型加载
+    if reranker:
+        asyncio.get_running_loop().run_in_executor(None, reranker.load)
+
+
+def _run_build(progress) -> Dict[str, Any]:
+    """在后台线程中增量构建知识库，完成后切换到新的 Agent"""
+    stats = build_kb_main(progress=progress) or {}
+
+    # 新的collection已经切换为对外检索的collection，重新初始化 Agent 后替换全局实例，
+    # 替换之前的请求继续使用旧的 Agent 和旧的collection
+    _replace_agent()
+
+    message = "知识库构建成功！"
+    if stats:
+        message += (
+            f"新增 {stats['added']} 个文件，更新 {stats['updated']} 个，"
+            f"跳过 {stats['skipped']} 个，删除 {stats['deleted']} 个。"
+        )
+        if stats.get("failed"):
+            message += f"{stats['failed']} 个文件处理失败，下次构建时会重试。"
+    return {"message": message, **stats}
 
 
 @app.post("/build-kb")
 async def build_knowledge_base():
-    try:
-        # 调用 process_data.py 中的 main 函数来构建知识库
-        build_kb_main()
+    """在后台启动知识库构建，立即返回任务ID；已有构建在运行时返回该任务"""
+    job, created = build_jobs.submit(_run_build)
+    message = "知识库构建已开始" if created else "已有知识库构建任务正在运行"
+    return {"job_id": job.id, "status": job.status, "message": message}
 
-        # 构建完成后重新初始化 Agent
-        global rag_agent
-        rag_agent = RAGAgent(model=config.MODEL_NAME)
 
-        return {"message": "知识库构建成功！"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"构建知识库失败: {str(e)}")
+def _get_build_job(job_id: str):
+    job = build_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="构建任务不存在")
+    return job
+
+
+@app.get("/build-kb/{job_id}")
+async def get_build_status(job_id: str):
+    """查询构建任务的状态和进度"""
+    return _get_build_job(job_id).to_dict()
+
+
+@app.get("/build-kb/{job_id}/events")
+async def stream_build_status(job_id: str):
+    """以 Server-Sent Events 推送构建进度，任务结束后关闭连接"""
+    job = _get_build_job(job_id)
+
+    async def event_generator():
+        last = None
+        while True:
+            state = job.to_dict()
+            snapshot = {k: v for k, v in state.items() if k != "elapsed_seconds"}
+            if snapshot != last:
+                last = snapshot
+                yield f"data: {json.dumps(state, ensure_ascii=False)}\n\n"
+            if job.finished:
+                break
+            await asyncio.sleep(1)
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
 
 
 @app.post("/chat")
@@ -72,24 +197,58 @@ async def chat(request: ChatRequest):
     if not rag_agent:
         # 尝试重新初始化
         if os.path.exists(config.VECTOR_DB_PATH):
-            rag_agent = RAGAgent(model=config.MODEL_NAME)
+            rag_agent = _create_agent()
         else:
             raise HTTPException(
                 status_code=400, detail="知识库尚未构建，请先点击'构建知识库'按钮。"
             )
 
+    agent = _acquire_agent()
     try:
-        # 使用流式响应
-        return StreamingResponse(
-            rag_agent.answer_question(
-                request.query, chat_history=request.history, stream=True
-            ),
+        # 使用异步流式响应，模型调用和检索都不阻塞事件循环
+        # 意图分析和检索在开始流式输出之前完成，各阶段耗时通过 Server-Timing 头返回
+        prepared = await agent.prepare_answer_async(
+            request.query, chat_history=request.history, session_id=request.session_id
+        )
+        headers = {
+            "Server-Timing": agent.format_timings(prepared["timings"]),
+            "X-Speculative-Retrieval": prepared["speculative"],
+            "X-Answer-Cache": prepared["answer_cache"],
+        }
+        packing = prepared["context_tokens"]
+        if packing:
+            # 打包后上下文的 token 数和相比完整片段节省的 token 数
+            headers["X-Context-Tokens"] = (
+                f"packed={packing['packed_tokens']}, saved={packing['saved_tokens']}"
+            )
+        return AgentStreamingResponse(
+            agent.stream_answer_async(prepared, request.history),
+            agent,
             media_type="text/event-stream",
+            headers=headers,
         )
     except Exception as e:
+        agent.release()
         raise HTTPException(status_code=500, detail=f"生成回答失败: {str(e)}")
 
 
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """各缓存的命中率等统计信息"""
+    return {
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "llm_cache": llm_cache.stats() if llm_cache else None,
+        "retrieval_cache": rag_agent.vector_store.retrieval_cache_stats() if rag_agent else None,
+        "rerank": reranker.stats() if reranker else None,
+        "context": rag_agent.context_packer.stats() if rag_agent else None,
+        "embedding_coalescer": (
+            rag_agent.vector_store.coalescer.stats()
+            if rag_agent and rag_agent.vector_store.coalescer
+            else None
+        ),
+    }
+
+
 class QuizRequest(BaseModel):
     topic: str
     difficulty: str
@@ -103,8 +262,9 @@ async def generate_quiz(request: QuizRequest):
     if not rag_agent:
         raise HTTPException(status_code=503, detail="Agent not initialized")
 
+    agent = _acquire_agent()
     try:
-        quiz_json = rag_agent.generate_quiz(
+        quiz_json = agent.generate_quiz(
             topic=request.topic,
             difficulty=request.difficulty,
             question_type=request.type,
@@ -123,6 +283,8 @@ async def generate_quiz(request: QuizRequest):
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        agent.release()
 
 
 class OutlineRequest(BaseModel):
@@ -135,9 +297,10 @@ async def generate_outline(request: OutlineRequest):
     if not rag_agent:
         raise HTTPException(status_code=503, detail="Agent not initialized")
 
+    agent = _acquire_agent()
     try:
         # 使用流式响应返回 Markdown
-        response = rag_agent.generate_outline(topic=request.topic, stream=True)
+        response = agent.generate_outline(topic=request.topic, stream=True)
 
         def stream_generator():
             try:
@@ -147,8 +310,9 @@ async def generate_outline(request: OutlineRequest):
             except Exception as e:
                 yield f"生成提纲失败: {str(e)}"
 
-        return StreamingResponse(stream_generator(), media_type="text/event-stream")
+        return AgentStreamingResponse(stream_generator(), agent, media_type="text/event-stream")
     except Exception as e:
+        agent.release()
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -240,12 +404,9 @@ async def update_settings(settings: Dict[str, Any]):
         print(f"[Debug] Model update: {old_model} -> {config.MODEL_NAME}")
 
         # 重新初始化 Agent
-        global rag_agent
         if rag_agent:
             # 使用新的配置重新初始化
-            rag_agent = RAGAgent(
-                model=config.MODEL_NAME, fast_model=config.FAST_MODEL_NAME
-            )
+            _replace_agent()
             print(f"[Debug] RAG Agent re-initialized with model: {config.MODEL_NAME}")
 
         return {"message": "配置已更新并生效"}
@@ -0,0 +1,155 @@
+"""向量检索后端基准测试：本地 mmap IVF 索引 vs Chroma
+
+在合成向量（高斯混合分布并归一化，模拟文本 embedding 的聚类结构）上分别构建
+LocalVectorIndex 和 Chroma collection，以精确的暴力检索结果为基准计算 recall@k，
+并统计单条查询的 p50/p99 延迟和 QPS。本地索引在写盘后重新打开，模拟服务启动时通过 mmap 加载。
+
+用法（在项目根目录下运行）:
+    python benchmarks/bench_ann.py
+    python benchmarks/bench_ann.py --sizes 10000 100000 --dim 1536 --nprobe 8 16 32
+    python benchmarks/bench_ann.py --dtype float16 --skip-chroma
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from vector_index import LocalVectorIndex  # noqa: E402
+
+
+def synthetic_vectors(num: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=num)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((num, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def sample_queries(data: np.ndarray, num_queries: int, seed: int) -> np.ndarray:
+    """在随机选取的文档向量上加噪声作为查询"""
+    rng = np.random.default_rng(seed + 1)
+    base = data[rng.choice(len(data), num_queries, replace=False)]
+    queries = base + 0.3 * rng.standard_normal(base.shape).astype(np.float32) / np.sqrt(data.shape[1])
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def exact_top_k(data: np.ndarray, queries: np.ndarray, top_k: int) -> list:
+    norms = np.einsum("ij,ij->i", data, data)
+    truth = []
+    for query in queries:
+        distances = norms - 2 * (data @ query)
+        top = np.argpartition(distances, top_k - 1)[:top_k]
+        truth.append({f"doc_{i}" for i in top})
+    return truth
+
+
+def measure(search, queries: np.ndarray, truth: list, top_k: int):
+    """返回 (recall@k, p50 毫秒, p99 毫秒, QPS)"""
+    for query in queries[:10]:
+        search(query, top_k)
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        ids = search(query, top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len(expected.intersection(ids)) / top_k)
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return float(np.mean(recalls)), p50, p99, len(queries) / (sum(latencies) / 1000)
+
+
+def report(name: str, build_time: float, result) -> None:
+    recall, p50, p99, qps = result
+    print(
+        f"  {name:<22} | 构建 {build_time:6.1f}s | recall@k {recall:.3f} | "
+        f"p50 {p50:8.3f} ms | p99 {p99:8.3f} ms | {qps:9.1f} QPS"
+    )
+
+
+def run_local(tmp: str, data: np.ndarray, queries, truth, args) -> None:
+    index_dir = os.path.join(tmp, "local")
+    ids = [f"doc_{i}" for i in range(len(data))]
+    start = time.perf_counter()
+    index = LocalVectorIndex(index_dir, dtype=args.dtype)
+    index.add(ids, data)
+    index.save()
+    build_time = time.perf_counter() - start
+    del index
+
+    for nprobe in args.nprobe:
+        # 重新打开，模拟服务重启后通过 mmap 加载
+        start = time.perf_counter()
+        index = LocalVectorIndex(index_dir, dtype=args.dtype, nprobe=nprobe)
+        len(index)
+        load_ms = (time.perf_counter() - start) * 1000
+
+        def search(query, top_k, index=index):
+            return [uid for uid, _ in index.search(query, top_k)]
+
+        nlist = len(index._centroids)
+        label = f"local nprobe={nprobe}" if nlist > 1 else "local 精确检索"
+        report(f"{label}", build_time, measure(search, queries, truth, args.top_k))
+        print(f"  {'':<22} | 聚类数 {nlist} | mmap 加载 {load_ms:.1f} ms")
+        if nlist <= 1:
+            break
+
+
+def run_chroma(tmp: str, data: np.ndarray, queries, truth, args) -> None:
+    import chromadb
+    from chromadb.config import Settings
+
+    client = chromadb.PersistentClient(
+        path=os.path.join(tmp, "chroma"), settings=Settings(anonymized_telemetry=False)
+    )
+    collection = client.get_or_create_collection(name="bench_ann")
+    ids = [f"doc_{i}" for i in range(len(data))]
+    start = time.perf_counter()
+    step = client.get_max_batch_size()
+    for offset in range(0, len(data), step):
+        collection.add(ids=ids[offset : offset + step], embeddings=data[offset : offset + step])
+    build_time = time.perf_counter() - start
+
+    def search(query, top_k):
+        results = collection.query(
+            query_embeddings=[query.tolist()], n_results=top_k, include=["distances"]
+        )
+        return results["ids"][0]
+
+    report("chroma (hnsw)", build_time, measure(search, queries, truth, args.top_k))
+
+
+def run(size: int, args) -> None:
+    data = synthetic_vectors(size, args.dim, args.clusters, args.seed)
+    queries = sample_queries(data, args.queries, args.seed)
+    truth = exact_top_k(data, queries, args.top_k)
+    print(f"{size:,} 个向量, 维度 {args.dim}, {args.queries} 条查询, top_k={args.top_k}")
+    with tempfile.TemporaryDirectory() as tmp:
+        run_local(tmp, data, queries, truth, args)
+        if not args.skip_chroma:
+            run_chroma(tmp, data, queries, truth, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量检索后端基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=200, help="合成数据的高斯分量数")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    parser.add_argument("--skip-chroma", action="store_true", help="只测试本地索引")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""BM25 检索延迟基准测试
+
+在合成语料（词频服从 Zipf 分布）上构建 BM25Index，统计 bm25 检索的 p50/p99 延迟。
+查询词同样按 Zipf 分布采样，但跳过最高频的若干个词，模拟停用词过滤后的查询。
+
+用法（在项目根目录下运行）:
+    python benchmarks/bench_bm25.py
+    python benchmarks/bench_bm25.py --sizes 10000 100000 --queries 500
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from array import array
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bm25_index import BM25Index  # noqa: E402
+
+
+def build_synthetic_index(
+    index_dir: str, num_docs: int, doc_len: int, vocab_size: int, seed: int
+) -> BM25Index:
+    """直接生成 CSR 倒排表并写盘，避免逐文档调用 add() 构建百万级语料"""
+    rng = np.random.default_rng(seed)
+    terms_parts, docs_parts, tfs_parts = [], [], []
+    doc_lens = np.zeros(num_docs, dtype=np.int32)
+
+    block = 100_000
+    for start in range(0, num_docs, block):
+        end = min(start + block, num_docs)
+        n = end - start
+        terms = (rng.zipf(1.3, size=n * doc_len) - 1) % vocab_size
+        docs = np.repeat(np.arange(start, end, dtype=np.int64), doc_len)
+        keys, tfs = np.unique(docs * vocab_size + terms, return_counts=True)
+        terms_parts.append((keys % vocab_size).astype(np.int32))
+        docs_parts.append((keys // vocab_size).astype(np.int32))
+        tfs_parts.append(tfs.astype(np.int32))
+        doc_lens[start:end] = doc_len
+
+    terms = np.concatenate(terms_parts)
+    docs = np.concatenate(docs_parts)
+    tfs = np.concatenate(tfs_parts)
+    del terms_parts, docs_parts, tfs_parts
+
+    order = np.argsort(terms, kind="stable")
+    terms, docs, tfs = terms[order], docs[order], tfs[order]
+    del order
+    counts = np.bincount(terms, minlength=vocab_size)
+    offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    # 填充索引的内部状态后调用 save()，写出与正常构建相同的磁盘格式
+    index = BM25Index(index_dir)
+    index._loaded = True
+    index._ids = [f"doc_{i}" for i in range(num_docs)]
+    index._slots = {uid: slot for slot, uid in enumerate(index._ids)}
+    index._alive = bytearray(b"\x01" * num_docs)
+    index._doc_lens = array("i", doc_lens.tolist())
+    index._num_docs = num_docs
+    index._total_len = int(doc_lens.sum())
+    index._vocab = {f"t{i}": i for i in range(vocab_size)}
+    index._offsets = offsets
+    index._post_docs = docs
+    index._post_tfs = tfs
+    index.save()
+
+    # 重新打开，模拟服务重启后通过 mmap 加载
+    return BM25Index(index_dir)
+
+
+def sample_queries(num_queries: int, vocab_size: int, stopwords: int, seed: int):
+    rng = np.random.default_rng(seed + 1)
+    queries = []
+    for _ in range(num_queries):
+        length = int(rng.integers(2, 6))
+        terms = (rng.zipf(1.3, size=length) - 1 + stopwords) % vocab_size
+        queries.append([f"t{t}" for t in terms])
+    return queries
+
+
+def run(size: int, args) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        index = build_synthetic_index(
+            tmp, size, args.doc_len, args.vocab_size, args.seed
+        )
+        len(index)  # 触发加载
+        build_time = time.perf_counter() - start
+
+        queries = sample_queries(
+            args.queries, args.vocab_size, args.stopwords, args.seed
+        )
+        for query in queries[:10]:
+            index.search(query, args.top_k)
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query, args.top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        p50, p99 = np.percentile(latencies, [50, 99])
+        print(
+            f"{size:>9,} 文档 | 构建+加载 {build_time:6.1f}s | "
+            f"p50 {p50:7.3f} ms | p99 {p99:7.3f} ms | {len(queries) / (sum(latencies) / 1000):8.1f} QPS"
+        )
+        del index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 检索延迟基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--doc-len", type=int, default=40, help="每个文档的词数")
+    parser.add_argument("--vocab-size", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument(
+        "--stopwords", type=int, default=100, help="查询时跳过的最高频词数量"
+    )
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args)
+
+
+if __name__ == "__main__":
+    main()
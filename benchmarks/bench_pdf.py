@@ -0,0 +1,117 @@
+"""PDF 解析吞吐量基准测试
+
+对比旧的两遍解析（PyPDF2 提取文本 + fitz 重新打开提取图片）与单遍 fitz 解析
+（DocumentLoader.parse_pdf）的页/秒，不包含 OCR。
+不指定 PDF 时生成若干份带文字和图片（含每页重复的模板背景图）的合成课件。
+
+用法（在项目根目录下运行）:
+    python benchmarks/bench_pdf.py
+    python benchmarks/bench_pdf.py data/*.pdf --repeat 5
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import fitz
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from document_loader import DocumentLoader  # noqa: E402
+
+try:
+    from PyPDF2 import PdfReader
+except ImportError:  # PyPDF2 已不是项目依赖，未安装时只测试单遍解析
+    PdfReader = None
+
+
+def _png(width: int, height: int, label: str) -> bytes:
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for i in range(0, height - 20, 24):
+        draw.text((10, 10 + i), f"{label} figure line {i // 24}", fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def make_lecture_pdfs(output_dir: str, num_files: int, pages: int) -> list:
+    """生成合成课件：每页一段文字、一张独立插图和一张重复的模板背景图"""
+    background = _png(640, 520, "template")
+    paths = []
+    for k in range(num_files):
+        doc = fitz.open()
+        for p in range(pages):
+            page = doc.new_page()
+            text = f"Lecture {k} page {p}. " + "Word vectors are distributed representations. " * 20
+            page.insert_textbox(fitz.Rect(50, 50, 550, 300), text, fontsize=10)
+            page.insert_image(page.rect, stream=background, overlay=False)
+            page.insert_image(fitz.Rect(50, 320, 450, 620), stream=_png(600, 560, f"l{k}p{p}"))
+        path = os.path.join(output_dir, f"lecture{k}.pdf")
+        doc.save(path)
+        paths.append(path)
+    return paths
+
+
+def legacy_parse(loader: DocumentLoader, file_path: str):
+    """旧实现：PyPDF2 提取文本，再用 fitz 重新打开 PDF 逐页提取图片"""
+    pages = [
+        {"text": f"--- 第 {i + 1} 页 ---\n{page.extract_text() or ''}\n"}
+        for i, page in enumerate(PdfReader(file_path).pages)
+    ]
+    images = []
+    doc = fitz.open(file_path)
+    for page in doc:
+        for img in page.get_images(full=True):
+            base_image = doc.extract_image(img[0])
+            if loader._is_small_bitmap(base_image.get("width"), base_image.get("height")):
+                continue
+            images.append(base_image["image"])
+    doc.close()
+    return pages, images
+
+
+def single_pass_parse(loader: DocumentLoader, file_path: str):
+    return loader.parse_pdf(file_path)
+
+
+def measure(name: str, parse, loader: DocumentLoader, paths: list, repeat: int) -> None:
+    total_pages = total_images = 0
+    elapsed = 0.0
+    for _ in range(repeat):
+        for path in paths:
+            start = time.perf_counter()
+            pages, images = parse(loader, path)
+            elapsed += time.perf_counter() - start
+            total_pages += len(pages)
+            total_images += len(images)
+    print(
+        f"{name:<22} | {total_pages // repeat:>6} 页 | {total_images // repeat:>6} 张图片 | "
+        f"{elapsed / repeat:7.2f}s | {total_pages / elapsed:8.1f} 页/秒"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF 解析吞吐量基准测试")
+    parser.add_argument("pdfs", nargs="*", help="要测试的 PDF，默认生成合成课件")
+    parser.add_argument("--files", type=int, default=3, help="合成课件数量")
+    parser.add_argument("--pages", type=int, default=200, help="每份合成课件的页数")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    loader = DocumentLoader(workers=1, ocr_cache_path=None, persist_images=False)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = args.pdfs or make_lecture_pdfs(tmp, args.files, args.pages)
+        if PdfReader is None:
+            print("未安装 PyPDF2，跳过旧实现")
+        else:
+            measure("PyPDF2 + fitz (两遍)", legacy_parse, loader, paths, args.repeat)
+        measure("fitz 单遍", single_pass_parse, loader, paths, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""文本切分吞吐量基准测试
+
+先在随机生成的中英文混合文本（含各种句子结束符、长段无标点文本、空文本等边界情况）和
+多组 chunk_size/chunk_overlap 上校验 TextSplitter 的输出与原来的逐字符回扫算法完全一致
+（参考实现和测试数据与 tests/test_text_splitter.py 共用），
+再在合成的大文档上分别统计两种算法的吞吐量（MB/s，按 UTF-8 字节数计算）。
+
+用法（在项目根目录下运行）:
+    python benchmarks/bench_text_splitter.py
+    python benchmarks/bench_text_splitter.py --size-mb 20 --chunk-size 1000 --chunk-overlap 200
+    python benchmarks/bench_text_splitter.py --cases 2000 --skip-legacy
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from text_splitter import TextSplitter  # noqa: E402
+from tests.test_text_splitter import (  # noqa: E402
+    EDGE_TEXTS,
+    PARAMS,
+    legacy_split_text,
+    random_texts,
+    synthetic_text,
+)
+
+
+def check_equivalence(cases: int, seed: int) -> None:
+    texts = EDGE_TEXTS + random_texts(cases, seed)
+    checked = 0
+    for i, text in enumerate(texts):
+        for chunk_size, chunk_overlap in PARAMS:
+            expected = legacy_split_text(text, chunk_size, chunk_overlap)
+            actual = TextSplitter(chunk_size, chunk_overlap).split_text(text)
+            assert actual == expected, (
+                f"切分结果不一致: 文本 #{i}（{len(text)} 字符）, "
+                f"chunk_size={chunk_size}, chunk_overlap={chunk_overlap}"
+            )
+            checked += 1
+    print(f"一致性校验通过: {len(texts)} 段文本 × {len(PARAMS)} 组参数 = {checked} 个用例")
+
+
+def throughput(split, text: str, repeat: int):
+    """返回 (块数, 最好一次的耗时秒数, MB/s)"""
+    size_mb = len(text.encode("utf-8")) / 1024 / 1024
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        num_chunks = sum(1 for _ in split(text))
+        best = min(best, time.perf_counter() - start)
+    return num_chunks, best, size_mb / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文本切分吞吐量基准测试")
+    parser.add_argument("--size-mb", type=float, default=5, help="合成文档的大致大小（MB）")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cases", type=int, default=300, help="一致性校验的随机文本数")
+    parser.add_argument("--skip-legacy", action="store_true", help="不测试原来的算法的吞吐量")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    check_equivalence(args.cases, args.seed)
+
+    rng = random.Random(args.seed)
+    # 中文字符按 UTF-8 占 3 字节，混合文本平均约 2 字节/字符
+    num_chars = int(args.size_mb * 1024 * 1024 / 2)
+    splitter = TextSplitter(args.chunk_size, args.chunk_overlap)
+    for label, punctuation in [("正常句长", 1.0), ("长句（少标点）", 0.05)]:
+        text = synthetic_text(rng, num_chars, punctuation)
+        size_mb = len(text.encode("utf-8")) / 1024 / 1024
+        print(
+            f"{label}: {len(text):,} 字符 / {size_mb:.1f} MB, "
+            f"chunk_size={args.chunk_size}, chunk_overlap={args.chunk_overlap}"
+        )
+        runs = [("bisect", splitter.iter_text)]
+        if not args.skip_legacy:
+            runs.append(
+                ("legacy", lambda t: legacy_split_text(t, args.chunk_size, args.chunk_overlap))
+            )
+        for name, split in runs:
+            num_chunks, seconds, mb_per_s = throughput(split, text, args.repeat)
+            print(f"  {name:<8} | {num_chunks:,} 块 | {seconds * 1000:9.1f} ms | {mb_per_s:8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
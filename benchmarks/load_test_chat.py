@@ -0,0 +1,114 @@
+"""/chat 并发压测
+
+以固定并发向 /chat 发送流式请求，统计首字节延迟（TTFB）、完整响应耗时和吞吐量；
+同时以固定间隔探测一个轻量接口（默认 GET /files），
+探测延迟反映事件循环是否被 /chat 的同步调用阻塞。
+
+建议配合 benchmarks/mock_openai_server.py 使用，模型延迟稳定且不消耗 API 额度:
+    python benchmarks/mock_openai_server.py --port 9000 --latency 0.5
+    python api.py          # config.json 中 OPENAI_API_BASE 指向 http://127.0.0.1:9000/v1
+    python benchmarks/load_test_chat.py --concurrency 32 --requests 128
+"""
+
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+
+def _percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def _summary(name: str, values: list) -> str:
+    if not values:
+        return f"{name:<10} | 无数据"
+    return (
+        f"{name:<10} | p50 {_percentile(values, 50) * 1000:8.1f}ms | "
+        f"p95 {_percentile(values, 95) * 1000:8.1f}ms | "
+        f"p99 {_percentile(values, 99) * 1000:8.1f}ms | "
+        f"max {max(values) * 1000:8.1f}ms | mean {statistics.mean(values) * 1000:8.1f}ms"
+    )
+
+
+async def _chat_once(client: httpx.AsyncClient, url: str, query: str, ttfb: list, total: list) -> bool:
+    start = time.perf_counter()
+    first = None
+    try:
+        async with client.stream("POST", url, json={"query": query, "history": []}) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return False
+            async for chunk in response.aiter_bytes():
+                if chunk and first is None:
+                    first = time.perf_counter() - start
+    except httpx.HTTPError as e:
+        print(f"请求失败: {e}")
+        return False
+    ttfb.append(first if first is not None else time.perf_counter() - start)
+    total.append(time.perf_counter() - start)
+    return True
+
+
+async def _probe(client: httpx.AsyncClient, url: str, interval: float, stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            await client.get(url)
+            latencies.append(time.perf_counter() - start)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(interval)
+
+
+async def run(args) -> None:
+    base = args.url.rstrip("/")
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        ttfb, total, probe = [], [], []
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(
+            _probe(client, base + args.probe_path, args.probe_interval, stop, probe)
+        )
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def worker(i: int) -> bool:
+            async with semaphore:
+                return await _chat_once(client, base + "/chat", f"{args.query} #{i}", ttfb, total)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(worker(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await probe_task
+
+    ok = sum(results)
+    print(f"并发 {args.concurrency}，请求 {args.requests}，成功 {ok}，耗时 {elapsed:.2f}s，"
+          f"吞吐 {ok / elapsed:.1f} 请求/秒")
+    print(_summary("TTFB", ttfb))
+    print(_summary("完整响应", total))
+    print(_summary("探测接口", probe))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/chat 并发压测")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="API 服务地址")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--query", default="什么是词向量？")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--probe-path", default="/files", help="探测事件循环响应性的接口")
+    parser.add_argument("--probe-interval", type=float, default=0.1)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""本地模拟的 OpenAI 兼容接口，用于压测 /chat 而不消耗真实的 API 额度
+
+支持 /v1/chat/completions（含流式输出和 JSON 模式）和 /v1/embeddings，
+通过参数模拟首 token 延迟、逐 token 输出间隔和 embedding 延迟。
+embedding 按文本哈希生成确定性的向量，同一段文本每次得到相同的向量。
+
+用法（在项目根目录下运行）:
+    python benchmarks/mock_openai_server.py --port 9000 --latency 0.5 --tokens 50
+然后在 config.json 中把 OPENAI_API_BASE 设为 http://127.0.0.1:9000/v1
+（知识库也需要用该接口构建，保证向量维度一致）
+"""
+
+import re
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import argparse
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI()
+
+SETTINGS = {
+    "latency": 0.5,
+    "token_interval": 0.02,
+    "tokens": 50,
+    "embed_latency": 0.05,
+    "dim": 256,
+}
+
+
+def _embedding(text: str) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(SETTINGS["dim"])
+    return (vector / np.linalg.norm(vector)).round(6).tolist()
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    data = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "mock")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    await asyncio.sleep(SETTINGS["latency"])
+
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        # 意图分析：视为新话题，重写后的查询沿用提示词中的用户问题
+        prompt = body["messages"][-1]["content"]
+        match = re.search(r"用户最新问题：\s*(.+)", prompt)
+        query = match.group(1).strip() if match else "mock query"
+        content = json.dumps({"intent": "NEW_TOPIC", "rewritten_query": query}, ensure_ascii=False)
+        words = [content]
+    else:
+        words = [f"token{i} " for i in range(SETTINGS["tokens"])]
+        content = "".join(words)
+
+    if not body.get("stream"):
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(words), "total_tokens": len(words)},
+        }
+
+    async def stream():
+        yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+        for word in words:
+            yield _chunk(completion_id, model, {"content": word})
+            await asyncio.sleep(SETTINGS["token_interval"])
+        yield _chunk(completion_id, model, {}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    texts = body.get("input", [])
+    if isinstance(texts, str):
+        texts = [texts]
+    await asyncio.sleep(SETTINGS["embed_latency"])
+    return {
+        "object": "list",
+        "model": body.get("model", "mock"),
+        "data": [
+            {"object": "embedding", "index": i, "embedding": _embedding(text)}
+            for i, text in enumerate(texts)
+        ],
+        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟的 OpenAI 兼容接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.5, help="首 token 延迟（秒）")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="流式输出每个 token 的间隔（秒）")
+    parser.add_argument("--tokens", type=int, default=50, help="每个回答的 token 数")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="embeddings 请求延迟（秒）")
+    parser.add_argument("--dim", type=int, default=256, help="向量维度")
+    args = parser.parse_args()
+
+    SETTINGS.update(
+        latency=args.latency,
+        token_interval=args.token_interval,
+        tokens=args.tokens,
+        embed_latency=args.embed_latency,
+        dim=args.dim,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+import os
+import json
+import math
+import shutil
+from array import array
+from collections import Counter
+from typing import List, Dict, Optional, Set, Tuple
+
+import numpy as np
+
+
+class BM25Index:
+    """可持久化、可增量更新的 BM25 倒排索引
+
+    磁盘上每一代索引是 index_dir 下的一个 gen-XXXXXX 目录，CURRENT 文件
+    指向当前代。每一代包含：
+    - meta.json: 文档ID（按槽位顺序）、词表和参数
+    - doc_lens.npy: 每个文档的词数
+    - offsets.npy / docs.npy / tfs.npy: 按词表顺序拼接的倒排表（CSR 格式）
+
+    - seg-XXXXXX.json: 该代之后的增删操作日志，按编号顺序重放
+
+    加载时倒排表通过 mmap 映射，不复制到内存。新增的文档先写入内存中的增量
+    倒排表，删除的文档只标记为失效。save() 只在有改动时写盘：通常只把上次
+    保存以来的增删追加为一个小的日志段；日志累计的操作数超过基础段文档数的
+    COMPACT_RATIO（且不少于 COMPACT_MIN_OPS）时，才合并压缩成新的一代。
+    已写出的文件不再修改。
+    IDF 使用 log(1 + (N - df + 0.5) / (df + 0.5))，保证恒为正。
+    索引记录构建时使用的分词方式，与当前分词方式不一致时视为空索引，需要重建。
+    """
+
+    FORMAT_VERSION = 1
+    # 日志段累计的操作数超过 max(COMPACT_MIN_OPS, 基础段文档数 * COMPACT_RATIO) 时合并
+    COMPACT_MIN_OPS = 1000
+    COMPACT_RATIO = 0.2
+
+    def __init__(
+        self,
+        index_dir: str,
+        tokenizer: str = "whitespace",
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.index_dir = index_dir
+        self.tokenizer = tokenizer
+        self.k1 = k1
+        self.b = b
+        self.dirty = False
+        self._loaded = False
+        self._reset()
+
+    def _reset(self) -> None:
+        # 槽位 -> 文档ID，已删除的槽位为 None
+        self._ids: List[Optional[str]] = []
+        self._slots: Dict[str, int] = {}
+        self._alive = bytearray()
+        self._doc_lens = array("i")
+        self._num_docs = 0
+        self._total_len = 0
+        # 基础段：从磁盘 mmap 加载的只读倒排表
+        self._vocab: Dict[str, int] = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._post_docs = np.zeros(0, dtype=np.int32)
+        self._post_tfs = np.zeros(0, dtype=np.int32)
+        # 增量段：term -> (槽位列表, 词频列表)
+        self._delta: Dict[str, Tuple[array, array]] = {}
+        # 检索时使用的 numpy 数组缓存（文档长度、有效标记），增删后失效
+        self._array_cache: Optional[Tuple[np.ndarray, Optional[np.ndarray]]] = None
+        # 基础段的文档数、当前代已写入日志段的操作数、下一个日志段编号
+        self._base_docs = 0
+        self._logged_ops = 0
+        self._next_segment = 0
+        # 上次保存以来尚未写盘的操作：["add", ID, 词数, {词: 词频}] 或 ["remove", ID]
+        self._pending: List[list] = []
+        # 为 True 时下次 save() 必须合并成新的一代（清空索引或没有可追加的代时）
+        self._needs_compact = True
+
+    # ---------- 加载与持久化 ----------
+
+    def _current_generation(self) -> Optional[str]:
+        pointer = os.path.join(self.index_dir, "CURRENT")
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        path = os.path.join(self.index_dir, name)
+        return path if os.path.isdir(path) else None
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        gen_dir = self._current_generation()
+        if not gen_dir:
+            return
+        try:
+            with open(os.path.join(gen_dir, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != self.FORMAT_VERSION:
+                print("BM25索引格式版本不匹配，将重新构建")
+                return
+            if meta.get("tokenizer") != self.tokenizer:
+                print(
+                    f"BM25索引的分词方式 ({meta.get('tokenizer')}) 与当前配置 "
+                    f"({self.tokenizer}) 不一致，将重新构建"
+                )
+                return
+            self._ids = meta["ids"]
+            self._slots = {uid: slot for slot, uid in enumerate(self._ids)}
+            self._alive = bytearray(b"\x01" * len(self._ids))
+            self._doc_lens = array("i", np.load(os.path.join(gen_dir, "doc_lens.npy")).tolist())
+            self._num_docs = len(self._ids)
+            self._total_len = int(sum(self._doc_lens))
+            self._vocab = {term: row for row, term in enumerate(meta["vocab"])}
+            self._offsets = np.load(os.path.join(gen_dir, "offsets.npy"), mmap_mode="r")
+            self._post_docs = np.load(os.path.join(gen_dir, "docs.npy"), mmap_mode="r")
+            self._post_tfs = np.load(os.path.join(gen_dir, "tfs.npy"), mmap_mode="r")
+            self._base_docs = self._num_docs
+            self._replay_segments(gen_dir)
+            self._needs_compact = False
+        except Exception as e:
+            print(f"加载BM25索引失败，将重新构建: {e}")
+            self._reset()
+
+    @staticmethod
+    def _segment_names(gen_dir: str) -> List[str]:
+        return sorted(
+            name for name in os.listdir(gen_dir)
+            if name.startswith("seg-") and name.endswith(".json")
+        )
+
+    def _replay_segments(self, gen_dir: str) -> None:
+        """按顺序重放该代之后写入的日志段"""
+        for name in self._segment_names(gen_dir):
+            with open(os.path.join(gen_dir, name), "r", encoding="utf-8") as f:
+                ops = json.load(f)["ops"]
+            for op in ops:
+                if op[0] == "add":
+                    self._add_doc(op[1], op[2], op[3])
+                else:
+                    self._remove_doc(op[1])
+            self._logged_ops += len(ops)
+            self._next_segment = int(name[4:10]) + 1
+
+    def _merged_postings(self) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+        """合并基础段和增量段，去掉失效文档，返回压缩后的 (词表, 行号, 槽位, 词频)"""
+        vocab = list(self._vocab)
+        rows = [np.repeat(np.arange(len(vocab), dtype=np.int64), np.diff(self._offsets))]
+        docs = [np.asarray(self._post_docs, dtype=np.int64)]
+        tfs = [np.asarray(self._post_tfs, dtype=np.int32)]
+
+        vocab_rows = dict(self._vocab)
+        for term, (slots, freqs) in self._delta.items():
+            row = vocab_rows.get(term)
+            if row is None:
+                row = vocab_rows[term] = len(vocab)
+                vocab.append(term)
+            rows.append(np.full(len(slots), row, dtype=np.int64))
+            docs.append(np.array(slots, dtype=np.int64))
+            tfs.append(np.array(freqs, dtype=np.int32))
+
+        rows = np.concatenate(rows)
+        docs = np.concatenate(docs)
+        tfs = np.concatenate(tfs)
+
+        alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+        keep = alive[docs] if len(docs) else np.zeros(0, dtype=bool)
+        rows, docs, tfs = rows[keep], docs[keep], tfs[keep]
+
+        # 槽位重新编号，去掉已删除文档留下的空洞
+        new_slot = np.cumsum(alive) - 1
+        docs = new_slot[docs] if len(docs) else docs
+
+        # 去掉已没有倒排记录的词，并按词表顺序排序
+        counts = np.bincount(rows, minlength=len(vocab))
+        used = counts > 0
+        new_row = np.cumsum(used) - 1
+        rows = new_row[rows] if len(rows) else rows
+        vocab = [term for term, flag in zip(vocab, used) if flag]
+        order = np.argsort(rows, kind="stable")
+        return vocab, rows[order], docs[order].astype(np.int32), tfs[order]
+
+    def save(self, compact: bool = False) -> None:
+        """把上次保存以来的改动写盘，没有改动时什么也不做
+
+        改动通常追加为当前代的一个日志段；compact=True、日志过长或当前没有可追加的代时，
+        合并增量并写出新的一代索引
+        """
+        self._ensure_loaded()
+        if not self.dirty and not compact:
+            return
+        gen_dir = None if self._needs_compact else self._current_generation()
+        threshold = max(self.COMPACT_MIN_OPS, self._base_docs * self.COMPACT_RATIO)
+        if compact or gen_dir is None or self._logged_ops + len(self._pending) > threshold:
+            self._compact()
+            return
+
+        seg_name = f"seg-{self._next_segment:06d}.json"
+        seg_tmp = os.path.join(gen_dir, seg_name + ".tmp")
+        with open(seg_tmp, "w", encoding="utf-8") as f:
+            json.dump({"ops": self._pending}, f, ensure_ascii=False)
+        os.replace(seg_tmp, os.path.join(gen_dir, seg_name))
+        self._next_segment += 1
+        self._logged_ops += len(self._pending)
+        self._pending = []
+        self.dirty = False
+
+    def _compact(self) -> None:
+        """合并增量并写出新的一代索引，然后切换 CURRENT 指针"""
+        vocab, rows, docs, tfs = self._merged_postings()
+        ids = [uid for uid in self._ids if uid is not None]
+        alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+        doc_lens = np.array(self._doc_lens, dtype=np.int32)[alive]
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        if len(vocab):
+            np.cumsum(np.bincount(rows, minlength=len(vocab)), out=offsets[1:])
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        current = self._current_generation()
+        generation = 0
+        if current:
+            generation = int(os.path.basename(current).split("-")[1]) + 1
+        gen_name = f"gen-{generation:06d}"
+        gen_dir = os.path.join(self.index_dir, gen_name)
+        # 中断的合并可能留下同名目录，其中的文件可能与其他代的索引目录硬链接共用，先删除再写入
+        shutil.rmtree(gen_dir, ignore_errors=True)
+        os.makedirs(gen_dir)
+
+        np.save(os.path.join(gen_dir, "doc_lens.npy"), doc_lens)
+        np.save(os.path.join(gen_dir, "offsets.npy"), offsets)
+        np.save(os.path.join(gen_dir, "docs.npy"), docs)
+        np.save(os.path.join(gen_dir, "tfs.npy"), tfs)
+        with open(os.path.join(gen_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": self.FORMAT_VERSION,
+                    "tokenizer": self.tokenizer,
+                    "k1": self.k1,
+                    "b": self.b,
+                    "ids": ids,
+                    "vocab": vocab,
+                },
+                f,
+                ensure_ascii=False,
+            )
+
+        pointer_tmp = os.path.join(self.index_dir, "CURRENT.tmp")
+        with open(pointer_tmp, "w", encoding="utf-8") as f:
+            f.write(gen_name)
+        os.replace(pointer_tmp, os.path.join(self.index_dir, "CURRENT"))
+
+        # 释放旧的 mmap 后从新的一代重新加载
+        self._reset()
+        self._loaded = False
+        self._ensure_loaded()
+        self.dirty = False
+
+        # 清理旧的代（其他进程可能仍在使用，失败时忽略）
+        for name in os.listdir(self.index_dir):
+            if name.startswith("gen-") and name != gen_name:
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+
+    # ---------- 增量更新 ----------
+
+    def _add_doc(self, uid: str, doc_len: int, counts: Dict[str, int]) -> None:
+        slot = len(self._ids)
+        self._ids.append(uid)
+        self._slots[uid] = slot
+        self._alive.append(1)
+        self._doc_lens.append(doc_len)
+        self._array_cache = None
+        self._num_docs += 1
+        self._total_len += doc_len
+        for term, tf in counts.items():
+            postings = self._delta.get(term)
+            if postings is None:
+                postings = self._delta[term] = (array("i"), array("i"))
+            postings[0].append(slot)
+            postings[1].append(tf)
+
+    def _remove_doc(self, uid: str) -> bool:
+        slot = self._slots.pop(uid, None)
+        if slot is None:
+            return False
+        self._ids[slot] = None
+        self._alive[slot] = 0
+        self._array_cache = None
+        self._num_docs -= 1
+        self._total_len -= self._doc_lens[slot]
+        return True
+
+    def add(self, ids: List[str], token_lists: List[List[str]]) -> None:
+        """添加文档，已存在的ID会先被删除再重新添加"""
+        self._ensure_loaded()
+        for uid, tokens in zip(ids, token_lists):
+            if self._remove_doc(uid):
+                self._pending.append(["remove", uid])
+            counts = dict(Counter(tokens))
+            self._add_doc(uid, len(tokens), counts)
+            self._pending.append(["add", uid, len(tokens), counts])
+        if ids:
+            self.dirty = True
+
+    def remove(self, ids: List[str]) -> None:
+        """删除文档：只标记失效，合并成新的一代时再从倒排表中清除"""
+        self._ensure_loaded()
+        for uid in ids:
+            if self._remove_doc(uid):
+                self._pending.append(["remove", uid])
+                self.dirty = True
+
+    def clear(self) -> None:
+        self._ensure_loaded()
+        self._reset()
+        self.dirty = True
+
+    def exists(self) -> bool:
+        """磁盘上是否已有保存过的索引"""
+        return self._current_generation() is not None
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return self._num_docs
+
+    def ids(self) -> Set[str]:
+        """索引中所有有效文档的ID"""
+        self._ensure_loaded()
+        return set(self._slots)
+
+    # ---------- 检索 ----------
+
+    def _arrays(self) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """返回 (文档长度归一化项, 有效标记数组)，没有删除时有效标记为 None"""
+        if self._array_cache is None:
+            # 预先算好每个文档的长度归一化项 k1 * (1 - b + b * dl / avgdl)
+            avgdl = self._total_len / self._num_docs if self._num_docs else 1.0
+            doc_lens = np.array(self._doc_lens, dtype=np.float32)
+            doc_norms = self.k1 * (1 - self.b + self.b * doc_lens / (avgdl or 1.0))
+            alive = None
+            if self._num_docs != len(self._ids):
+                alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+            self._array_cache = (doc_norms.astype(np.float32), alive)
+        return self._array_cache
+
+    def _postings(self, term: str, alive: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """返回某个词的有效倒排记录 (槽位, 词频)"""
+        parts_docs, parts_tfs = [], []
+        row = self._vocab.get(term)
+        if row is not None:
+            start, end = self._offsets[row], self._offsets[row + 1]
+            parts_docs.append(self._post_docs[start:end])
+            parts_tfs.append(self._post_tfs[start:end])
+        delta = self._delta.get(term)
+        if delta is not None:
+            parts_docs.append(np.array(delta[0], dtype=np.int32))
+            parts_tfs.append(np.array(delta[1], dtype=np.int32))
+        if not parts_docs:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+        if len(parts_docs) == 1:
+            docs, tfs = parts_docs[0], parts_tfs[0]
+        else:
+            docs, tfs = np.concatenate(parts_docs), np.concatenate(parts_tfs)
+        if alive is not None:
+            mask = alive[docs]
+            docs, tfs = docs[mask], tfs[mask]
+        return docs, tfs
+
+    def search(self, query_tokens: List[str], top_k: int) -> List[Tuple[str, float]]:
+        """返回得分最高的 top_k 个 (文档ID, 分数)
+
+        只遍历查询词的倒排表，在 numpy 数组中累加分数，再用 argpartition 选出 top_k，
+        不会对全部文档逐个打分或排序。
+        """
+        self._ensure_loaded()
+        if not self._num_docs or not query_tokens or top_k <= 0:
+            return []
+
+        doc_norms, alive = self._arrays()
+        scores = np.zeros(len(self._ids), dtype=np.float32)
+        touched = []
+        for term in query_tokens:
+            docs, tfs = self._postings(term, alive)
+            df = len(docs)
+            if not df:
+                continue
+            idf = math.log(1.0 + (self._num_docs - df + 0.5) / (df + 0.5))
+            tfs = tfs.astype(np.float32)
+            # 同一个词的倒排表中槽位不重复，可以直接按下标累加
+            scores[docs] += np.float32(idf * (self.k1 + 1)) * tfs / (tfs + doc_norms[docs])
+            touched.append(docs)
+        if not touched:
+            return []
+
+        # 候选集合：倒排记录较少时去重合并，较多时直接扫描分数数组更快
+        total = sum(len(docs) for docs in touched)
+        if len(touched) == 1:
+            candidates = touched[0]
+        elif total * 8 < len(scores):
+            candidates = np.unique(np.concatenate(touched))
+        else:
+            candidates = np.flatnonzero(scores)
+        candidate_scores = scores[candidates]
+        if len(candidates) > top_k:
+            top = np.argpartition(-candidate_scores, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-candidate_scores[top], kind="stable")]
+        return [
+            (self._ids[int(candidates[i])], float(candidate_scores[i])) for i in top
+        ]
@@ -0,0 +1,105 @@
+import time
+import uuid
+import threading
+import traceback
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class BuildJob:
+    """一次后台知识库构建任务的状态
+
+    status: pending / running / succeeded / failed
+    stage 和 progress 由构建过程通过 update() 汇报
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "pending"
+        self.stage: Optional[str] = None
+        self.progress: Dict[str, Any] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def update(self, stage: str, progress: Dict[str, Any]) -> None:
+        with self._lock:
+            if stage != self.stage:
+                self.stage = stage
+                self.progress = {}
+            self.progress.update(progress)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            end = self.finished_at or time.time()
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": dict(self.progress),
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "elapsed_seconds": round(end - self.started_at, 1) if self.started_at else 0.0,
+            }
+
+
+class BuildJobManager:
+    """在后台线程中运行知识库构建，同一时间只运行一个构建任务"""
+
+    def __init__(self, max_history: int = 20):
+        self.max_history = max_history
+        self._jobs: Dict[str, BuildJob] = {}
+        self._running: Optional[BuildJob] = None
+        self._lock = threading.Lock()
+
+    def submit(self, func: Callable[[Callable[[str, Dict], None]], Dict]) -> Tuple[BuildJob, bool]:
+        """提交构建任务，func 接收进度回调并返回构建结果
+
+        已有任务在运行时不会重复构建，直接返回正在运行的任务。返回 (任务, 是否新建)
+        """
+        with self._lock:
+            if self._running and not self._running.finished:
+                return self._running, False
+            job = BuildJob()
+            self._jobs[job.id] = job
+            self._running = job
+            # 只保留最近的若干个任务
+            while len(self._jobs) > self.max_history:
+                oldest = next(iter(self._jobs))
+                if oldest == job.id:
+                    break
+                del self._jobs[oldest]
+
+        thread = threading.Thread(
+            target=self._run, args=(job, func), name=f"build-kb-{job.id[:8]}", daemon=True
+        )
+        thread.start()
+        return job, True
+
+    def _run(self, job: BuildJob, func: Callable) -> None:
+        job.started_at = time.time()
+        job.status = "running"
+        try:
+            result = func(job.update)
+            with job._lock:
+                job.result = result
+                job.finished_at = time.time()
+                job.status = "succeeded"
+        except Exception as e:
+            traceback.print_exc()
+            with job._lock:
+                job.error = str(e)
+                job.finished_at = time.time()
+                job.status = "failed"
+
+    def get(self, job_id: str) -> Optional[BuildJob]:
+        return self._jobs.get(job_id)
@@ -0,0 +1,121 @@
+import os
+import json
+from typing import Optional, Tuple
+
+from config import COLLECTION_NAME
+
+
+class CollectionRegistry:
+    """知识库collection和版本代数的切换指针
+
+    每次构建分配一个新的代数。增量构建直接写入当前的 active collection：新写入的文档块
+    标记为该代新增，删除的文档块只标记为在该代删除（见 VectorStore），服务端按
+    active_generation 过滤，切换前看不到构建中的改动。全量重建、更换embedding模型或
+    迁移旧版本的collection时写入一个新的 staging collection。构建完成后原子地切换
+    active 和 active_generation；切换下来的旧 collection 记为 previous，在下一次构建
+    开始时删除，避免正在进行的检索读到被删除的collection。
+
+    指针保存在 VECTOR_DB_PATH/collections.json；该文件不存在时，
+    active 就是配置中的 COLLECTION_NAME（兼容旧版本的向量库）。
+    """
+
+    FILENAME = "collections.json"
+
+    def __init__(self, db_path: str, base_name: str = COLLECTION_NAME):
+        self.db_path = db_path
+        self.base_name = base_name
+        self.path = os.path.join(db_path, self.FILENAME)
+        self.active = base_name
+        self.active_generation = 0
+        self.staging: Optional[str] = None
+        self.staging_generation: Optional[int] = None
+        self.previous: Optional[str] = None
+        self.generation = 0
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"读取collection指针失败，使用默认collection: {e}")
+            return
+        if data.get("base_name") != self.base_name:
+            # 修改了 COLLECTION_NAME，旧的指针不再适用
+            return
+        self.active = data.get("active") or self.base_name
+        self.active_generation = data.get("active_generation", 0)
+        self.staging = data.get("staging")
+        self.previous = data.get("previous")
+        self.generation = data.get("generation", 0)
+        # 旧版本的指针没有记录 staging 的代数，staging collection 名称中的代数就是当时分配的代数
+        self.staging_generation = data.get("staging_generation", self.generation if self.staging else None)
+
+    def save(self) -> None:
+        """原子写入：先写临时文件再替换"""
+        os.makedirs(self.db_path, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "base_name": self.base_name,
+                    "active": self.active,
+                    "active_generation": self.active_generation,
+                    "staging": self.staging,
+                    "staging_generation": self.staging_generation,
+                    "previous": self.previous,
+                    "generation": self.generation,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, self.path)
+
+    def manifest_path(self, collection_name: str, generation: Optional[int] = None) -> str:
+        """collection某一代的构建清单路径
+
+        generation 为 None 表示旧版本不分代的collection，沿用旧的文件名
+        """
+        if generation is not None:
+            return os.path.join(self.db_path, f"kb_manifest_{collection_name}@g{generation}.json")
+        if collection_name == self.base_name:
+            return os.path.join(self.db_path, "kb_manifest.json")
+        return os.path.join(self.db_path, f"kb_manifest_{collection_name}.json")
+
+    def begin_staging(self, in_place: bool) -> Tuple[str, int, bool]:
+        """返回本次构建写入的 (collection名称, 代数, 是否为上次中断的构建)
+
+        in_place 为 True 时直接写入 active collection，否则写入新的 collection；
+        有中断的构建时继续使用它的 collection 和代数
+        """
+        if self.staging:
+            return self.staging, self.staging_generation, True
+        self.generation += 1
+        self.staging = self.active if in_place else f"{self.base_name}_g{self.generation}"
+        self.staging_generation = self.generation
+        self.save()
+        return self.staging, self.staging_generation, False
+
+    def abort_staging(self) -> None:
+        """放弃中断的构建（调用方负责清理它写入的数据）"""
+        self.staging = None
+        self.staging_generation = None
+        self.save()
+
+    def promote(self) -> None:
+        """把构建完成的collection和代数原子地切换为 active"""
+        if self.staging != self.active:
+            self.previous = self.active
+        self.active = self.staging
+        self.active_generation = self.staging_generation
+        self.staging = None
+        self.staging_generation = None
+        self.save()
+
+
+def active_collection(db_path: str, base_name: str = COLLECTION_NAME) -> Tuple[str, int]:
+    """当前对外提供检索的 (collection名称, 代数)"""
+    registry = CollectionRegistry(db_path, base_name)
+    return registry.active, registry.active_generation
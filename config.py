@@ -15,6 +15,57 @@ DEFAULT_CONFIG = {
     "CHUNK_OVERLAP": 50,
     "MAX_TOKENS": 4096,
     "TOP_K": 10,
+    "EMBEDDING_BATCH_SIZE": 10,
+    "EMBEDDING_MAX_BATCH_TOKENS": 20000,
+    "EMBEDDING_CONCURRENCY": 4,
+    "EMBEDDING_MAX_RETRIES": 5,
+    "EMBEDDING_CACHE_MAX_ENTRIES": 200000,
+    "BM25_TOKENIZER": "cjk",
+    "BM25_STOPWORDS": True,
+    "BM25_TOKEN_CACHE_SIZE": 10000,
+    "LOADER_WORKERS": 0,
+    "LOADER_TASK_TIMEOUT": 300,
+    "PERSIST_IMAGES": False,
+    "INGEST_BATCH_SIZE": 256,
+    "INGEST_QUEUE_SIZE": 4,
+    "BUILD_CHECKPOINT_INTERVAL": 30,
+    "LLM_MAX_CONNECTIONS": 100,
+    "LLM_MAX_KEEPALIVE_CONNECTIONS": 20,
+    "RETRIEVAL_WORKERS": 8,
+    "SESSION_MAX_ENTRIES": 1000,
+    "SESSION_TTL": 3600,
+    "SPECULATIVE_RETRIEVAL": True,
+    "SPECULATIVE_MIN_OVERLAP": 0.8,
+    "ANSWER_CACHE_MAX_ENTRIES": 1000,
+    "ANSWER_CACHE_TTL": 86400,
+    "ANSWER_CACHE_THRESHOLD": 0.95,
+    "LLM_CACHE_MAX_ENTRIES": 5000,
+    "LLM_CACHE_TTL": 604800,
+    "LLM_CACHE_PERSIST": False,
+    "RETRIEVAL_CACHE_MAX_ENTRIES": 2000,
+    "RETRIEVAL_CACHE_TTL": 3600,
+    "VECTOR_BACKEND": "chroma",
+    "VECTOR_INDEX_DTYPE": "float32",
+    "VECTOR_INDEX_NLIST": 0,
+    "VECTOR_INDEX_NPROBE": 16,
+    "RETRIEVAL_MODE": "hybrid",
+    "RETRIEVAL_CANDIDATES": 30,
+    "RERANK_MODEL": "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",
+    "RERANK_TOP_K": 5,
+    "RERANK_BATCH_SIZE": 16,
+    "RERANK_BUDGET_MS": 300,
+    "RERANK_CACHE_SIZE": 10000,
+    "CONTEXT_TOKEN_BUDGET": 3000,
+    "CONTEXT_CHUNK_TOKENS": 600,
+    "CONTEXT_TOKEN_ENCODING": "cl100k_base",
+    "CONTEXT_TOKEN_CACHE_SIZE": 20000,
+    "EMBEDDING_BACKEND": "openai",
+    "LOCAL_EMBEDDING_MODEL": "BAAI/bge-small-zh-v1.5",
+    "LOCAL_EMBEDDING_BATCH_SIZE": 32,
+    "LOCAL_EMBEDDING_WORKERS": 2,
+    "LOCAL_EMBEDDING_QUANTIZE": False,
+    "EMBEDDING_COALESCE_WAIT_MS": 5,
+    "EMBEDDING_COALESCE_MAX_BATCH": 32,
 }
 
 # 尝试加载 config.json
@@ -48,3 +99,99 @@ CHUNK_OVERLAP = _config.get("CHUNK_OVERLAP", DEFAULT_CONFIG["CHUNK_OVERLAP"])
 MAX_TOKENS = _config.get("MAX_TOKENS", DEFAULT_CONFIG["MAX_TOKENS"])
 
 TOP_K = _config.get("TOP_K", DEFAULT_CONFIG["TOP_K"])
+
+EMBEDDING_BATCH_SIZE = _config.get(
+    "EMBEDDING_BATCH_SIZE", DEFAULT_CONFIG["EMBEDDING_BATCH_SIZE"]
+)
+EMBEDDING_MAX_BATCH_TOKENS = _config.get(
+    "EMBEDDING_MAX_BATCH_TOKENS", DEFAULT_CONFIG["EMBEDDING_MAX_BATCH_TOKENS"]
+)
+EMBEDDING_CONCURRENCY = _config.get(
+    "EMBEDDING_CONCURRENCY", DEFAULT_CONFIG["EMBEDDING_CONCURRENCY"]
+)
+EMBEDDING_MAX_RETRIES = _config.get(
+    "EMBEDDING_MAX_RETRIES", DEFAULT_CONFIG["EMBEDDING_MAX_RETRIES"]
+)
+EMBEDDING_CACHE_MAX_ENTRIES = _config.get(
+    "EMBEDDING_CACHE_MAX_ENTRIES", DEFAULT_CONFIG["EMBEDDING_CACHE_MAX_ENTRIES"]
+)
+
+BM25_TOKENIZER = _config.get("BM25_TOKENIZER", DEFAULT_CONFIG["BM25_TOKENIZER"])
+BM25_STOPWORDS = _config.get("BM25_STOPWORDS", DEFAULT_CONFIG["BM25_STOPWORDS"])
+BM25_TOKEN_CACHE_SIZE = _config.get(
+    "BM25_TOKEN_CACHE_SIZE", DEFAULT_CONFIG["BM25_TOKEN_CACHE_SIZE"]
+)
+
+LOADER_WORKERS = _config.get("LOADER_WORKERS", DEFAULT_CONFIG["LOADER_WORKERS"])
+LOADER_TASK_TIMEOUT = _config.get("LOADER_TASK_TIMEOUT", DEFAULT_CONFIG["LOADER_TASK_TIMEOUT"])
+PERSIST_IMAGES = _config.get("PERSIST_IMAGES", DEFAULT_CONFIG["PERSIST_IMAGES"])
+INGEST_BATCH_SIZE = _config.get("INGEST_BATCH_SIZE", DEFAULT_CONFIG["INGEST_BATCH_SIZE"])
+INGEST_QUEUE_SIZE = _config.get("INGEST_QUEUE_SIZE", DEFAULT_CONFIG["INGEST_QUEUE_SIZE"])
+BUILD_CHECKPOINT_INTERVAL = _config.get(
+    "BUILD_CHECKPOINT_INTERVAL", DEFAULT_CONFIG["BUILD_CHECKPOINT_INTERVAL"]
+)
+LLM_MAX_CONNECTIONS = _config.get("LLM_MAX_CONNECTIONS", DEFAULT_CONFIG["LLM_MAX_CONNECTIONS"])
+LLM_MAX_KEEPALIVE_CONNECTIONS = _config.get(
+    "LLM_MAX_KEEPALIVE_CONNECTIONS", DEFAULT_CONFIG["LLM_MAX_KEEPALIVE_CONNECTIONS"]
+)
+RETRIEVAL_WORKERS = _config.get("RETRIEVAL_WORKERS", DEFAULT_CONFIG["RETRIEVAL_WORKERS"])
+SESSION_MAX_ENTRIES = _config.get("SESSION_MAX_ENTRIES", DEFAULT_CONFIG["SESSION_MAX_ENTRIES"])
+SESSION_TTL = _config.get("SESSION_TTL", DEFAULT_CONFIG["SESSION_TTL"])
+SPECULATIVE_RETRIEVAL = _config.get(
+    "SPECULATIVE_RETRIEVAL", DEFAULT_CONFIG["SPECULATIVE_RETRIEVAL"]
+)
+SPECULATIVE_MIN_OVERLAP = _config.get(
+    "SPECULATIVE_MIN_OVERLAP", DEFAULT_CONFIG["SPECULATIVE_MIN_OVERLAP"]
+)
+ANSWER_CACHE_MAX_ENTRIES = _config.get(
+    "ANSWER_CACHE_MAX_ENTRIES", DEFAULT_CONFIG["ANSWER_CACHE_MAX_ENTRIES"]
+)
+ANSWER_CACHE_TTL = _config.get("ANSWER_CACHE_TTL", DEFAULT_CONFIG["ANSWER_CACHE_TTL"])
+ANSWER_CACHE_THRESHOLD = _config.get(
+    "ANSWER_CACHE_THRESHOLD", DEFAULT_CONFIG["ANSWER_CACHE_THRESHOLD"]
+)
+LLM_CACHE_MAX_ENTRIES = _config.get(
+    "LLM_CACHE_MAX_ENTRIES", DEFAULT_CONFIG["LLM_CACHE_MAX_ENTRIES"]
+)
+LLM_CACHE_TTL = _config.get("LLM_CACHE_TTL", DEFAULT_CONFIG["LLM_CACHE_TTL"])
+LLM_CACHE_PERSIST = _config.get("LLM_CACHE_PERSIST", DEFAULT_CONFIG["LLM_CACHE_PERSIST"])
+RETRIEVAL_CACHE_MAX_ENTRIES = _config.get(
+    "RETRIEVAL_CACHE_MAX_ENTRIES", DEFAULT_CONFIG["RETRIEVAL_CACHE_MAX_ENTRIES"]
+)
+RETRIEVAL_CACHE_TTL = _config.get("RETRIEVAL_CACHE_TTL", DEFAULT_CONFIG["RETRIEVAL_CACHE_TTL"])
+VECTOR_BACKEND = _config.get("VECTOR_BACKEND", DEFAULT_CONFIG["VECTOR_BACKEND"])
+VECTOR_INDEX_DTYPE = _config.get("VECTOR_INDEX_DTYPE", DEFAULT_CONFIG["VECTOR_INDEX_DTYPE"])
+VECTOR_INDEX_NLIST = _config.get("VECTOR_INDEX_NLIST", DEFAULT_CONFIG["VECTOR_INDEX_NLIST"])
+VECTOR_INDEX_NPROBE = _config.get("VECTOR_INDEX_NPROBE", DEFAULT_CONFIG["VECTOR_INDEX_NPROBE"])
+RETRIEVAL_MODE = _config.get("RETRIEVAL_MODE", DEFAULT_CONFIG["RETRIEVAL_MODE"])
+RETRIEVAL_CANDIDATES = _config.get("RETRIEVAL_CANDIDATES", DEFAULT_CONFIG["RETRIEVAL_CANDIDATES"])
+RERANK_MODEL = _config.get("RERANK_MODEL", DEFAULT_CONFIG["RERANK_MODEL"])
+RERANK_TOP_K = _config.get("RERANK_TOP_K", DEFAULT_CONFIG["RERANK_TOP_K"])
+RERANK_BATCH_SIZE = _config.get("RERANK_BATCH_SIZE", DEFAULT_CONFIG["RERANK_BATCH_SIZE"])
+RERANK_BUDGET_MS = _config.get("RERANK_BUDGET_MS", DEFAULT_CONFIG["RERANK_BUDGET_MS"])
+RERANK_CACHE_SIZE = _config.get("RERANK_CACHE_SIZE", DEFAULT_CONFIG["RERANK_CACHE_SIZE"])
+CONTEXT_TOKEN_BUDGET = _config.get("CONTEXT_TOKEN_BUDGET", DEFAULT_CONFIG["CONTEXT_TOKEN_BUDGET"])
+CONTEXT_CHUNK_TOKENS = _config.get("CONTEXT_CHUNK_TOKENS", DEFAULT_CONFIG["CONTEXT_CHUNK_TOKENS"])
+CONTEXT_TOKEN_ENCODING = _config.get(
+    "CONTEXT_TOKEN_ENCODING", DEFAULT_CONFIG["CONTEXT_TOKEN_ENCODING"]
+)
+CONTEXT_TOKEN_CACHE_SIZE = _config.get(
+    "CONTEXT_TOKEN_CACHE_SIZE", DEFAULT_CONFIG["CONTEXT_TOKEN_CACHE_SIZE"]
+)
+EMBEDDING_BACKEND = _config.get("EMBEDDING_BACKEND", DEFAULT_CONFIG["EMBEDDING_BACKEND"])
+LOCAL_EMBEDDING_MODEL = _config.get("LOCAL_EMBEDDING_MODEL", DEFAULT_CONFIG["LOCAL_EMBEDDING_MODEL"])
+LOCAL_EMBEDDING_BATCH_SIZE = _config.get(
+    "LOCAL_EMBEDDING_BATCH_SIZE", DEFAULT_CONFIG["LOCAL_EMBEDDING_BATCH_SIZE"]
+)
+LOCAL_EMBEDDING_WORKERS = _config.get(
+    "LOCAL_EMBEDDING_WORKERS", DEFAULT_CONFIG["LOCAL_EMBEDDING_WORKERS"]
+)
+LOCAL_EMBEDDING_QUANTIZE = _config.get(
+    "LOCAL_EMBEDDING_QUANTIZE", DEFAULT_CONFIG["LOCAL_EMBEDDING_QUANTIZE"]
+)
+EMBEDDING_COALESCE_WAIT_MS = _config.get(
+    "EMBEDDING_COALESCE_WAIT_MS", DEFAULT_CONFIG["EMBEDDING_COALESCE_WAIT_MS"]
+)
+EMBEDDING_COALESCE_MAX_BATCH = _config.get(
+    "EMBEDDING_COALESCE_MAX_BATCH", DEFAULT_CONFIG["EMBEDDING_COALESCE_MAX_BATCH"]
+)
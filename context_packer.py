@@ -0,0 +1,233 @@
+import re
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ttl_cache import TTLCache
+from config import (
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_CHUNK_TOKENS,
+    CONTEXT_TOKEN_ENCODING,
+    CONTEXT_TOKEN_CACHE_SIZE,
+)
+
+# 句子边界：中英文句末标点之后、换行处、英文句号后的空白处
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;])|\n+|(?<=\.)\s+")
+# 估算 token 数时按一个字一个 token 计算的字符（中日韩文字和全角标点）
+_CJK = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+class _Chunk:
+    """缓存的片段：内容和 token 数，句子（及去重用的键）和各句的 token 数在首次用到时计算"""
+
+    __slots__ = ("content", "tokens", "sentences", "keys", "counts")
+
+    def __init__(self, content: str, tokens: int):
+        self.content = content
+        self.tokens = tokens
+        self.sentences: Optional[List[str]] = None
+        self.keys: Optional[List[str]] = None
+        self.counts: Optional[List[int]] = None
+
+
+class ContextPacker:
+    """按 token 预算把上下文窗口中的文档片段打包成提示词上下文
+
+    文档片段按相关性从高到低依次放入，直到用完 budget 个 token：
+    - 用 tiktoken 计算 token 数，片段的 token 数、切分出的句子和各句的 token 数按片段ID缓存；
+      tiktoken 的编码文件无法加载时（例如离线环境）按字符数估算
+    - 与前面片段重复的句子（相邻片段的重叠部分、重复检索到的内容）被去掉
+    - 超过 chunk_budget 或剩余预算的片段（如整页的 PDF）只保留与查询词重合最多的句子
+    budget 为 0 时不限制，只去重
+    """
+
+    def __init__(
+        self,
+        budget: int = CONTEXT_TOKEN_BUDGET,
+        chunk_budget: int = CONTEXT_CHUNK_TOKENS,
+        encoding: str = CONTEXT_TOKEN_ENCODING,
+        cache_size: int = CONTEXT_TOKEN_CACHE_SIZE,
+        tokenize: Optional[Callable[[str], List[str]]] = None,
+    ):
+        self.budget = budget
+        self.chunk_budget = chunk_budget
+        self.encoding_name = encoding
+        self.tokenize = tokenize or (lambda text: text.split())
+        self._encoding = None
+        self._encoding_loaded = False
+        self._encoding_lock = threading.Lock()
+        # 片段ID -> _Chunk，内容变化（重新构建知识库）后重新计算
+        self._token_counts = TTLCache(max(1, cache_size))
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.original_tokens = 0
+        self.packed_tokens = 0
+
+    def _get_encoding(self):
+        if not self._encoding_loaded:
+            with self._encoding_lock:
+                if not self._encoding_loaded:
+                    try:
+                        import tiktoken
+
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        print(
+                            f"加载 tiktoken 编码 {self.encoding_name} 失败，"
+                            f"按字符数估算 token 数: {e}"
+                        )
+                    self._encoding_loaded = True
+        return self._encoding
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """粗略估算 token 数：中文按每字一个 token，其余按每 4 个字符一个 token"""
+        cjk = len(_CJK.findall(text))
+        return cjk + math.ceil((len(text) - cjk) / 4)
+
+    def count_tokens(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is None:
+            return self.estimate_tokens(text)
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def _chunk(self, doc: Dict) -> _Chunk:
+        content = doc.get("content", "")
+        cached = self._token_counts.get(doc["id"])
+        if cached is not None and cached.content == content:
+            return cached
+        chunk = _Chunk(content, self.count_tokens(content))
+        self._token_counts.put(doc["id"], chunk)
+        return chunk
+
+    def chunk_tokens(self, doc: Dict) -> int:
+        """片段的 token 数，按片段ID缓存"""
+        return self._chunk(doc).tokens
+
+    def _sentences(self, chunk: _Chunk) -> Tuple[List[str], List[str]]:
+        """片段的句子和去重用的键，首次用到时计算并缓存"""
+        if chunk.keys is None:
+            sentences = self.split_sentences(chunk.content)
+            # 先写句子再写键，并发时以键是否存在判断句子已就绪
+            chunk.sentences = sentences
+            chunk.keys = [self._sentence_key(sentence) for sentence in sentences]
+        return chunk.sentences, chunk.keys
+
+    def _sentence_counts(self, chunk: _Chunk) -> List[int]:
+        """各句的 token 数，片段第一次需要裁剪时计算并缓存"""
+        if chunk.counts is None:
+            chunk.counts = [self.count_tokens(s) for s in self._sentences(chunk)[0]]
+        return chunk.counts
+
+    @staticmethod
+    def split_sentences(text: str) -> List[str]:
+        return [s.strip() for s in _SENTENCE_END.split(text) if s and s.strip()]
+
+    @staticmethod
+    def _sentence_key(sentence: str) -> str:
+        return " ".join(sentence.split())
+
+    def _select_sentences(
+        self, query_terms: set, sentences: List[str], counts: List[int], limit: int
+    ) -> List[int]:
+        """在 limit 个 token 内选出与查询词重合最多的句子，返回按原文顺序排列的下标"""
+        scores = [len(query_terms.intersection(self.tokenize(s))) for s in sentences]
+        order = sorted(range(len(sentences)), key=lambda i: (-scores[i], i))
+        selected, used = [], 0
+        for i in order:
+            if used + counts[i] <= limit:
+                selected.append(i)
+                used += counts[i]
+        return sorted(selected)
+
+    def pack(self, query: str, docs: List[Dict]) -> Tuple[List[Dict], Dict]:
+        """按预算打包文档片段，docs 需按相关性从高到低排列
+
+        返回 (打包后的片段, 统计)，裁剪过的片段 content 只包含保留的句子，
+        统计包含打包前后的 token 数和节省的 token 数
+        """
+        query_terms = set(self.tokenize(query))
+        remaining = self.budget if self.budget > 0 else math.inf
+        seen = set()
+        packed = []
+        report = {
+            "docs": len(docs),
+            "kept": 0,
+            "trimmed": 0,
+            "dropped": 0,
+            "duplicate_sentences": 0,
+            "original_tokens": 0,
+            "packed_tokens": 0,
+        }
+
+        for doc in docs:
+            chunk = self._chunk(doc)
+            full = chunk.tokens
+            report["original_tokens"] += full
+            if remaining <= 0:
+                report["dropped"] += 1
+                continue
+
+            # fresh 为未与前面片段重复的句子的下标
+            sentences, sentence_keys = self._sentences(chunk)
+            fresh, keys = [], set()
+            for i, key in enumerate(sentence_keys):
+                if key not in seen and key not in keys:
+                    keys.add(key)
+                    fresh.append(i)
+            report["duplicate_sentences"] += len(sentences) - len(fresh)
+            if not fresh:
+                report["dropped"] += 1
+                continue
+
+            limit = min(remaining, self.chunk_budget) if self.chunk_budget > 0 else remaining
+            if len(fresh) == len(sentences) and full <= limit:
+                content, tokens = doc["content"], full
+            else:
+                sentence_counts = self._sentence_counts(chunk)
+                counts = [sentence_counts[i] for i in fresh]
+                if sum(counts) <= limit:
+                    selected = list(range(len(fresh)))
+                else:
+                    selected = self._select_sentences(
+                        query_terms, [sentences[i] for i in fresh], counts, limit
+                    )
+                if not selected:
+                    report["dropped"] += 1
+                    continue
+                # 不相邻的句子之间用省略号标出被裁掉的内容
+                parts = [sentences[fresh[selected[0]]]]
+                for prev, i in zip(selected, selected[1:]):
+                    sentence = sentences[fresh[i]]
+                    parts.append(sentence if i == prev + 1 else "……" + sentence)
+                content = "\n".join(parts)
+                tokens = sum(counts[i] for i in selected)
+                report["trimmed"] += 1
+                fresh = [fresh[i] for i in selected]
+
+            seen.update(sentence_keys[i] for i in fresh)
+            remaining -= tokens
+            report["packed_tokens"] += tokens
+            report["kept"] += 1
+            packed.append(doc if content is doc["content"] else {**doc, "content": content})
+
+        report["saved_tokens"] = report["original_tokens"] - report["packed_tokens"]
+        with self._stats_lock:
+            self.requests += 1
+            self.original_tokens += report["original_tokens"]
+            self.packed_tokens += report["packed_tokens"]
+        return packed, report
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "tokenizer": (
+                    f"tiktoken:{self.encoding_name}" if self._encoding is not None else "estimate"
+                ),
+                "budget": self.budget,
+                "requests": self.requests,
+                "original_tokens": self.original_tokens,
+                "packed_tokens": self.packed_tokens,
+                "saved_tokens": self.original_tokens - self.packed_tokens,
+                "token_cache": self._token_counts.stats(),
+            }
@@ -1,21 +1,30 @@
+import io
 import os
 import re
-import shutil
-from typing import List, Dict, Optional
+import hashlib
+import time
+import multiprocessing
+import concurrent.futures
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Optional, Tuple, Any, Union, Iterator
 import pytesseract
 from PIL import Image
 import fitz
 import docx2txt
-from PyPDF2 import PdfReader
 from pptx import Presentation
 
-from config import DATA_DIR
+from config import DATA_DIR, LOADER_WORKERS, LOADER_TASK_TIMEOUT, VECTOR_DB_PATH, PERSIST_IMAGES
+from ocr_cache import OCRCache
 
 
 class DocumentLoader:
     MIN_IMAGE_SIDE = 512  # 最小图片边长，单位像素
     MIN_OCR_CHAR_COUNT = 64
     MIN_OCR_WORD_COUNT = 16
+    OCR_LANG = "chi_sim+eng"
+    # 修改 _normalize_whitespace / _is_valid_ocr_text 的规则时递增，使旧的OCR缓存失效
+    OCR_NORMALIZATION_VERSION = 1
 
     @staticmethod
     def _normalize_whitespace(text: str) -> str:
@@ -53,8 +62,20 @@ class DocumentLoader:
     def __init__(
         self,
         data_dir: str = DATA_DIR,
+        workers: int = LOADER_WORKERS,
+        ocr_cache_path: Optional[str] = os.path.join(VECTOR_DB_PATH, "ocr_cache.sqlite3"),
+        persist_images: bool = PERSIST_IMAGES,
     ):
         self.data_dir = data_dir
+        # 图片默认只在内存中解码后OCR，不落盘；开启后才按内容哈希去重保存到图片目录，供引用时使用
+        self.persist_images = persist_images
+        # OCR结果缓存，只在主进程中按需打开
+        self.ocr_cache_path = ocr_cache_path
+        self._ocr_cache: Optional[OCRCache] = None
+        # 并行加载使用的进程数，0 表示使用全部CPU核心
+        self.workers = workers or os.cpu_count() or 1
+        # 加载和OCR共用的进程池，第一次并行加载时创建，close() 时关闭
+        self._pool: Optional[_ProcessPool] = None
         self.supported_formats = [".pdf", ".pptx", ".docx", ".txt"]
         self.image_formats = ["png", "jpg", "jpeg", "bmp"]
 
@@ -63,21 +84,58 @@ class DocumentLoader:
 
         TODO: 实现PDF文件加载
         要求：
-        1. 使用PdfReader读取PDF文件
+        1. 使用fitz读取PDF文件
         2. 遍历每一页，提取文本内容
         3. 格式化为"--- 第 X 页 ---\n文本内容\n"
         4. 返回pdf内容列表，每个元素包含 {"text": "..."}
+
+        读取失败时抛出异常，由调用方把该文件记为失败，下次构建时重试
         """
-        try:
-            reader = PdfReader(file_path)
-            pages = []
-            for page_num, page in enumerate(reader.pages):
-                text = page.extract_text() or ""
-                pages.append({"text": f"--- 第 {page_num + 1} 页 ---\n{text}\n"})
-            return pages
-        except Exception as e:
-            print(f"加载PDF文件失败: {file_path}, 错误: {e}")
-            return []
+        pages, _ = self.parse_pdf(file_path, with_images=False)
+        return pages
+
+    def parse_pdf(
+        self, file_path: str, output_dir: Optional[str] = None, with_images: bool = True
+    ) -> Tuple[List[Dict], List[Dict]]:
+        """用fitz一次遍历PDF，同时提取每页文本和待OCR的图片，打开失败时抛出异常
+
+        返回 (页面列表, 图片列表)：页面元素为 {"text": "..."}，图片元素格式见 collect_pdf_images。
+        同一图片对象（相同xref，如每页重复的校徽）只在第一次出现的页面提取一次。
+        """
+        pages = []
+        images = []
+        seen_xrefs = set()
+        with fitz.open(file_path) as doc:
+            for page_idx, page in enumerate(doc):
+                text = page.get_text("text")
+                pages.append({"text": f"--- 第 {page_idx + 1} 页 ---\n{text}\n"})
+                if not with_images:
+                    continue
+
+                for img_idx, img in enumerate(page.get_images(full=True)):
+                    xref, width, height = img[0], img[2], img[3]
+                    if xref in seen_xrefs:
+                        continue
+                    seen_xrefs.add(xref)
+                    if self._is_small_bitmap(width, height):
+                        continue
+
+                    base_image = doc.extract_image(xref)
+                    if not base_image or base_image["ext"].lower() not in self.image_formats:
+                        continue
+
+                    images.append(
+                        self._make_image_record(
+                            file_path,
+                            base_image["image"],
+                            base_image["ext"],
+                            page_idx + 1,
+                            img_idx,
+                            f"--- 第 {page_idx + 1} 页 ---",
+                            output_dir,
+                        )
+                    )
+        return pages, images
 
     def load_pptx(self, file_path: str) -> List[Dict]:
         """加载PPT文件，按幻灯片返回内容
@@ -88,21 +146,19 @@ class DocumentLoader:
         2. 遍历每一页，提取文本内容
         3. 格式化为"--- 幻灯片 X ---\n文本内容\n"
         4. 返回幻灯片内容列表，每个元素包含 {"text": "..."}
+
+        读取失败时抛出异常
         """
-        try:
-            presentation = Presentation(file_path)
-            slides = []
-            for slide_num, slide in enumerate(presentation.slides):
-                slide_text = []
-                for shape in slide.shapes:
-                    if hasattr(shape, "text"):
-                        slide_text.append(shape.text)
-                text = "\n".join(slide_text)
-                slides.append({"text": f"--- 幻灯片 {slide_num + 1} ---\n{text}\n"})
-            return slides
-        except Exception as e:
-            print(f"加载PPT文件失败: {file_path}, 错误: {e}")
-            return []
+        presentation = Presentation(file_path)
+        slides = []
+        for slide_num, slide in enumerate(presentation.slides):
+            slide_text = []
+            for shape in slide.shapes:
+                if hasattr(shape, "text"):
+                    slide_text.append(shape.text)
+            text = "\n".join(slide_text)
+            slides.append({"text": f"--- 幻灯片 {slide_num + 1} ---\n{text}\n"})
+        return slides
 
     def load_docx(self, file_path: str) -> str:
         """加载DOCX文件
@@ -110,13 +166,10 @@ class DocumentLoader:
         要求：
         1. 使用docx2txt读取DOCX文件
         2. 返回文本内容
+
+        读取失败时抛出异常
         """
-        try:
-            text = docx2txt.process(file_path)
-            return text
-        except Exception as e:
-            print(f"加载DOCX文件失败: {file_path}, 错误: {e}")
-            return ""
+        return docx2txt.process(file_path)
 
     def load_txt(self, file_path: str) -> str:
         """加载TXT文件
@@ -124,90 +177,164 @@ class DocumentLoader:
         要求：
         1. 使用open读取TXT文件（注意使用encoding="utf-8"）
         2. 返回文本内容
+
+        读取失败时抛出异常
         """
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                text = f.read()
-            return text
-        except Exception as e:
-            print(f"加载TXT文件失败: {file_path}, 错误: {e}")
-            return ""
+        with open(file_path, "r", encoding="utf-8") as f:
+            text = f.read()
+        return text
+
+    def recognize_image(self, image: Union[str, bytes]) -> Tuple[str, bool]:
+        """对图片进行OCR识别，返回 (规整后的文本, 是否为有效文字)，识别出错时抛出异常
 
-    def ocr_image(self, image_path: str) -> str:
+        image 可以是图片路径，也可以是图片的原始字节（直接在内存中解码，不落盘）
+        """
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            image = io.BytesIO(image)
+        text = pytesseract.image_to_string(Image.open(image), lang=self.OCR_LANG)
+        # 规整 OCR 结果中的换行和多余空格
+        text = self._normalize_whitespace(text)
+        return text, self._is_valid_ocr_text(text)
+
+    def ocr_image(self, image: Union[str, bytes]) -> str:
         """对图片进行OCR识别，返回文本"""
         try:
-            text = pytesseract.image_to_string(Image.open(image_path), lang="chi_sim+eng")
-            # 规整 OCR 结果中的换行和多余空格
-            text = self._normalize_whitespace(text)
-            if self._is_valid_ocr_text(text):
-                return text
-            else:
-                return ""
+            text, valid = self.recognize_image(image)
+            return text if valid else ""
         except Exception as e:
-            print(f"OCR识别失败: {image_path}, 错误: {e}")
+            source = image if isinstance(image, str) else "<内存图片>"
+            print(f"OCR识别失败: {source}, 错误: {e}")
             return ""
-        
-    def extract_images_from_pdf(self, file_path: str, output_dir: str) -> List[Dict]:
-        """提取PDF中的图片并进行OCR识别
-        
-        1. 使用fitz库打开PDF文件
-        2. 遍历每一页，提取图片
-        3. 保存图片到output_dir
-        4. 对每张图片进行OCR识别，获取文本
-        5. 格式化为"--- 第 X 页 ---\n图片ocr内容\n"
-        6. 返回图片内容列表，每个元素包含 {"filepath": "...", "text": "..."}
-        """
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir, exist_ok=True)
-        filename = os.path.basename(file_path).split(".pdf")[0]
-        doc = fitz.open(file_path)
-        images = []
 
-        for page_idx in range(len(doc)):
-            page = doc[page_idx]
-            image_list = page.get_images(full=True)
+    @staticmethod
+    def _run_inline(func, args_list: List[tuple]) -> List[Tuple[bool, Any]]:
+        """在当前进程中依次执行一组任务，返回格式与 _run_isolated 相同"""
+        outcomes = []
+        for args in args_list:
+            try:
+                outcomes.append((True, func(*args)))
+            except Exception as e:
+                outcomes.append((False, e))
+        return outcomes
+
+    def _run_isolated(self, func, args_list: List[tuple], workers: int) -> List[Tuple[bool, Any]]:
+        """在进程池中执行一组相互独立的任务，返回 [(是否成功, 结果或异常)]"""
+        if not args_list:
+            return []
+        if self._pool is None or self._pool.workers != max(1, workers):
+            if self._pool is not None:
+                self._pool.close()
+            self._pool = _ProcessPool(workers)
+        return self._pool.run(func, args_list)
 
-            for img_idx, img in enumerate(image_list):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
+    def close(self) -> None:
+        """关闭加载进程池"""
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
 
-                width = base_image.get("width")
-                height = base_image.get("height")
-                if self._is_small_bitmap(width, height) or base_image["ext"].lower() not in self.image_formats:
-                    continue
+    @property
+    def ocr_cache(self) -> Optional[OCRCache]:
+        if self._ocr_cache is None and self.ocr_cache_path:
+            self._ocr_cache = OCRCache(self.ocr_cache_path)
+        return self._ocr_cache
 
-                image_bytes = base_image["image"]
-                image_ext = base_image["ext"]
-                image_filename = f"pdf{filename}_p{page_idx}_img{img_idx}.{image_ext}"
-                image_path = os.path.join(output_dir, image_filename)
-                with open(image_path, "wb") as f:
-                    f.write(image_bytes)
-                ocr_text = self.ocr_image(image_path)
-                if not ocr_text:
-                    continue
-                text = f"--- 第 {page_idx + 1} 页 ---\n[图片内容]\n{ocr_text}\n"
-                images.append(
-                    {
-                        "filepath": image_path,
-                        "text": text,
-                        "page_number": page_idx + 1,
-                        "image_id": img_idx,
-                    }
+    @classmethod
+    def _ocr_cache_version(cls) -> str:
+        return f"{cls.OCR_NORMALIZATION_VERSION}-{cls.MIN_OCR_CHAR_COUNT}-{cls.MIN_OCR_WORD_COUNT}"
+
+    def _recognize_unique(
+        self, images: List[Dict], workers: Optional[int] = None
+    ) -> Dict[str, Tuple[str, bool]]:
+        """按图片内容哈希去重后OCR，先查缓存，只识别未命中的图片
+
+        workers 为 None 时在当前进程中识别，否则把未命中的图片字节交给进程池并行识别。
+        返回 {图片哈希: (文本, 是否有效)}，识别出错的图片不在结果中，也不会写入缓存
+        """
+        first_image: Dict[str, Dict] = {}
+        for image in images:
+            first_image.setdefault(image["image_hash"], image)
+
+        cache = self.ocr_cache
+        version = self._ocr_cache_version()
+        results = cache.get_many(list(first_image), self.OCR_LANG, version) if cache else {}
+
+        missing = [image_hash for image_hash in first_image if image_hash not in results]
+        recognized = {}
+        args_list = [(first_image[image_hash]["image_bytes"],) for image_hash in missing]
+        if workers is None:
+            outcomes = self._run_inline(self.recognize_image, args_list)
+        else:
+            outcomes = self._run_isolated(_ocr_bytes, args_list, workers)
+        for image_hash, (ok, outcome) in zip(missing, outcomes):
+            if ok:
+                recognized[image_hash] = outcome
+            else:
+                image = first_image[image_hash]
+                print(
+                    f"OCR识别失败: {image['source']} 第 {image['page_number']} 页的图片, 错误: {outcome}"
                 )
-        return images
-    
-    def extract_images_from_pptx(self, file_path: str, output_dir: str) -> List[Dict]:
-        """提取PPT中的图片并进行OCR识别
-        1. 使用Presentation读取PPT文件
-        2. 遍历每一页，提取图片
-        3. 保存图片到output_dir
-        4. 对每张图片进行OCR识别，获取文本
-        5. 格式化为"--- 幻灯片 X ---\n图片ocr内容\n
-        6. 返回图片内容列表，每个元素包含 {"filepath": "...", "text": "..."}
+        if cache:
+            cache.put_many(recognized, self.OCR_LANG, version)
+        results.update(recognized)
+
+        if images:
+            print(
+                f"OCR: {len(images)} 张图片, 去重后 {len(first_image)} 张, "
+                f"缓存命中 {len(first_image) - len(missing)} 张, 实际识别 {len(missing)} 张"
+            )
+        return results
+
+    def _store_image(self, image_bytes: bytes, image_hash: str, image_ext: str, output_dir: str) -> str:
+        """按内容哈希保存图片（相同内容只保存一份），返回图片路径"""
+        image_dir = os.path.join(output_dir, image_hash[:2])
+        image_path = os.path.join(image_dir, f"{image_hash}.{image_ext}")
+        if not os.path.exists(image_path):
+            os.makedirs(image_dir, exist_ok=True)
+            tmp_path = f"{image_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(image_bytes)
+            os.replace(tmp_path, image_path)
+        return image_path
+
+    def _make_image_record(
+        self,
+        file_path: str,
+        image_bytes: bytes,
+        image_ext: str,
+        page_number: int,
+        image_id: int,
+        header: str,
+        output_dir: Optional[str],
+    ) -> Dict:
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        filepath = file_path
+        if self.persist_images and output_dir:
+            filepath = self._store_image(image_bytes, image_hash, image_ext, output_dir)
+        return {
+            "filepath": filepath,
+            "source": file_path,
+            "page_number": page_number,
+            "image_id": image_id,
+            "image_hash": image_hash,
+            "image_bytes": image_bytes,
+            "header": header,
+        }
+
+    def collect_pdf_images(self, file_path: str, output_dir: Optional[str] = None) -> List[Dict]:
+        """提取PDF中待OCR的图片，图片保留在内存中（开启持久化时同时保存到 output_dir）
+
+        每个元素包含 {"filepath", "source", "page_number", "image_id", "image_hash",
+        "image_bytes", "header"}；image_bytes 为图片的原始字节，开启图片持久化时
+        filepath 为保存后的图片路径，否则为PDF路径
+        """
+        return self.parse_pdf(file_path, output_dir)[1]
+
+    def collect_pptx_images(self, file_path: str, output_dir: Optional[str] = None) -> List[Dict]:
+        """提取PPT中待OCR的图片，图片保留在内存中（开启持久化时同时保存到 output_dir）
+
+        返回格式与 collect_pdf_images 相同
         """
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir, exist_ok=True)
-        filename = os.path.basename(file_path).split(".ppt")[0]
         prs = Presentation(file_path)
         images = []
 
@@ -218,41 +345,76 @@ class DocumentLoader:
                     height_px = int(shape.height / 9525)
                     if self._is_small_bitmap(width_px, height_px) or shape.image.ext.lower() not in self.image_formats:
                         continue
-                    
-                    image = shape.image
-                    image_ext = image.ext
-                    image_bytes = image.blob
-
-                    image_filename = f"ppt{filename}_s{slide_idx}_img{shape_idx}.{image_ext}"
-                    image_path = os.path.join(output_dir, image_filename)
-
-                    with open(image_path, "wb") as f:
-                        f.write(image_bytes)
-
-                    ocr_text = self.ocr_image(image_path)
-                    if not ocr_text:
-                        continue
-                    text = f"--- 幻灯片 {slide_idx + 1} ---\n[图片内容]\n{ocr_text}\n"
 
+                    image = shape.image
                     images.append(
-                        {
-                            "filepath": image_path,
-                            "text": text,
-                            "page_number": slide_idx + 1,
-                            "image_id": shape_idx,
-                        }
+                        self._make_image_record(
+                            file_path,
+                            image.blob,
+                            image.ext,
+                            slide_idx + 1,
+                            shape_idx,
+                            f"--- 幻灯片 {slide_idx + 1} ---",
+                            output_dir,
+                        )
                     )
         return images
 
+    @staticmethod
+    def _format_ocr_result(image: Dict, ocr_text: str) -> Dict:
+        return {
+            "filepath": image["filepath"],
+            "source": image["source"],
+            "text": f"{image['header']}\n[图片内容]\n{ocr_text}\n",
+            "page_number": image["page_number"],
+            "image_id": image["image_id"],
+        }
 
-    def load_document(self, file_path: str, image_output_dir: Optional[str] = None) -> List[Dict[str, str]]:
-        """加载单个文档，PDF和PPT按页/幻灯片分割，返回文档块列表"""
+    def _ocr_images(self, images: List[Dict]) -> List[Dict]:
+        """在当前进程中对图片进行OCR（相同内容的图片只识别一次），丢弃没有有效文字的图片"""
+        recognized = self._recognize_unique(images)
+        results = []
+        for image in images:
+            text, valid = recognized.get(image["image_hash"], ("", False))
+            if valid:
+                results.append(self._format_ocr_result(image, text))
+        return results
+
+    def extract_images_from_pdf(self, file_path: str, output_dir: Optional[str] = None) -> List[Dict]:
+        """提取PDF中的图片并进行OCR识别
+        
+        1. 使用fitz库打开PDF文件
+        2. 遍历每一页，提取图片（跳过已提取过的xref）
+        3. 对每张图片进行OCR识别，获取文本（开启图片持久化时保存到output_dir）
+        4. 格式化为"--- 第 X 页 ---\n图片ocr内容\n"
+        5. 返回图片内容列表，每个元素包含 {"filepath": "...", "text": "..."}
+        """
+        return self._ocr_images(self.collect_pdf_images(file_path, output_dir))
+    
+    def extract_images_from_pptx(self, file_path: str, output_dir: Optional[str] = None) -> List[Dict]:
+        """提取PPT中的图片并进行OCR识别
+        1. 使用Presentation读取PPT文件
+        2. 遍历每一页，提取图片
+        3. 对每张图片进行OCR识别，获取文本（开启图片持久化时保存到output_dir）
+        4. 格式化为"--- 幻灯片 X ---\n图片ocr内容\n
+        5. 返回图片内容列表，每个元素包含 {"filepath": "...", "text": "..."}
+        """
+        return self._ocr_images(self.collect_pptx_images(file_path, output_dir))
+
+    def _load_text_documents(
+        self, file_path: str, pages: Optional[List[Dict]] = None
+    ) -> List[Dict[str, str]]:
+        """加载文档的文本部分，PDF和PPT按页/幻灯片分割
+
+        pages 为已经解析好的PDF页面（见 parse_pdf），传入时不再重新读取PDF
+        """
         ext = os.path.splitext(file_path)[1].lower()
         filename = os.path.basename(file_path)
         documents = []
 
         if ext == ".pdf":
-            pages = self.load_pdf(file_path)
+            if pages is None:
+                pages = self.load_pdf(file_path)
             for page_idx, page_data in enumerate(pages, 1):
                 documents.append(
                     {
@@ -264,21 +426,6 @@ class DocumentLoader:
                         "chunk_type": "text",
                     }
                 )
-            if image_output_dir:
-                images = self.extract_images_from_pdf(file_path, image_output_dir)
-                if images:
-                    for img in images:
-                        documents.append(
-                            {
-                                "content": img.get("text", ""),
-                                "filename": filename,
-                                "filepath": img["filepath"],
-                                "filetype": ext,
-                                "page_number": img["page_number"],
-                                "image_id": img.get("image_id", 0),
-                                "chunk_type": "image",
-                            }
-                        )
         elif ext == ".pptx":
             slides = self.load_pptx(file_path)
             for slide_idx, slide_data in enumerate(slides, 1):
@@ -292,21 +439,6 @@ class DocumentLoader:
                         "chunk_type": "text",
                     }
                 )
-            if image_output_dir:
-                images = self.extract_images_from_pptx(file_path, image_output_dir)
-                if images:
-                    for img in images:
-                        documents.append(
-                            {
-                                "content": img.get("text", ""),
-                                "filename": filename,
-                                "filepath": img["filepath"],
-                                "filetype": ext,
-                                "page_number": img["page_number"],
-                                "image_id": img.get("image_id", 0),
-                                "chunk_type": "image",
-                            }
-                        )
         elif ext == ".docx":
             content = self.load_docx(file_path)
             if content:
@@ -338,27 +470,302 @@ class DocumentLoader:
 
         return documents
 
+    def _collect_images(self, file_path: str, output_dir: Optional[str]) -> List[Dict]:
+        """提取PDF/PPT中待OCR的图片，其他格式没有图片"""
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext == ".pdf":
+            return self.collect_pdf_images(file_path, output_dir)
+        if ext == ".pptx":
+            return self.collect_pptx_images(file_path, output_dir)
+        return []
+
+    def _extract(
+        self, file_path: str, image_output_dir: Optional[str]
+    ) -> Tuple[List[Dict[str, str]], List[Dict]]:
+        """提取文档的文本块和待OCR的图片，PDF只打开和遍历一次"""
+        if not image_output_dir:
+            return self._load_text_documents(file_path), []
+        if os.path.splitext(file_path)[1].lower() == ".pdf":
+            pages, images = self.parse_pdf(file_path, image_output_dir)
+            return self._load_text_documents(file_path, pages), images
+        return (
+            self._load_text_documents(file_path),
+            self._collect_images(file_path, image_output_dir),
+        )
+
+    @staticmethod
+    def _image_documents(file_path: str, images: List[Dict]) -> List[Dict[str, str]]:
+        ext = os.path.splitext(file_path)[1].lower()
+        filename = os.path.basename(file_path)
+        return [
+            {
+                "content": img.get("text", ""),
+                "filename": filename,
+                "filepath": img["filepath"],
+                "source": file_path,
+                "filetype": ext,
+                "page_number": img["page_number"],
+                "image_id": img.get("image_id", 0),
+                "chunk_type": "image",
+            }
+            for img in images
+        ]
+
+    def load_document(self, file_path: str, image_output_dir: Optional[str] = None) -> List[Dict[str, str]]:
+        """加载单个文档，PDF和PPT按页/幻灯片分割，返回文档块列表
+
+        传入 image_output_dir 时对PDF/PPT中的图片进行OCR，开启图片持久化时图片保存在该目录；
+        读取失败时抛出异常
+        """
+        documents, images = self._extract(file_path, image_output_dir)
+        if images:
+            documents.extend(self._image_documents(file_path, self._ocr_images(images)))
+        return documents
+
+    def load_documents(
+        self,
+        file_paths: List[str],
+        image_output_dir: Optional[str] = None,
+        workers: Optional[int] = None,
+    ) -> List[Tuple[str, Optional[List[Dict[str, str]]]]]:
+        """用进程池并行加载多个文档
+
+        分两个阶段：先按文件并行提取文本和图片，再把所有文件的图片按内容去重、
+        查询OCR缓存后打散并行识别。
+        返回 [(文件路径, 文档块列表)]，顺序与输入一致；加载失败、超时或有图片OCR失败的文件
+        文档块列表为 None，不会影响其他文件。
+        """
+        workers = workers or self.workers
+
+        # 阶段一：按文件并行提取文本和图片（图片字节随结果传回主进程，不落盘）
+        extracted = self._run_isolated(
+            _extract_file,
+            [(self.data_dir, path, image_output_dir, self.persist_images) for path in file_paths],
+            workers,
+        )
+
+        # 阶段二：所有文件的图片按内容去重、查缓存后，只把未命中的图片字节交给进程池并行OCR
+        pending = []
+        for file_idx, (ok, result) in enumerate(extracted):
+            if not ok:
+                print(f"加载文件失败: {file_paths[file_idx]}, 错误: {result}")
+                continue
+            pending.extend((file_idx, image) for image in result[1])
+        recognized = self._recognize_unique([image for _, image in pending], workers)
+
+        # 有图片OCR失败或超时的文件整体记为失败，下次构建时重试
+        ocr_by_file: Dict[int, List[Dict]] = {}
+        ocr_failed = set()
+        for file_idx, image in pending:
+            outcome = recognized.get(image["image_hash"])
+            if outcome is None:
+                ocr_failed.add(file_idx)
+            elif outcome[1]:
+                ocr_by_file.setdefault(file_idx, []).append(
+                    self._format_ocr_result(image, outcome[0])
+                )
+
+        results = []
+        for file_idx, (file_path, (ok, result)) in enumerate(zip(file_paths, extracted)):
+            if not ok:
+                results.append((file_path, None))
+                continue
+            if file_idx in ocr_failed:
+                print(f"加载文件失败: {file_path}, 错误: 部分图片OCR失败")
+                results.append((file_path, None))
+                continue
+            documents = result[0] + self._image_documents(
+                file_path, ocr_by_file.get(file_idx, [])
+            )
+            results.append((file_path, documents))
+        return results
+
+    def iter_documents(
+        self,
+        file_paths: List[str],
+        image_output_dir: Optional[str] = None,
+        workers: Optional[int] = None,
+        window: Optional[int] = None,
+    ) -> Iterator[Tuple[str, Optional[List[Dict[str, str]]]]]:
+        """流式加载多个文档，逐个产出 (文件路径, 文档块列表)
+
+        每次只用 load_documents 并行加载 window 个文件（默认进程数的两倍），
+        内存中只保留一个窗口的文档，OCR 去重在窗口内进行，跨窗口依靠OCR缓存。
+        """
+        workers = workers or self.workers
+        window = window or max(1, workers) * 2
+        for start in range(0, len(file_paths), window):
+            yield from self.load_documents(
+                file_paths[start : start + window], image_output_dir, workers
+            )
+
+    @property
+    def image_output_dir(self) -> str:
+        return os.path.join(self.data_dir, "images")
+
+    def list_files(self) -> List[str]:
+        """列出数据目录下所有支持的文档（跳过图片目录），按路径排序"""
+        file_paths = []
+        for root, dirs, files in os.walk(self.data_dir):
+            if os.path.abspath(root) == os.path.abspath(self.image_output_dir):
+                dirs[:] = []
+                continue
+            for file in files:
+                ext = os.path.splitext(file)[1].lower()
+                if ext in self.supported_formats:
+                    file_paths.append(os.path.join(root, file))
+        return sorted(file_paths)
+
+    def remove_images(self, image_paths: List[str]) -> None:
+        """删除图片目录中之前保存的图片，目录外的路径（如未持久化图片时记录的源文档）会被忽略"""
+        image_root = os.path.abspath(self.image_output_dir) + os.sep
+        for image_path in image_paths:
+            if not os.path.abspath(image_path).startswith(image_root):
+                continue
+            try:
+                if os.path.exists(image_path):
+                    os.remove(image_path)
+            except OSError as e:
+                print(f"删除图片失败: {image_path}, 错误: {e}")
+
     def load_all_documents(self) -> List[Dict[str, str]]:
         """加载数据目录下的所有文档"""
-        image_output_dir = os.path.join(self.data_dir, "images")
         if not os.path.exists(self.data_dir):
             print(f"数据目录不存在: {self.data_dir}")
             return None
-        if os.path.exists(image_output_dir):
-            shutil.rmtree(image_output_dir)
-            print("图片目录已清空")
-        os.makedirs(image_output_dir, exist_ok=True)
+        os.makedirs(self.image_output_dir, exist_ok=True)
 
         documents = []
 
-        for root, dirs, files in os.walk(self.data_dir):
-            for file in files:
-                ext = os.path.splitext(file)[1].lower()
-                if ext in self.supported_formats:
-                    file_path = os.path.join(root, file)
-                    print(f"正在加载: {file_path}")
-                    doc_chunks = self.load_document(file_path, image_output_dir=image_output_dir)
-                    if doc_chunks:
-                        documents.extend(doc_chunks)
+        for file_path, doc_chunks in self.load_documents(
+            self.list_files(), image_output_dir=self.image_output_dir
+        ):
+            if doc_chunks:
+                documents.extend(doc_chunks)
 
         return documents
+
+
+def _init_worker() -> None:
+    # 每个进程只让 tesseract 使用一个线程，避免与进程池争抢CPU
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+
+def _extract_file(
+    data_dir: str,
+    file_path: str,
+    image_output_dir: Optional[str],
+    persist_images: bool,
+):
+    """进程池任务：提取单个文件的文本文档和待OCR的图片（含图片字节）"""
+    print(f"正在加载: {file_path}")
+    loader = DocumentLoader(
+        data_dir=data_dir, workers=1, ocr_cache_path=None, persist_images=persist_images
+    )
+    return loader._extract(file_path, image_output_dir)
+
+
+def _ocr_bytes(image_bytes: bytes) -> Tuple[str, bool]:
+    """进程池任务：在内存中解码图片进行OCR，返回 (文本, 是否有效)"""
+    try:
+        return DocumentLoader(workers=1, ocr_cache_path=None).recognize_image(image_bytes)
+    except Exception as e:
+        # 部分异常（如 TesseractNotFoundError）无法在主进程中反序列化，会让整个进程池失效
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+
+class _ProcessPool:
+    """长期存活的加载进程池，在多次 run() 之间复用工作进程
+
+    使用 spawn 方式启动工作进程，不从调用线程（如API服务的构建线程）fork。
+    同时在途的任务数不超过进程数，每个任务从提交起计时；超过 timeout 秒未完成时
+    该任务记为失败，杀掉整个进程池后重建，其余被连带中断的任务重新排队（不计入重试次数）。
+    某个任务导致工作进程崩溃时，进程池会整体失效，此时在途的任务各重试一次。
+    """
+
+    MAX_ATTEMPTS = 2
+
+    def __init__(self, workers: int, timeout: float = LOADER_TASK_TIMEOUT):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self._executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return self._executor
+
+    def _kill(self) -> None:
+        """立即终止所有工作进程（包括卡住的任务），下次 run() 时重建进程池"""
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        for process in processes:
+            try:
+                process.kill()
+            except Exception:
+                pass
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.join(timeout=5)
+
+    def run(self, func, args_list: List[tuple]) -> List[Tuple[bool, Any]]:
+        """执行一组相互独立的任务，返回 [(是否成功, 结果或异常)]，顺序与输入一致"""
+        results: List[Tuple[bool, Any]] = [(False, None)] * len(args_list)
+        attempts = [0] * len(args_list)
+        queue = deque(range(len(args_list)))
+        running: Dict[concurrent.futures.Future, Tuple[int, float]] = {}
+
+        while queue or running:
+            executor = self._get_executor()
+            while queue and len(running) < self.workers:
+                idx = queue.popleft()
+                running[executor.submit(func, *args_list[idx])] = (idx, time.monotonic())
+
+            wait_timeout = None
+            if self.timeout:
+                earliest = min(start for _, start in running.values())
+                wait_timeout = max(0.0, earliest + self.timeout - time.monotonic())
+            done, _ = concurrent.futures.wait(
+                running, timeout=wait_timeout, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+
+            broken = False
+            for future in done:
+                idx, _ = running.pop(future)
+                attempts[idx] += 1
+                try:
+                    results[idx] = (True, future.result())
+                except BrokenProcessPool as e:
+                    broken = True
+                    results[idx] = (False, e)
+                    if attempts[idx] < self.MAX_ATTEMPTS:
+                        queue.append(idx)
+                except Exception as e:
+                    results[idx] = (False, e)
+            if broken:
+                self._kill()
+                continue
+
+            if not self.timeout:
+                continue
+            now = time.monotonic()
+            expired = [f for f, (_, start) in running.items() if now - start >= self.timeout]
+            if expired:
+                for future in expired:
+                    idx, _ = running.pop(future)
+                    results[idx] = (False, TimeoutError(f"任务超过 {self.timeout} 秒未完成"))
+                queue.extendleft(sorted(idx for idx, _ in running.values())[::-1])
+                running.clear()
+                self._kill()
+        return results
+
+    def close(self) -> None:
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,261 @@
+import random
+import time
+import threading
+import concurrent.futures
+from typing import Dict, List, Optional, Tuple
+
+import openai
+from openai import OpenAI
+
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_API_BASE,
+    OPENAI_EMBEDDING_MODEL,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_BATCH_TOKENS,
+    EMBEDDING_CONCURRENCY,
+    EMBEDDING_MAX_RETRIES,
+    EMBEDDING_BACKEND,
+    LOCAL_EMBEDDING_MODEL,
+    LOCAL_EMBEDDING_BATCH_SIZE,
+    LOCAL_EMBEDDING_WORKERS,
+    LOCAL_EMBEDDING_QUANTIZE,
+)
+
+# 需要重试的 HTTP 状态码：限流和服务端错误
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class OpenAIEmbedder:
+    """批量调用 embeddings 接口的向量化引擎
+
+    - 按条数和 token 上限把文本打包成批次
+    - 使用线程池限制同时在途的请求数量
+    - 对 429/5xx 和网络错误进行指数退避重试
+    """
+
+    def __init__(
+        self,
+        api_key: str = OPENAI_API_KEY,
+        api_base: str = OPENAI_API_BASE,
+        model: str = OPENAI_EMBEDDING_MODEL,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_batch_tokens: int = EMBEDDING_MAX_BATCH_TOKENS,
+        concurrency: int = EMBEDDING_CONCURRENCY,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+    ):
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.max_batch_tokens = max(1, max_batch_tokens)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max(0, max_retries)
+
+        # 重试由本类负责，关闭客户端自带的重试以免叠加
+        self.client = OpenAI(api_key=api_key, base_url=api_base, max_retries=0)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        # 移除换行符以获得更好的embedding效果
+        return text.replace("\n", " ")
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """粗略估计 token 数：按字符数计，对中文偏保守"""
+        return max(1, len(text))
+
+    def _make_batches(self, texts: List[str]) -> List[List[int]]:
+        """把文本下标打包成批次，每批不超过条数上限和 token 上限"""
+        batches = []
+        current: List[int] = []
+        current_tokens = 0
+        for idx, text in enumerate(texts):
+            tokens = self.estimate_tokens(text)
+            if current and (
+                len(current) >= self.batch_size
+                or current_tokens + tokens > self.max_batch_tokens
+            ):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(idx)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        value = response.headers.get("retry-after")
+        try:
+            return float(value) if value else None
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code in RETRYABLE_STATUS_CODES
+        return False
+
+    def _request(self, batch: List[str]) -> List[List[float]]:
+        """发送一个批次，遇到可重试错误时指数退避"""
+        attempt = 0
+        while True:
+            try:
+                response = self.client.embeddings.create(input=batch, model=self.model)
+                # 按 index 排序，保证与输入顺序一致
+                data = sorted(response.data, key=lambda item: item.index)
+                return [item.embedding for item in data]
+            except Exception as e:
+                if attempt >= self.max_retries or not self._is_retryable(e):
+                    raise
+                delay = self._retry_after(e)
+                if delay is None:
+                    delay = min(30.0, 2**attempt) + random.uniform(0, 1)
+                attempt += 1
+                print(f"Embedding请求失败，{delay:.1f}s 后第 {attempt} 次重试: {e}")
+                time.sleep(delay)
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """批量获取向量，返回顺序与输入一致"""
+        if not texts:
+            return []
+        texts = [self.normalize(text) for text in texts]
+        batches = self._make_batches(texts)
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.concurrency
+        ) as executor:
+            futures = {
+                executor.submit(self._request, [texts[i] for i in batch]): batch
+                for batch in batches
+            }
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    batch = futures[future]
+                    for idx, embedding in zip(batch, future.result()):
+                        results[idx] = embedding
+            except Exception:
+                # 某个批次重试耗尽时取消尚未发出的批次
+                for future in futures:
+                    future.cancel()
+                raise
+
+        return results
+
+    def embed_query(self, text: str) -> List[float]:
+        """获取单条文本的向量"""
+        return self._request([self.normalize(text)])[0]
+
+
+class LocalEmbedder:
+    """在本地 CPU 上运行 sentence-transformers 模型的向量化引擎
+
+    接口与 OpenAIEmbedder 相同，查询向量化不再依赖远程接口。
+    - 模型在第一次向量化时才加载
+    - 按 batch_size 分批，多个批次在线程池中并行编码
+    - quantize 为 True 时对模型的线性层做 int8 动态量化，降低 CPU 推理延迟
+    model 属性是带有后端和量化方式的模型标识，用于 embedding 缓存的键和构建记录，
+    更换模型或量化方式后不会误用之前的向量
+    """
+
+    def __init__(
+        self,
+        model_name: str = LOCAL_EMBEDDING_MODEL,
+        batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE,
+        workers: int = LOCAL_EMBEDDING_WORKERS,
+        quantize: bool = LOCAL_EMBEDDING_QUANTIZE,
+        device: str = "cpu",
+    ):
+        self.model_name = model_name
+        self.model = f"local:{model_name}" + (":int8" if quantize else "")
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.quantize = quantize
+        self.device = device
+        self._model = None
+        self._load_lock = threading.Lock()
+
+    def _load(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+
+                    start = time.perf_counter()
+                    model = SentenceTransformer(self.model_name, device=self.device)
+                    if self.quantize:
+                        import torch
+
+                        model = torch.quantization.quantize_dynamic(
+                            model, {torch.nn.Linear}, dtype=torch.qint8
+                        )
+                    self._model = model
+                    print(
+                        f"本地embedding模型 {self.model} 加载完成，"
+                        f"维度 {self.dimension}，耗时 {time.perf_counter() - start:.1f}s"
+                    )
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        return self._load().get_sentence_embedding_dimension()
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        embeddings = self._load().encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return embeddings.astype("float32").tolist()
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """批量获取向量，返回顺序与输入一致"""
+        if not texts:
+            return []
+        texts = [OpenAIEmbedder.normalize(text) for text in texts]
+        self._load()
+        batches = [
+            texts[start : start + self.batch_size]
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        if len(batches) == 1 or self.workers == 1:
+            return [embedding for batch in batches for embedding in self._encode(batch)]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(self._encode, batches))
+        return [embedding for batch in results for embedding in batch]
+
+    def embed_query(self, text: str) -> List[float]:
+        """获取单条文本的向量"""
+        return self._encode([OpenAIEmbedder.normalize(text)])[0]
+
+
+# 本地模型加载一次需要数秒并占用数百MB内存，按 (模型名, 是否量化) 在进程内共用，
+# 每个 VectorStore（例如重新初始化 Agent 时）不再各自加载一份
+_local_embedders: Dict[Tuple[str, bool], LocalEmbedder] = {}
+_local_embedders_lock = threading.Lock()
+
+
+def create_embedder(
+    backend: str = EMBEDDING_BACKEND,
+    api_key: str = OPENAI_API_KEY,
+    api_base: str = OPENAI_API_BASE,
+):
+    """按配置创建向量化引擎：openai 调用 embeddings 接口，local 使用本地模型（同一模型在进程内共用）"""
+    if backend == "openai":
+        return OpenAIEmbedder(api_key=api_key, api_base=api_base)
+    if backend == "local":
+        key = (LOCAL_EMBEDDING_MODEL, LOCAL_EMBEDDING_QUANTIZE)
+        with _local_embedders_lock:
+            if key not in _local_embedders:
+                _local_embedders[key] = LocalEmbedder(model_name=key[0], quantize=key[1])
+            return _local_embedders[key]
+    raise ValueError(f"未知的embedding后端: {backend}，可选: openai, local")
@@ -0,0 +1,132 @@
+import time
+import threading
+import concurrent.futures
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import EMBEDDING_COALESCE_WAIT_MS, EMBEDDING_COALESCE_MAX_BATCH, EMBEDDING_CONCURRENCY
+
+
+class EmbeddingCoalescer:
+    """把并发到达的单条查询向量化请求合并成批次
+
+    调用方线程把查询放入队列后等待结果；后台线程从第一条查询到达起最多等待
+    max_wait_ms 毫秒（或凑满 max_batch 条），把这期间到达的查询合并成一次
+    embed_batch 调用（一次 embeddings 请求或一次本地模型前向计算），再把向量分发回
+    各个调用方。批次在线程池中发出，前一批尚未返回时下一批照常收集和发送。
+    同一批中相同的文本只计算一次。close 之后不再合并，直接计算。
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], List[List[float]]],
+        max_wait_ms: float = EMBEDDING_COALESCE_WAIT_MS,
+        max_batch: int = EMBEDDING_COALESCE_MAX_BATCH,
+        workers: int = EMBEDDING_CONCURRENCY,
+    ):
+        self.embed_batch = embed_batch
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_batch = max(1, max_batch)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="embedding-batch"
+        )
+        # (文本, 结果, 入队时间)
+        self._pending: List[Tuple[str, concurrent.futures.Future, float]] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        # 批次大小分布和排队耗时
+        self._batch_sizes: Counter = Counter()
+        self.requests = 0
+        self.batches = 0
+        self._wait_total = 0.0
+
+    def embed(self, text: str) -> List[float]:
+        """获取单条文本的向量，与同一时间窗口内的其他请求合并发送"""
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._cond:
+            closed = self._closed
+            if not closed:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="embedding-coalescer", daemon=True
+                    )
+                    self._thread.start()
+                self._pending.append((text, future, time.perf_counter()))
+                self._cond.notify()
+        # 关闭后直接计算，在锁外调用，不与其他请求和统计互相阻塞
+        if closed:
+            return self.embed_batch([text])[0]
+        return future.result()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                deadline = self._pending[0][2] + self.max_wait
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[: self.max_batch]
+                del self._pending[: self.max_batch]
+            self._executor.submit(self._dispatch, batch)
+
+    def close(self) -> None:
+        """立即发出队列中的请求，然后停止后台线程和线程池"""
+        with self._cond:
+            self._closed = True
+            thread = self._thread
+            self._cond.notify()
+        if thread is not None:
+            thread.join()
+        # 已发出的批次在线程池中继续完成
+        self._executor.shutdown(wait=False)
+
+    def _dispatch(self, batch: List[Tuple[str, concurrent.futures.Future, float]]) -> None:
+        start = time.perf_counter()
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        with self._cond:
+            self.requests += len(batch)
+            self.batches += 1
+            self._batch_sizes[len(batch)] += 1
+            self._wait_total += sum(start - queued for _, _, queued in batch)
+        try:
+            embeddings = dict(zip(texts, self.embed_batch(texts)))
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for text, future, _ in batch:
+            future.set_result(embeddings[text])
+
+    @staticmethod
+    def _bucket(size: int) -> str:
+        """批次大小按 2 的幂分桶：1, 2, 3-4, 5-8, ..."""
+        if size <= 2:
+            return str(size)
+        upper = 1 << (size - 1).bit_length()
+        return f"{upper // 2 + 1}-{upper}"
+
+    def stats(self) -> Dict:
+        with self._cond:
+            histogram = Counter()
+            for size, count in self._batch_sizes.items():
+                histogram[self._bucket(size)] += count
+            return {
+                "max_wait_ms": self.max_wait * 1000,
+                "max_batch": self.max_batch,
+                "requests": self.requests,
+                "batches": self.batches,
+                "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+                "avg_queue_ms": (
+                    round(self._wait_total / self.requests * 1000, 2) if self.requests else 0.0
+                ),
+                "batch_size_histogram": dict(
+                    sorted(histogram.items(), key=lambda item: int(item[0].split("-")[0]))
+                ),
+            }
@@ -0,0 +1,324 @@
+import time
+import queue
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from document_loader import DocumentLoader
+from text_splitter import TextSplitter
+from vector_store import VectorStore
+
+from config import INGEST_BATCH_SIZE, INGEST_QUEUE_SIZE, BUILD_CHECKPOINT_INTERVAL
+
+# 队列结束标记
+_DONE = object()
+
+# 检查点回调：(自上个检查点以来完整写入的文件 [(文件路径, 文档块ID列表, 图片路径列表)],
+#              自上个检查点以来部分写入的文件 {文件路径: 新写入的文档块ID列表})
+CheckpointCallback = Callable[
+    [List[Tuple[str, List[str], List[str]]], Dict[str, List[str]]], None
+]
+
+
+class IngestPipeline:
+    """流式构建知识库：加载 → 切分 → 向量化 → 写入
+
+    每个阶段运行在独立线程中，阶段之间通过有界队列连接，下游处理不过来时上游会阻塞，
+    内存中只保留几个批次的数据，与语料总量无关。文档块按固定大小分批写入ChromaDB。
+
+    每隔 checkpoint_interval 秒（以及结束时）保存一次检查点：先持久化BM25索引，
+    再通过 on_checkpoint 回调报告这段时间内完整写入和部分写入的文件，
+    回调记录的进度因此不会超过已持久化的索引。中断后重新构建时，
+    通过 resume 传入各文件已写入的文档块ID，这些文档块不会重复向量化和写入。
+    """
+
+    def __init__(
+        self,
+        loader: DocumentLoader,
+        splitter: TextSplitter,
+        vector_store: VectorStore,
+        batch_size: int = INGEST_BATCH_SIZE,
+        queue_size: int = INGEST_QUEUE_SIZE,
+        checkpoint_interval: float = BUILD_CHECKPOINT_INTERVAL,
+    ):
+        self.loader = loader
+        self.splitter = splitter
+        self.vector_store = vector_store
+        self.batch_size = max(1, batch_size)
+        self.queue_size = max(1, queue_size)
+        self.checkpoint_interval = checkpoint_interval
+        self._resume: Dict[str, Set[str]] = {}
+        self._on_progress: Optional[Callable[[Dict], None]] = None
+        # 各阶段线程都会更新计数器，读写都在锁内进行
+        self._counters: Dict[str, int] = {}
+        self._counters_lock = threading.Lock()
+        self._start_time = 0.0
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _iter_queue(self, q: queue.Queue) -> Iterator:
+        while not self._stop.is_set():
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            yield item
+
+    def _start_stage(self, name: str, items: Iterable, outbox: queue.Queue) -> threading.Thread:
+        """在线程中运行一个阶段，把 items 逐个放入 outbox，结束或出错时放入结束标记"""
+
+        def run():
+            try:
+                for item in items:
+                    if not self._put(outbox, item):
+                        return
+            except BaseException as e:
+                print(f"构建流水线阶段 {name} 出错: {e}")
+                self._errors.append(e)
+                self._stop.set()
+            finally:
+                self._put(outbox, _DONE)
+
+        thread = threading.Thread(target=run, name=f"ingest-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._counters_lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+        self._report()
+
+    def _report(self) -> None:
+        """汇报各阶段进度：文件数、文档块数、吞吐量和预计剩余时间"""
+        if not self._on_progress:
+            return
+        with self._counters_lock:
+            progress = dict(self._counters)
+        elapsed = max(time.perf_counter() - self._start_time, 1e-9)
+        written = progress.get("chunks_written", 0)
+        progress["elapsed_seconds"] = round(elapsed, 1)
+        progress["chunks_per_sec"] = round(written / elapsed, 1)
+        # 按已加载文件的平均文档块数估计本次需要写入的总文档块数
+        loaded = progress["files_loaded"]
+        eta = None
+        if loaded and written:
+            estimated = progress["chunks_split"] / loaded * progress["files_total"]
+            eta = round(max(estimated - written, 0) / (written / elapsed), 1)
+        progress["eta_seconds"] = eta
+        self._on_progress(progress)
+
+    def _load(self, file_paths: List[str]) -> Iterator[Tuple[str, Optional[List[Dict]]]]:
+        image_output_dir = self.loader.image_output_dir
+        for item in self.loader.iter_documents(file_paths, image_output_dir=image_output_dir):
+            self._count("files_loaded")
+            yield item
+
+    def _split(self, loaded: Iterable) -> Iterator[Tuple[str, Optional[List[Dict]]]]:
+        for file_path, documents in loaded:
+            if documents is None:
+                yield file_path, None
+            else:
+                yield file_path, self.splitter.split_documents(documents, show_progress=False)
+
+    def _batch(self, split: Iterable) -> Iterator[Dict]:
+        """把各文件的文档块拼成固定大小的批次
+
+        每个批次记录最后一个文档块落在本批次的文件，写入该批次后这些文件即已完整写入。
+        上次构建已写入的文档块（见 resume）不再放入批次，但仍计入文件的文档块ID。
+        """
+        ids, documents, metadatas, sources = [], [], [], []
+        # [(该文件最后一个文档块在缓冲区中的结束位置, 文件路径)]
+        pending: List[Tuple[int, str]] = []
+        file_info: Dict[str, Tuple[List[str], List[str]]] = {}
+
+        def emit(size: int) -> Dict:
+            nonlocal ids, documents, metadatas, sources, pending
+            files = [path for end, path in pending if end <= size]
+            pending = [(end - size, path) for end, path in pending if end > size]
+            batch = {
+                "ids": ids[:size],
+                "documents": documents[:size],
+                "metadatas": metadatas[:size],
+                "sources": sources[:size],
+                "files": [(path, *file_info.pop(path)) for path in files],
+                "failed_files": [],
+            }
+            ids, documents, metadatas = ids[size:], documents[size:], metadatas[size:]
+            sources = sources[size:]
+            return batch
+
+        for file_path, chunks in split:
+            if chunks is None:
+                yield {
+                    "ids": [],
+                    "documents": [],
+                    "metadatas": [],
+                    "sources": [],
+                    "files": [],
+                    "failed_files": [file_path],
+                }
+                continue
+            file_ids, file_documents, file_metadatas = self.vector_store.prepare_chunks(chunks)
+            # 只记录持久化保存的图片，未开启图片持久化时图片块的 filepath 是源文档
+            images = sorted(
+                {
+                    chunk["filepath"]
+                    for chunk in chunks
+                    if chunk.get("chunk_type") == "image" and chunk["filepath"] != file_path
+                }
+            )
+            file_info[file_path] = (file_ids, images)
+            written = self._resume.get(file_path, ())
+            self._count("chunks_split", len(file_ids) - len(written))
+            for uid, document, metadata in zip(file_ids, file_documents, file_metadatas):
+                if uid in written:
+                    continue
+                ids.append(uid)
+                documents.append(document)
+                metadatas.append(metadata)
+                sources.append(file_path)
+            pending.append((len(ids), file_path))
+            while len(ids) >= self.batch_size:
+                yield emit(self.batch_size)
+
+        if ids or pending:
+            yield emit(len(ids))
+
+    def _embed(self, batches: Iterable[Dict]) -> Iterator[Dict]:
+        for batch in batches:
+            batch["embeddings"] = None
+            if batch["ids"]:
+                try:
+                    batch["embeddings"] = self.vector_store.get_embeddings(batch["documents"])
+                    self._count("chunks_embedded", len(batch["ids"]))
+                except Exception as e:
+                    print(f"向量化失败，跳过 {len(batch['ids'])} 个文档块: {e}")
+            yield batch
+
+    def run(
+        self,
+        file_paths: List[str],
+        on_checkpoint: Optional[CheckpointCallback] = None,
+        resume: Optional[Dict[str, Set[str]]] = None,
+        on_progress: Optional[Callable[[Dict], None]] = None,
+    ) -> Dict[str, int]:
+        """构建指定文件，返回统计信息
+
+        加载、切分或写入失败的文件不会作为完整写入的文件报告，下次构建时会重试。
+        on_progress 会在各阶段线程中被调用，参数为进度快照
+        （files_total / files_loaded / files_done / chunks_split / chunks_embedded /
+        chunks_written / chunks_per_sec / eta_seconds 等）
+        """
+        self._stop.clear()
+        self._errors = []
+        self._resume = resume or {}
+        self._on_progress = on_progress
+        self._start_time = time.perf_counter()
+        self._counters = {
+            "files_total": len(file_paths),
+            "files_loaded": 0,
+            "files_done": 0,
+            "chunks_split": 0,
+            "chunks_embedded": 0,
+            "chunks_written": 0,
+            "chunks_resumed": sum(len(ids) for ids in self._resume.values()),
+        }
+        loaded_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        split_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        embedded_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+
+        threads = [
+            self._start_stage("load", self._load(file_paths), loaded_q),
+            self._start_stage("split", self._split(self._iter_queue(loaded_q)), split_q),
+            self._start_stage(
+                "embed", self._embed(self._batch(self._iter_queue(split_q))), embedded_q
+            ),
+        ]
+
+        stats = {
+            "files": 0,
+            "failed_files": 0,
+            "chunks": 0,
+            "batches": 0,
+            "resumed_chunks": self._counters["chunks_resumed"],
+        }
+        failed: set = set()
+        # 自上个检查点以来完整写入和部分写入的文件
+        completed: List[Tuple[str, List[str], List[str]]] = []
+        partial: Dict[str, List[str]] = {}
+
+        def checkpoint() -> None:
+            nonlocal completed, partial
+            self.vector_store.flush()
+            if on_checkpoint and (completed or partial):
+                on_checkpoint(completed, partial)
+            completed, partial = [], {}
+
+        start_time = last_checkpoint = self._start_time
+        try:
+            # 写入阶段在当前线程中运行，Chroma 和 BM25 索引只在这里修改
+            for batch in self._iter_queue(embedded_q):
+                failed.update(batch["failed_files"])
+                if batch["ids"]:
+                    ok = batch["embeddings"] is not None
+                    if ok:
+                        try:
+                            self.vector_store.upsert_embeddings(
+                                batch["ids"], batch["documents"], batch["embeddings"], batch["metadatas"]
+                            )
+                        except Exception as e:
+                            print(f"写入向量数据库失败: {e}")
+                            ok = False
+                    if ok:
+                        stats["chunks"] += len(batch["ids"])
+                        stats["batches"] += 1
+                        with self._counters_lock:
+                            self._counters["chunks_written"] += len(batch["ids"])
+                        for uid, source in zip(batch["ids"], batch["sources"]):
+                            partial.setdefault(source, []).append(uid)
+                    else:
+                        # 该批次涉及的文件都不完整，下次构建时重试
+                        failed.update(batch["sources"])
+                        failed.update(path for path, _, _ in batch["files"])
+
+                for item in batch["files"]:
+                    partial.pop(item[0], None)
+                    if item[0] not in failed:
+                        completed.append(item)
+                        stats["files"] += 1
+                with self._counters_lock:
+                    self._counters["files_done"] = stats["files"]
+                self._report()
+
+                now = time.perf_counter()
+                elapsed = max(now - start_time, 1e-9)
+                print(
+                    f"已写入 {stats['chunks']} 个文档块, 完成 {stats['files']} 个文件, "
+                    f"{stats['chunks'] / elapsed:.1f} 块/秒"
+                )
+                if now - last_checkpoint >= self.checkpoint_interval:
+                    checkpoint()
+                    last_checkpoint = now
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            # 出错时同样保存已写入的进度
+            checkpoint()
+
+        stats["failed_files"] = len(failed)
+        if self.vector_store.embedding_cache:
+            print(f"Embedding缓存: {self.vector_store.embedding_cache.stats()}")
+        if self._errors:
+            raise self._errors[0]
+        return stats
@@ -0,0 +1,126 @@
+import os
+import json
+import hashlib
+from typing import List, Dict, Optional
+
+
+class BuildManifest:
+    """知识库构建清单
+
+    记录每个源文件的 (路径, 大小, 修改时间, 内容哈希) 以及它写入向量库的
+    文档块ID和提取出的图片，用于增量构建时判断文件是否新增、修改或删除。
+    partial 记录构建中断时只写入了一部分文档块的文件，用于下次构建时断点续传。
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        self.embedding_model: Optional[str] = None
+        self.files: Dict[str, Dict] = {}
+        self.partial: Dict[str, Dict] = {}
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"读取构建清单失败，将重新构建: {e}")
+            return
+        if data.get("version") != self.VERSION:
+            return
+        self.embedding_model = data.get("embedding_model")
+        self.files = data.get("files", {})
+        self.partial = data.get("partial", {})
+
+    def save(self) -> None:
+        """原子写入：先写临时文件再替换"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": self.VERSION,
+                    "embedding_model": self.embedding_model,
+                    "files": self.files,
+                    "partial": self.partial,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, self.path)
+
+    def reset(self) -> None:
+        self.files = {}
+        self.partial = {}
+
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        sha = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def is_unchanged(self, file_path: str, entry: Dict) -> bool:
+        """文件与记录相比是否未变
+
+        大小和修改时间都未变时直接视为未变，否则再比较内容哈希；
+        内容未变（例如重新上传了同一文件）时顺便刷新记录中的文件状态。
+        """
+        stat = os.stat(file_path)
+        if stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]:
+            return True
+        if self.file_hash(file_path) == entry["hash"]:
+            entry["size"] = stat.st_size
+            entry["mtime"] = stat.st_mtime
+            return True
+        return False
+
+    def diff(self, file_paths: List[str]) -> Dict[str, List[str]]:
+        """对比当前文件与清单，返回新增、修改、未变和删除的文件列表"""
+        changes = {"added": [], "updated": [], "skipped": [], "deleted": []}
+        current = set()
+        for file_path in file_paths:
+            current.add(file_path)
+            entry = self.files.get(file_path)
+            if entry is None:
+                changes["added"].append(file_path)
+            elif self.is_unchanged(file_path, entry):
+                changes["skipped"].append(file_path)
+            else:
+                changes["updated"].append(file_path)
+
+        changes["deleted"] = [path for path in self.files if path not in current]
+        return changes
+
+    def _file_state(self, file_path: str) -> Dict:
+        stat = os.stat(file_path)
+        return {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "hash": self.file_hash(file_path),
+        }
+
+    def record(self, file_path: str, ids: List[str], images: List[str]) -> None:
+        """记录已完整写入的文件"""
+        entry = self.partial.pop(file_path, None)
+        state = {key: entry[key] for key in ("size", "mtime", "hash")} if entry else None
+        self.files[file_path] = {
+            **(state or self._file_state(file_path)),
+            "ids": ids,
+            "images": images,
+        }
+
+    def record_partial(self, file_path: str, ids: List[str]) -> None:
+        """记录只写入了一部分文档块的文件，文件状态以第一次记录时为准"""
+        entry = self.partial.get(file_path)
+        if entry is None:
+            entry = self.partial[file_path] = {**self._file_state(file_path), "ids": []}
+        entry["ids"].extend(ids)
+
+    def remove(self, file_path: str) -> Optional[Dict]:
+        return self.files.pop(file_path, None)
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+from ttl_cache import TTLCache
+from config import LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL
+
+
+def normalize_input(text: str) -> str:
+    """规整提示词中的用户输入：合并连续空白并去掉首尾空白"""
+    return " ".join(text.split())
+
+
+class LLMCallCache:
+    """小模型调用（查询扩展、意图分析）的结果缓存
+
+    以 (模型名称, 提示词) 的 sha256 为键，提示词由规整后的输入构造，
+    输入相同的调用直接返回上次的结果，不再请求模型。内存中按 LRU 淘汰，
+    ttl 秒未被访问的条目过期。指定 path 时同时持久化到 SQLite，服务重启后仍然有效。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        ttl: Optional[float] = LLM_CACHE_TTL,
+        path: Optional[str] = None,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl or None
+        self._memory = TTLCache(self.max_entries, self.ttl)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        # 磁盘上的条目数，打开时统计一次，之后随写入和删除更新，不再每次写入都全表计数
+        self._count = 0
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_calls (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_llm_last_access ON llm_calls(last_access)"
+            )
+            self._expire()
+            self._conn.commit()
+            self._count = self._conn.execute("SELECT COUNT(*) FROM llm_calls").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, prompt: str) -> Optional[Any]:
+        key = self.make_key(model, prompt)
+        value = self._memory.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        if self._conn is not None:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, last_access FROM llm_calls WHERE key = ?", (key,)
+                ).fetchone()
+                now = time.time()
+                if row and (not self.ttl or now - row[1] < self.ttl):
+                    self._conn.execute(
+                        "UPDATE llm_calls SET last_access = ? WHERE key = ?", (now, key)
+                    )
+                    self._conn.commit()
+                    self.hits += 1
+                    self.disk_hits += 1
+                    value = json.loads(row[0])
+            if value is not None:
+                self._memory.put(key, value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, model: str, prompt: str, value: Any) -> None:
+        """写入缓存，value 需要能被 JSON 序列化"""
+        key = self.make_key(model, prompt)
+        self._memory.put(key, value)
+        if self._conn is None:
+            return
+        row = (key, json.dumps(value, ensure_ascii=False), time.time())
+        with self._lock:
+            # 新条目才计入条目数，已有的条目原地更新
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO llm_calls (key, value, last_access) VALUES (?, ?, ?)", row
+            ).rowcount
+            if inserted:
+                self._count += inserted
+            else:
+                self._conn.execute(
+                    "UPDATE llm_calls SET value = ?, last_access = ? WHERE key = ?",
+                    (row[1], row[2], key),
+                )
+            if self._count > self.max_entries:
+                self._expire()
+                # 一次淘汰到容量的 90%，避免每次写入都触发淘汰
+                excess = self._count - int(self.max_entries * 0.9)
+                if excess > 0:
+                    self._count -= self._conn.execute(
+                        "DELETE FROM llm_calls WHERE key IN ("
+                        "SELECT key FROM llm_calls ORDER BY last_access ASC LIMIT ?)",
+                        (excess,),
+                    ).rowcount
+            self._conn.commit()
+
+    def _expire(self) -> None:
+        if self.ttl:
+            self._count -= self._conn.execute(
+                "DELETE FROM llm_calls WHERE last_access < ?", (time.time() - self.ttl,)
+            ).rowcount
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import threading
+from typing import List, Dict, Optional, Tuple
+
+
+class OCRCache:
+    """基于 SQLite 的持久化 OCR 结果缓存
+
+    以 (图片字节的 sha256, tesseract 语言, 规整规则版本) 为键，同时保存识别出的
+    文本和"是否为有效文字"的判定，被判定为无效的图片同样会被缓存，不会重复识别。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ocr_results (
+                image_hash TEXT NOT NULL,
+                lang TEXT NOT NULL,
+                version TEXT NOT NULL,
+                text TEXT NOT NULL,
+                valid INTEGER NOT NULL,
+                PRIMARY KEY (image_hash, lang, version)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get_many(
+        self, image_hashes: List[str], lang: str, version: str
+    ) -> Dict[str, Tuple[str, bool]]:
+        """批量查询，返回命中的 {图片哈希: (文本, 是否有效)}"""
+        found: Dict[str, Tuple[str, bool]] = {}
+        unique = list(dict.fromkeys(image_hashes))
+        with self._lock:
+            for start in range(0, len(unique), 500):
+                part = unique[start : start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT image_hash, text, valid FROM ocr_results "
+                    f"WHERE lang = ? AND version = ? AND image_hash IN ({placeholders})",
+                    [lang, version, *part],
+                ).fetchall()
+                for image_hash, text, valid in rows:
+                    found[image_hash] = (text, bool(valid))
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        return found
+
+    def get(self, image_hash: str, lang: str, version: str) -> Optional[Tuple[str, bool]]:
+        return self.get_many([image_hash], lang, version).get(image_hash)
+
+    def put_many(
+        self, results: Dict[str, Tuple[str, bool]], lang: str, version: str
+    ) -> None:
+        if not results:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO ocr_results (image_hash, lang, version, text, valid) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (image_hash, lang, version, text, int(valid))
+                    for image_hash, (text, valid) in results.items()
+                ],
+            )
+            self._conn.commit()
+
+    def put(self, image_hash: str, lang: str, version: str, text: str, valid: bool) -> None:
+        self.put_many({image_hash: (text, valid)}, lang, version)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
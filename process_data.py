@@ -1,39 +1,216 @@
 import os
+import sys
+import copy
+import glob
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
 from document_loader import DocumentLoader
 from text_splitter import TextSplitter
 from vector_store import VectorStore
+from kb_manifest import BuildManifest
+from ingest_pipeline import IngestPipeline
+from collection_registry import CollectionRegistry
 
 from config import DATA_DIR, CHUNK_SIZE, CHUNK_OVERLAP, VECTOR_DB_PATH
 
 
-def main():
+def _images(manifest: BuildManifest) -> Set[str]:
+    return {image for entry in manifest.files.values() for image in entry.get("images", [])}
+
+
+def _manifest_files(
+    registry: CollectionRegistry, collection_name: str, exclude: Iterable[int] = ()
+) -> List[str]:
+    """collection各代（以及旧版本不分代时）的构建清单文件，跳过 exclude 中的代"""
+    paths = [registry.manifest_path(collection_name)]
+    prefix = registry.manifest_path(collection_name, 0).rsplit("@g", 1)[0]
+    for path in glob.glob(glob.escape(prefix) + "@g*.json"):
+        generation = path.rsplit("@g", 1)[1][: -len(".json")]
+        if generation.isdigit() and int(generation) not in exclude:
+            paths.append(path)
+    return [path for path in paths if os.path.exists(path)]
+
+
+def _remove_file(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def main(
+    full_rebuild: bool = False,
+    progress: Optional[Callable[[str, Dict], None]] = None,
+) -> Optional[Dict[str, int]]:
+    """增量构建知识库
+
+    只加载、切分和向量化新增或修改过的文件，并删除已移除文件的文档块。
+    full_rebuild 为 True 时清空向量库后全部重建。
+
+    增量构建直接在当前collection中写入新的一代：只写入变化的文档块，删除的文档块只做标记，
+    BM25索引和本地向量索引用硬链接从当前一代派生，不复制已有的数据。完成后才原子地
+    切换对外检索的代数，构建期间服务端继续读取旧的一代。全量重建、更换了embedding模型
+    或当前collection由旧版本创建（不分代）时写入新的collection，旧版本的collection
+    复制一次后迁移为分代的collection。构建中断时，下次构建会在同一代上继续。
+    progress(stage, info) 用于汇报进度，stage 依次为 copying / syncing / ingesting / swapping。
+    返回各类文件的数量：added / updated / skipped / deleted，本次处理失败的文件数 failed，
+    以及切换后的collection名称 collection
+    """
     if not os.path.exists(DATA_DIR):
         print(f"数据目录不存在: {DATA_DIR}")
         print("请创建数据目录并放入PDF、PPTX、DOCX或TXT文件")
-        return
+        return None
+
+    def report(stage: str, info: Optional[Dict] = None) -> None:
+        if progress:
+            progress(stage, info or {})
 
     # 初始化组件
     loader = DocumentLoader(
         data_dir=DATA_DIR,
     )
     splitter = TextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-    vector_store = VectorStore(db_path=VECTOR_DB_PATH)
-    vector_store.clear_collection()
+    registry = CollectionRegistry(VECTOR_DB_PATH)
+    vector_store = VectorStore(
+        db_path=VECTOR_DB_PATH,
+        collection_name=registry.active,
+        kb_generation=registry.active_generation,
+    )
+    embedding_model = vector_store.embedder.model
+    active_generation = vector_store.kb_generation
+    active_manifest = BuildManifest(registry.manifest_path(registry.active, active_generation))
+
+    # 当前collection分代且embedding模型未变时直接在其中写入新的一代，否则写入新的collection
+    in_place = (
+        not full_rebuild
+        and active_generation is not None
+        and active_manifest.embedding_model == embedding_model
+    )
+    staging, staging_generation, resumed = registry.begin_staging(in_place)
+    if resumed and staging == registry.active and not in_place:
+        # 中断的构建写在当前collection中，但这次需要全量重建或更换了模型：撤销它写入的那一代
+        print(f"放弃上次中断的构建: {staging} 第 {staging_generation} 代")
+        vector_store.rollback_generation(staging_generation)
+        _remove_file(registry.manifest_path(staging, staging_generation))
+        registry.abort_staging()
+        staging, staging_generation, resumed = registry.begin_staging(in_place)
+
+    # 删除上一次构建切换下来的旧collection
+    if registry.previous and registry.previous not in (registry.active, staging):
+        vector_store.drop_collection(registry.previous)
+        for path in _manifest_files(registry, registry.previous):
+            _remove_file(path)
+        registry.previous = None
+        registry.save()
+
+    vector_store.open_collection(staging, staging_generation)
+    manifest_path = registry.manifest_path(staging, vector_store.kb_generation)
+
+    # 清单在派生或复制完成后才写入，没有清单说明上次在这一步中断，需要重新开始
+    manifest = BuildManifest(manifest_path)
+    if not (resumed and os.path.exists(manifest_path)):
+        manifest.reset()
+        if staging == registry.active:
+            # 先物理删除之前各代已删除的文档块，清理不再使用的各代索引和清单，
+            # 再从当前一代派生索引和清单
+            report("copying")
+            vector_store.purge_removed(active_generation)
+            keep = [active_generation, staging_generation]
+            vector_store.remove_stale_generations(keep)
+            for path in _manifest_files(registry, staging, exclude=keep):
+                _remove_file(path)
+            vector_store.fork_indexes(active_generation)
+            manifest.files = copy.deepcopy(active_manifest.files)
+        else:
+            vector_store.clear_collection()
+            if (
+                not full_rebuild
+                and active_generation is None
+                and active_manifest.embedding_model == embedding_model
+            ):
+                # 迁移旧版本不分代的collection：复制一次文档块和向量，不重新调用embedding接口
+                report("copying")
+                copied = vector_store.copy_collection(
+                    registry.active, progress=lambda info: report("copying", info)
+                )
+                if copied:
+                    manifest.files = copy.deepcopy(active_manifest.files)
+        manifest.embedding_model = embedding_model
+        manifest.save()
+    elif staging != registry.active and (
+        # 更换了embedding模型或向量库已被清空时，清单失效，需要全部重建
+        full_rebuild
+        or manifest.embedding_model != embedding_model
+        or ((manifest.files or manifest.partial) and vector_store.get_collection_count() == 0)
+    ):
+        vector_store.clear_collection()
+        manifest.reset()
+        manifest.embedding_model = embedding_model
+    else:
+        print(f"继续上次中断的构建: {staging} 第 {staging_generation} 代")
+
+    report("syncing")
+    changes = manifest.diff(loader.list_files())
+    stats = {name: len(paths) for name, paths in changes.items()}
+    print(
+        f"新增 {stats['added']} 个文件, 修改 {stats['updated']} 个, "
+        f"未变 {stats['skipped']} 个, 删除 {stats['deleted']} 个"
+    )
+
+    # 删除已移除或已修改文件的旧文档块
+    for file_path in changes["deleted"] + changes["updated"]:
+        entry = manifest.remove(file_path)
+        vector_store.delete_documents(entry.get("ids", []))
+    manifest.save()
+
+    # 上次构建中断时部分写入的文件：文件未变时跳过已写入的文档块，否则删除这些文档块后重新处理
+    resume = {}
+    for file_path, entry in list(manifest.partial.items()):
+        if os.path.exists(file_path) and manifest.is_unchanged(file_path, entry):
+            resume[file_path] = set(entry["ids"])
+        else:
+            vector_store.delete_documents(entry["ids"])
+            del manifest.partial[file_path]
+    if resume:
+        print(f"从上次中断处继续构建 {len(resume)} 个文件")
+    manifest.save()
+
+    # 流式加载、切分、向量化并分批写入新增或修改的文件，每个检查点记录已写入的文件和文档块；
+    # 失败的文件不记录为完成，下次构建时重试
+    def on_checkpoint(completed, partial):
+        for file_path, ids in partial.items():
+            manifest.record_partial(file_path, ids)
+        for file_path, ids, images in completed:
+            manifest.record(file_path, ids, images)
+        manifest.save()
+
+    os.makedirs(loader.image_output_dir, exist_ok=True)
+    pipeline = IngestPipeline(loader, splitter, vector_store)
+    try:
+        result = pipeline.run(
+            changes["added"] + changes["updated"],
+            on_checkpoint=on_checkpoint,
+            resume=resume,
+            on_progress=lambda info: report("ingesting", info),
+        )
+    finally:
+        loader.close()
+    print(
+        f"写入 {result['chunks']} 个文档块（续传跳过 {result['resumed_chunks']} 个）, "
+        f"完成 {result['files']} 个文件, 失败 {result['failed_files']} 个文件"
+    )
+    stats["failed"] = result["failed_files"]
 
-    # 加载文档
-    documents = loader.load_all_documents()
-    if not documents:
-        print("未找到任何文档")
-        return
+    # 原子切换对外检索的collection和代数
+    report("swapping")
+    registry.promote()
+    stats["collection"] = staging
+    print(f"已切换到: {staging} 第 {staging_generation} 代")
 
-    # 切分文档
-    chunks = splitter.split_documents(documents)
+    # 图片按内容去重保存，可能被多个文件引用，只删除新清单中不再引用的图片
+    loader.remove_images(sorted(_images(active_manifest) - _images(manifest)))
 
-    # 存储到向量数据库
-    vector_store.add_documents(chunks)
-    
     print("\n数据处理完成！可以运行main.py开始对话")
+    return stats
 
 
 if __name__ == "__main__":
-    main()
+    main(full_rebuild="--full" in sys.argv[1:])
@@ -38,12 +38,20 @@ const preprocessLaTeX = (content: string) => {
 
 type Tab = "chat" | "quiz" | "outline" | "settings" | "knowledge-base";
 
+// 每个对话使用独立的会话ID，后端按会话保存检索上下文
+const newSessionId = () =>
+  typeof crypto !== "undefined" && crypto.randomUUID
+    ? crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
 export default function Home() {
   const [activeTab, setActiveTab] = useState<Tab>("chat");
   const [messages, setMessages] = useState<Message[]>([]);
+  const [sessionId, setSessionId] = useState(newSessionId);
   const [input, setInput] = useState("");
   const [isLoading, setIsLoading] = useState(false);
   const [isBuilding, setIsBuilding] = useState(false);
+  const [buildProgress, setBuildProgress] = useState("");
   
   // Knowledge Base State
   const [files, setFiles] = useState<KBFile[]>([]);
@@ -79,8 +87,29 @@ export default function Home() {
     scrollToBottom();
   }, [messages, activeTab]);
 
+  const formatBuildProgress = (job: any) => {
+    const p = job.progress || {};
+    switch (job.stage) {
+      case "copying":
+        return p.total ? `复制旧索引 ${p.copied || 0}/${p.total}` : "复制旧索引...";
+      case "syncing":
+        return "检查文件变化...";
+      case "ingesting": {
+        let text = `文件 ${p.files_done || 0}/${p.files_total || 0} · 已写入 ${p.chunks_written || 0} 块`;
+        if (p.chunks_per_sec) text += ` · ${p.chunks_per_sec} 块/秒`;
+        if (p.eta_seconds != null) text += ` · 剩余约 ${Math.ceil(p.eta_seconds)} 秒`;
+        return text;
+      }
+      case "swapping":
+        return "切换索引...";
+      default:
+        return "构建中...";
+    }
+  };
+
   const handleBuildKB = async () => {
     setIsBuilding(true);
+    setBuildProgress("");
     try {
       const response = await fetch("http://localhost:8000/build-kb", {
         method: "POST",
@@ -89,13 +118,31 @@ export default function Home() {
         const errorData = await response.json().catch(() => ({}));
         throw new Error(errorData.detail || "Failed to build knowledge base");
       }
-      const data = await response.json();
-      alert(data.message || "知识库构建成功！");
+      const { job_id } = await response.json();
+
+      // 构建在后台进行，轮询任务状态直到结束
+      while (true) {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const statusResponse = await fetch(`http://localhost:8000/build-kb/${job_id}`);
+        if (!statusResponse.ok) {
+          throw new Error("无法获取构建进度");
+        }
+        const job = await statusResponse.json();
+        if (job.status === "succeeded") {
+          alert(job.result?.message || "知识库构建成功！");
+          break;
+        }
+        if (job.status === "failed") {
+          throw new Error(job.error || "Failed to build knowledge base");
+        }
+        setBuildProgress(formatBuildProgress(job));
+      }
     } catch (error: any) {
       console.error("Error building KB:", error);
       alert(`构建知识库失败: ${error.message}`);
     } finally {
       setIsBuilding(false);
+      setBuildProgress("");
       setShowRebuildConfirm(false);
     }
   };
@@ -238,6 +285,7 @@ export default function Home() {
         body: JSON.stringify({
           query: userMessage.content,
           history: messages, // 传递历史记录
+          session_id: sessionId,
         }),
       });
 
@@ -461,7 +509,10 @@ export default function Home() {
             <header className="bg-white shadow-sm p-4 border-b flex justify-between items-center">
               <h2 className="text-lg font-semibold text-gray-800">课程智能助手</h2>
               <button
-                onClick={() => setMessages([])}
+                onClick={() => {
+                  setMessages([]);
+                  setSessionId(newSessionId());
+                }}
                 className="flex items-center gap-2 px-3 py-1.5 text-sm text-gray-600 hover:text-gray-900 hover:bg-gray-100 rounded-lg transition-colors"
                 title="开启新对话"
               >
@@ -754,7 +805,7 @@ export default function Home() {
                   ) : (
                     <RefreshCw className="w-4 h-4" />
                   )}
-                  {isBuilding ? "构建中..." : "重建索引"}
+                  {isBuilding ? buildProgress || "构建中..." : "重建索引"}
                 </button>
                 <label className="flex items-center gap-2 px-4 py-2 bg-blue-600 text-white rounded-lg hover:bg-blue-700 cursor-pointer transition-colors shadow-sm">
                   <Upload className="w-4 h-4" />
@@ -1,8 +1,14 @@
-from typing import List, Dict, Optional, Tuple, Any
+from typing import List, Dict, Optional, Tuple, Any, AsyncIterator
+import os
 import json
+import time
+import uuid
+import asyncio
+import threading
 import concurrent.futures
 
-from openai import OpenAI
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
 
 from config import (
     OPENAI_API_KEY,
@@ -10,8 +16,31 @@ from config import (
     MODEL_NAME,
     FAST_MODEL_NAME,
     TOP_K,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE_CONNECTIONS,
+    RETRIEVAL_WORKERS,
+    SPECULATIVE_RETRIEVAL,
+    SPECULATIVE_MIN_OVERLAP,
+    ANSWER_CACHE_MAX_ENTRIES,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_PERSIST,
+    RETRIEVAL_MODE,
+    RETRIEVAL_CANDIDATES,
+    RERANK_MODEL,
+    RERANK_TOP_K,
 )
 from vector_store import VectorStore
+from session_store import SessionStore
+from answer_cache import SemanticAnswerCache
+from llm_cache import LLMCallCache, normalize_input
+from reranker import CrossEncoderReranker
+from context_packer import ContextPacker
+
+
+def create_llm_cache(db_path: str) -> LLMCallCache:
+    """按配置创建小模型调用缓存，开启 LLM_CACHE_PERSIST 时持久化到向量数据库目录"""
+    path = os.path.join(db_path, "llm_cache.sqlite3") if LLM_CACHE_PERSIST else None
+    return LLMCallCache(path=path)
 
 
 class RAGAgent:
@@ -19,17 +48,69 @@ class RAGAgent:
         self,
         model: str = MODEL_NAME,
         fast_model: str = FAST_MODEL_NAME,
+        sessions: Optional[SessionStore] = None,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        llm_cache: Optional[LLMCallCache] = None,
+        reranker: Optional[CrossEncoderReranker] = None,
     ):
         self.model = model
         self.fast_model = fast_model
 
-        self.client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_API_BASE)
+        # 同步客户端供命令行对话、习题和提纲使用；异步客户端供 API 服务的 /chat 使用，
+        # 并发请求共享同一个连接池，复用 keep-alive 连接
+        limits = httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        )
+        self.client = OpenAI(
+            api_key=OPENAI_API_KEY,
+            base_url=OPENAI_API_BASE,
+            http_client=DefaultHttpxClient(limits=limits),
+        )
+        self.async_client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            base_url=OPENAI_API_BASE,
+            http_client=DefaultAsyncHttpxClient(limits=limits),
+        )
 
         self.vector_store = VectorStore()
-
-        # 上下文窗口：存储检索到的文档片段
-        # 格式：[{"content": "...", "metadata": {...}}, ...]
-        self.context_window: List[Dict] = []
+        # 知识库由其他embedding模型构建时查询向量与库中向量不可比，直接报错
+        self.vector_store.check_embedding_model()
+        # 检索（查询向量化 + 向量库查询）是同步阻塞的，异步接口把它放到线程池中执行
+        self.retrieval_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, RETRIEVAL_WORKERS), thread_name_prefix="retrieval"
+        )
+        # 正在使用该 Agent 的请求数；API 服务替换 Agent 后，旧的 Agent 等这些请求结束再释放资源
+        self._users = 0
+        self._closing = False
+        self._users_lock = threading.Lock()
+        # 异步客户端的连接绑定在使用它的事件循环上，需要在该循环中关闭
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        # 推测检索：意图分析的同时先用原始问题检索
+        self.speculative_retrieval = SPECULATIVE_RETRIEVAL
+        # 语义答案缓存，ANSWER_CACHE_MAX_ENTRIES 为 0 时关闭
+        self.answer_cache = answer_cache
+        if self.answer_cache is None and ANSWER_CACHE_MAX_ENTRIES > 0:
+            self.answer_cache = SemanticAnswerCache()
+        # 查询扩展和意图分析的结果缓存，LLM_CACHE_MAX_ENTRIES 为 0 时关闭
+        self.llm_cache = llm_cache
+        if self.llm_cache is None and LLM_CACHE_MAX_ENTRIES > 0:
+            self.llm_cache = create_llm_cache(self.vector_store.db_path)
+        # 检索流水线：向量检索和 BM25 检索多取候选并融合，再用 cross-encoder 重排，
+        # 只把最相关的片段交给大模型。RERANK_MODEL 为空时不重排
+        if RETRIEVAL_MODE not in ("hybrid", "dense"):
+            raise ValueError(f"未知的检索方式: {RETRIEVAL_MODE}，可选: hybrid, dense")
+        self.retrieval_mode = RETRIEVAL_MODE
+        self.reranker = reranker
+        if self.reranker is None and RERANK_MODEL:
+            self.reranker = CrossEncoderReranker()
+
+        # 按 token 预算打包上下文，片段的 token 数按ID缓存，句子的相关性用 BM25 的分词器计算
+        self.context_packer = ContextPacker(tokenize=self.vector_store.tokenizer.tokenize)
+
+        # 上下文窗口：每个会话保存检索到的文档片段ID，按会话ID隔离
+        # 传入共享的 SessionStore 时，重新初始化 Agent 后会话仍然保留
+        self.sessions = sessions or SessionStore()
         self.max_window_size = 15  # 最大保留的文档片段数量
 
         """
@@ -54,9 +135,48 @@ class RAGAgent:
         6. 安全与隐私：不解答与课程无关的敏感话题，尊重学生隐私，遵守学术诚信原则。
         """
 
-    def reset_context(self):
-        """重置上下文窗口"""
-        self.context_window = []
+    def acquire(self) -> bool:
+        """请求开始使用 Agent，请求结束（包括流式响应结束）时调用 release；已关闭时返回 False"""
+        with self._users_lock:
+            if self._closing:
+                return False
+            self._users += 1
+        return True
+
+    def release(self) -> None:
+        with self._users_lock:
+            self._users -= 1
+            idle = self._closing and self._users == 0
+        if idle:
+            self._release_resources()
+
+    def close(self) -> None:
+        """释放检索线程池、查询向量化的合并线程和大模型客户端的连接池；
+        仍有请求在使用时等最后一个请求结束后释放"""
+        with self._users_lock:
+            if self._closing:
+                return
+            self._closing = True
+            idle = self._users == 0
+        if idle:
+            self._release_resources()
+
+    def _release_resources(self) -> None:
+        self.retrieval_executor.shutdown(wait=False)
+        self.vector_store.close()
+        self.client.close()
+        loop = self._async_loop
+        if loop is not None and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self.async_client.close(), loop)
+
+    async def _async_completion(self, **kwargs):
+        """用异步客户端调用大模型，记录其连接所在的事件循环"""
+        self._async_loop = asyncio.get_running_loop()
+        return await self.async_client.chat.completions.create(**kwargs)
+
+    def reset_context(self, session_id: str):
+        """重置会话的上下文窗口"""
+        self.sessions.reset(session_id)
 
     def _expand_query(self, topic: str, task_type: str) -> str:
         """
@@ -66,6 +186,7 @@ class RAGAgent:
         if not topic:
             return "课程核心知识点"
 
+        topic = normalize_input(topic)
         prompt = ""
         if task_type == "quiz":
             prompt = f"""
@@ -84,6 +205,11 @@ class RAGAgent:
             请直接返回扩展后的查询字符串，用空格分隔，不要包含其他解释。
             """
 
+        cached = self._cached_llm_call(prompt)
+        if cached is not None:
+            print(f"[Debug] 原始主题: {topic}, 扩展查询(缓存): {cached}")
+            return cached
+
         try:
             response = self.client.chat.completions.create(
                 model=self.fast_model,
@@ -92,25 +218,30 @@ class RAGAgent:
             )
             expanded_query = response.choices[0].message.content.strip()
             print(f"[Debug] 原始主题: {topic}, 扩展查询: {expanded_query}")
+            self._cache_llm_call(prompt, expanded_query)
             return expanded_query
         except Exception as e:
             print(f"查询扩展失败: {e}")
             return topic
 
-    def analyze_intent(self, query: str, chat_history: List[Dict]) -> Dict:
-        """
-        使用小模型分析用户意图并重写查询
-        返回格式: {"intent": "...", "rewritten_query": "..."}
-        """
-        # 如果没有历史记录，直接视为新话题，不需要重写
-        if not chat_history:
-            return {"intent": "NEW_TOPIC", "rewritten_query": query}
+    def _cached_llm_call(self, prompt: str) -> Optional[Any]:
+        """查询小模型调用的缓存结果"""
+        if not self.llm_cache:
+            return None
+        return self.llm_cache.get(self.fast_model, prompt)
+
+    def _cache_llm_call(self, prompt: str, result: Any) -> None:
+        if self.llm_cache:
+            self.llm_cache.put(self.fast_model, prompt, result)
 
+    def _intent_prompt(self, query: str, chat_history: List[Dict]) -> str:
+        """构造意图分析的提示词，输入先规整空白，相同的输入得到相同的提示词"""
         # 提取最近几轮对话作为上下文参考
         recent_history = chat_history[-4:]  # 取最近2轮对话（4条消息）
         history_text = "\n".join(
-            [f"{msg['role']}: {msg['content']}" for msg in recent_history]
+            [f"{msg['role']}: {normalize_input(msg['content'])}" for msg in recent_history]
         )
+        query = normalize_input(query)
 
         prompt = f"""
         你是一个对话分析助手。请分析用户的最新问题，结合对话历史，判断用户意图并重写查询。
@@ -136,6 +267,21 @@ class RAGAgent:
         
         注意：只返回 JSON，不要包含 Markdown 标记。
         """
+        return prompt
+
+    def analyze_intent(self, query: str, chat_history: List[Dict]) -> Dict:
+        """
+        使用小模型分析用户意图并重写查询
+        返回格式: {"intent": "...", "rewritten_query": "..."}
+        """
+        # 如果没有历史记录，直接视为新话题，不需要重写
+        if not chat_history:
+            return {"intent": "NEW_TOPIC", "rewritten_query": query}
+
+        prompt = self._intent_prompt(query, chat_history)
+        cached = self._cached_llm_call(prompt)
+        if cached is not None:
+            return cached
 
         try:
             response = self.client.chat.completions.create(
@@ -145,48 +291,129 @@ class RAGAgent:
                 response_format={"type": "json_object"},
             )
             result = json.loads(response.choices[0].message.content)
+            self._cache_llm_call(prompt, result)
             return result
         except Exception as e:
             print(f"意图分析失败: {e}")
             # 降级策略：默认视为新话题
             return {"intent": "NEW_TOPIC", "rewritten_query": query}
 
-    def update_context_window(self, new_docs: List[Dict], intent: str):
-        """根据意图更新上下文窗口"""
+    async def analyze_intent_async(self, query: str, chat_history: List[Dict]) -> Dict:
+        """analyze_intent 的异步版本，等待模型响应时不阻塞事件循环"""
+        if not chat_history:
+            return {"intent": "NEW_TOPIC", "rewritten_query": query}
+
+        prompt = self._intent_prompt(query, chat_history)
+        cached = self._cached_llm_call(prompt)
+        if cached is not None:
+            return cached
+
+        try:
+            response = await self._async_completion(
+                model=self.fast_model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.1,
+                response_format={"type": "json_object"},
+            )
+            result = json.loads(response.choices[0].message.content)
+            self._cache_llm_call(prompt, result)
+            return result
+        except Exception as e:
+            print(f"意图分析失败: {e}")
+            return {"intent": "NEW_TOPIC", "rewritten_query": query}
+
+    def update_context_window(
+        self, new_docs: List[Dict], intent: str, window: List[str]
+    ) -> List[str]:
+        """根据意图更新上下文窗口，返回新窗口中的文档片段ID"""
+        new_ids = [doc["id"] for doc in new_docs]
         if intent == "NEW_TOPIC":
-            self.context_window = new_docs
+            return new_ids
         elif intent == "CLARIFICATION":
             # 替换策略：清空旧的，放入新的（或者更复杂的替换逻辑）
-            self.context_window = new_docs
+            return new_ids
         elif intent in ["DRILL_DOWN", "TOPIC_SHIFT", "SUMMARIZATION"]:
             # 追加策略：去重后追加内容
-            existing_ids = {
-                f"{d['metadata'].get('filename')}_{d['metadata'].get('page_number')}_{d.get('content')[:20]}"
-                for d in self.context_window
-            }
-
-            for doc in new_docs:
-                doc_id = f"{doc['metadata'].get('filename')}_{doc['metadata'].get('page_number')}_{doc.get('content')[:20]}"
-                if doc_id not in existing_ids:
-                    self.context_window.append(doc)
+            window = list(window)
+            existing_ids = set(window)
+            for uid in new_ids:
+                if uid not in existing_ids:
+                    window.append(uid)
+                    existing_ids.add(uid)
 
             # 保持窗口大小限制 (FIFO)
-            if len(self.context_window) > self.max_window_size:
-                self.context_window = self.context_window[-self.max_window_size :]
+            return window[-self.max_window_size :]
 
         # CHIT_CHAT 不需要更新窗口
+        return list(window)
 
     def retrieve_context(
-        self, query: str, top_k: int = TOP_K
+        self,
+        query: str,
+        top_k: int = TOP_K,
+        known_docs: Optional[List[Dict]] = None,
+        keep: Optional[int] = None,
     ) -> Tuple[str, List[Dict]]:
-        """检索相关上下文"""
-        retrieved_docs = self.vector_store.search(query, top_k=top_k)
-        if not retrieved_docs:
+        """检索相关上下文
+
+        known_docs: 已取回的文档片段，检索结果中包含的片段不再从向量库读取内容
+        keep: 重排后保留的片段数，默认为 top_k
+        """
+        # 只保留内容和元数据，上一次检索的各项得分不带入本次结果
+        known = (
+            {
+                doc["id"]: {"id": doc["id"], "content": doc["content"], "metadata": doc["metadata"]}
+                for doc in known_docs
+            }
+            if known_docs
+            else None
+        )
+        candidates = self._retrieve_candidates(query, top_k, known)
+        if not candidates:
             return "", []
+        retrieved_docs = self._rerank(query, candidates, top_k if keep is None else keep)
 
         # 格式化逻辑提取出来，方便复用
         return self._format_context(retrieved_docs), retrieved_docs
 
+    def _retrieve_candidates(
+        self, query: str, top_k: int, known: Optional[Dict[str, Dict]]
+    ) -> List[Dict]:
+        """按检索方式取回候选片段，需要重排时多取 RETRIEVAL_CANDIDATES 个"""
+        fetch_k = top_k
+        if self.reranker is not None and self.reranker.enabled:
+            fetch_k = max(top_k, RETRIEVAL_CANDIDATES)
+        if self.retrieval_mode == "hybrid":
+            return self.vector_store.hybrid_search(
+                query, top_k=fetch_k, vector_k=fetch_k, bm25_k=fetch_k, known=known
+            )
+        return self.vector_store.search(query, top_k=fetch_k, known=known)
+
+    def _rerank(self, query: str, candidates: List[Dict], keep: int) -> List[Dict]:
+        """重排候选片段，保留最相关的 keep 个；无法重排时保留融合后的前 keep 个"""
+        if self.reranker is None:
+            return candidates[:keep]
+        reranked, done = self.reranker.rerank(query, candidates, keep)
+        return reranked if done else candidates[:keep]
+
+    def _chat_keep(self, top_k: int) -> int:
+        """对话时重排后保留的片段数：启用重排时最多 RERANK_TOP_K 个，习题和提纲按各自的 top_k 保留"""
+        if self.reranker is None or RERANK_TOP_K <= 0:
+            return top_k
+        return min(top_k, RERANK_TOP_K)
+
+    def _pack_context(self, query: str, docs: List[Dict]) -> Tuple[str, Dict]:
+        """按 token 预算打包文档片段（docs 按相关性从高到低排列）并格式化，返回 (上下文, 统计)"""
+        packed, report = self.context_packer.pack(query, docs)
+        if docs:
+            print(
+                f"[Debug] 上下文打包: {report['kept']}/{report['docs']} 个片段"
+                f"（裁剪 {report['trimmed']} 个，重复句子 {report['duplicate_sentences']} 句），"
+                f"{report['original_tokens']} -> {report['packed_tokens']} tokens，"
+                f"节省 {report['saved_tokens']}"
+            )
+        return (self._format_context(packed) if packed else ""), report
+
     def _format_context(self, docs: List[Dict]) -> str:
         """将文档列表格式化为字符串"""
         context_parts = []
@@ -204,21 +431,10 @@ class RAGAgent:
 
         return "\n\n".join(context_parts)
 
-    def generate_response(
-        self,
-        query: str,
-        context: str,
-        chat_history: Optional[List[Dict]] = None,
-        stream: bool = False,
-    ) -> str:
-        """生成回答
-
-        参数:
-            query: 用户问题
-            context: 检索到的上下文
-            chat_history: 对话历史
-            stream: 是否流式输出
-        """
+    def _build_messages(
+        self, query: str, context: str, chat_history: Optional[List[Dict]] = None
+    ) -> List[Dict]:
+        """构造生成回答的消息列表：系统提示词 + 对话历史 + 用户提示词"""
         messages = [{"role": "system", "content": self.system_prompt}]
 
         if chat_history:
@@ -252,6 +468,25 @@ class RAGAgent:
         # })
         # messages.append({"role": "user", "content": content_parts})
 
+        return messages
+
+    def generate_response(
+        self,
+        query: str,
+        context: str,
+        chat_history: Optional[List[Dict]] = None,
+        stream: bool = False,
+    ) -> str:
+        """生成回答
+
+        参数:
+            query: 用户问题
+            context: 检索到的上下文
+            chat_history: 对话历史
+            stream: 是否流式输出
+        """
+        messages = self._build_messages(query, context, chat_history)
+
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
@@ -269,6 +504,33 @@ class RAGAgent:
         except Exception as e:
             return f"生成回答时出错: {str(e)}"
 
+    async def generate_response_async(
+        self,
+        query: str,
+        context: str,
+        chat_history: Optional[List[Dict]] = None,
+        stream: bool = False,
+    ) -> Any:
+        """generate_response 的异步版本，stream=True 时返回异步流"""
+        messages = self._build_messages(query, context, chat_history)
+
+        try:
+            response = await self._async_completion(
+                model=self.model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=1500,
+                seed=1024,
+                stream=stream,
+            )
+
+            if stream:
+                return response
+            else:
+                return response.choices[0].message.content
+        except Exception as e:
+            return f"生成回答时出错: {str(e)}"
+
     def _generate_single_question(
         self, topic: str, difficulty: str, question_type: str, context: str, index: int
     ) -> Dict:
@@ -320,7 +582,8 @@ class RAGAgent:
 
         # 1. 扩展查询并检索相关上下文
         search_query = self._expand_query(topic, "quiz")
-        context, _ = self.retrieve_context(search_query, top_k=10)
+        _, docs = self.retrieve_context(search_query, top_k=10)
+        context, _ = self._pack_context(search_query, docs)
 
         # 2. 并行生成题目
         questions = []
@@ -357,7 +620,8 @@ class RAGAgent:
         )
 
         # 2. Retrieve context
-        context, _ = self.retrieve_context(search_query, top_k=15)
+        _, docs = self.retrieve_context(search_query, top_k=15)
+        context, _ = self._pack_context(search_query, docs)
 
         outline_system_prompt = """
         你是一个专业的课程助教。请根据提供的课程资料和用户的主题（如果有），生成一个结构化的复习提纲。
@@ -409,6 +673,7 @@ class RAGAgent:
         chat_history: Optional[List[Dict]] = None,
         top_k: int = TOP_K,
         stream: bool = False,
+        session_id: Optional[str] = None,
     ) -> Any:
         """回答问题
 
@@ -417,37 +682,58 @@ class RAGAgent:
             chat_history: 对话历史
             top_k: 检索文档数量
             stream: 是否流式输出
+            session_id: 会话ID，用于保存多轮对话的上下文窗口；为空时只使用本轮检索结果
 
         返回:
             生成的回答 (字符串或生成器)
         """
-        # 0. 如果是新对话，重置上下文窗口
-        if not chat_history:
-            self.reset_context()
+        timings: Dict[str, float] = {}
+        start = time.perf_counter()
 
-        # 1. 使用小模型分析意图和重写查询
-        analysis_result = self.analyze_intent(query, chat_history)
+        # 0. 独立的问题（没有对话历史）先查语义答案缓存
+        (cached_answer, cache_info), timings["answer_cache"] = self._timed(
+            self._lookup_answer, query, chat_history, session_id
+        )
+        if cached_answer is not None:
+            return self._replay_answer(cached_answer) if stream else cached_answer
+
+        # 1. 使用小模型分析意图和重写查询，同时用原始问题进行推测检索
+        speculative = None
+        if self.speculative_retrieval:
+            speculative = self.retrieval_executor.submit(
+                self._timed, self.retrieve_context, query, top_k, None, self._chat_keep(top_k)
+            )
+        analysis_result, timings["intent"] = self._timed(
+            self.analyze_intent, query, chat_history
+        )
         intent = analysis_result.get("intent", "NEW_TOPIC")
         rewritten_query = analysis_result.get("rewritten_query", query)
 
         print(f"[Debug] 意图: {intent}, 重写查询: {rewritten_query}")
-        
-        # 2. 根据意图决定是否检索
-        if intent != "CHIT_CHAT":
-            # 使用重写后的查询进行检索
-            _, new_docs = self.retrieve_context(rewritten_query, top_k=top_k)
-
-            # 3. 更新上下文窗口
-            self.update_context_window(new_docs, intent)
-
-        # 4. 构建最终上下文 (从窗口中获取)
-        if self.context_window:
-            context = self._format_context(self.context_window)
-        else:
-            context = "（未检索到特别相关的课程材料）"
-        
-        print(f"\n[调试] 检索到的上下文:\n{context}\n")
 
+        # 2. 等待推测检索的结果
+        speculative_docs = None
+        if speculative is not None:
+            if intent == "CHIT_CHAT":
+                speculative.cancel()
+            else:
+                wait_start = time.perf_counter()
+                speculative_docs = self._speculative_result(speculative.result, timings)
+                timings["speculative_wait"] = self._elapsed_ms(wait_start)
+
+        # 3. 根据意图决定是否检索，更新会话的上下文窗口，构建最终上下文 (从窗口中获取)
+        context, outcome, window, packing = self._build_context(
+            query,
+            intent,
+            rewritten_query,
+            top_k,
+            speculative_docs,
+            chat_history,
+            session_id,
+            timings,
+        )
+        timings["prepare"] = self._elapsed_ms(start)
+        print(f"[Debug] 推测检索: {outcome}, 阶段耗时: {self.format_timings(timings)}")
 
         # 5. 生成回答 (使用大模型)
         response = self.generate_response(
@@ -457,17 +743,342 @@ class RAGAgent:
         if stream:
             # 如果是流式，返回一个生成器
             def stream_generator():
+                parts = []
                 try:
                     for chunk in response:
                         if chunk.choices[0].delta.content is not None:
+                            parts.append(chunk.choices[0].delta.content)
                             yield chunk.choices[0].delta.content
                 except Exception as e:
                     yield f"生成回答时出错: {str(e)}"
+                    return
+                # 完整生成的回答才写入缓存
+                self._store_answer(cache_info, "".join(parts), window)
 
             return stream_generator()
         else:
+            if not response.startswith("生成回答时出错"):
+                self._store_answer(cache_info, response, window)
             return response
 
+    @staticmethod
+    def _elapsed_ms(start: float) -> float:
+        return (time.perf_counter() - start) * 1000
+
+    @classmethod
+    def _timed(cls, func, *args):
+        """调用 func 并返回 (结果, 耗时毫秒)"""
+        start = time.perf_counter()
+        result = func(*args)
+        return result, cls._elapsed_ms(start)
+
+    @staticmethod
+    def format_timings(timings: Dict[str, float]) -> str:
+        """按 Server-Timing 头的格式输出各阶段耗时"""
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in timings.items())
+
+    @staticmethod
+    def _speculative_result(get_result, timings: Dict[str, float]) -> Optional[List[Dict]]:
+        """取出推测检索的文档片段，检索失败时返回 None，改为按重写后的查询检索"""
+        try:
+            (_, docs), timings["speculative"] = get_result()
+            return docs
+        except Exception as e:
+            print(f"推测检索失败: {e}")
+            return None
+
+    def _lookup_answer(
+        self,
+        query: str,
+        chat_history: Optional[List[Dict]],
+        session_id: Optional[str],
+    ) -> Tuple[Optional[str], Optional[Dict]]:
+        """查询语义答案缓存，返回 (缓存的回答, 未命中时写入缓存所需的信息)
+
+        只缓存独立的问题：有对话历史时回答依赖上下文，不查也不写缓存。
+        命中时把会话的上下文窗口设为生成该回答时的窗口，后续追问仍能沿用检索结果。
+        """
+        if not self.answer_cache or chat_history:
+            return None, None
+        version = self.vector_store.version
+        entry, embedding = self.answer_cache.lookup(
+            version, query, self.vector_store.get_embedding
+        )
+        if entry is not None:
+            print(f"[Debug] 命中答案缓存: {query}")
+            if session_id:
+                self.sessions.set_window(session_id, entry["doc_ids"])
+            return entry["answer"], None
+        if embedding is None:
+            return None, None
+        return None, {"version": version, "query": query, "embedding": embedding}
+
+    def _store_answer(self, cache_info: Optional[Dict], answer: str, window: List[str]) -> None:
+        if cache_info and answer:
+            self.answer_cache.put(
+                cache_info["version"], cache_info["query"], cache_info["embedding"], answer, window
+            )
+
+    @staticmethod
+    def _replay_answer(answer: str, chunk_size: int = 32):
+        """把缓存的回答按流式接口的格式分段输出"""
+        for start in range(0, len(answer), chunk_size):
+            yield answer[start : start + chunk_size]
+
+    def _is_same_query(self, query: str, rewritten_query: str) -> bool:
+        """重写后的查询与原始问题是否基本相同（分词后的 Jaccard 重合度达到阈值）"""
+        if query.strip() == rewritten_query.strip():
+            return True
+        tokenize = self.vector_store.tokenizer.tokenize
+        a, b = set(tokenize(query)), set(tokenize(rewritten_query))
+        if not a or not b:
+            return False
+        return len(a & b) / len(a | b) >= SPECULATIVE_MIN_OVERLAP
+
+    def _build_context(
+        self,
+        query: str,
+        intent: str,
+        rewritten_query: str,
+        top_k: int,
+        speculative_docs: Optional[List[Dict]],
+        chat_history: Optional[List[Dict]],
+        session_id: Optional[str],
+        timings: Dict[str, float],
+    ) -> Tuple[str, str, List[str], Dict]:
+        """检索（尽量复用推测检索的结果）并构建最终上下文
+
+        返回 (上下文, 推测检索的结果, 上下文窗口中的文档片段ID, 上下文打包统计)：hit 直接复用，
+        delta 按重写后的查询检索但只读取推测检索中没有的文档片段，
+        miss 未使用推测检索，skip 不需要检索
+        """
+        new_docs = []
+        outcome = "skip"
+        if intent != "CHIT_CHAT":
+            if speculative_docs is not None and (
+                intent == "NEW_TOPIC" or self._is_same_query(query, rewritten_query)
+            ):
+                new_docs, outcome = speculative_docs, "hit"
+            else:
+                # 使用重写后的查询进行检索
+                outcome = "miss" if speculative_docs is None else "delta"
+                (_, new_docs), timings["retrieval"] = self._timed(
+                    self.retrieve_context,
+                    rewritten_query,
+                    top_k,
+                    speculative_docs,
+                    self._chat_keep(top_k),
+                )
+
+        (context, window, packing), timings["context"] = self._timed(
+            self._session_context, session_id, chat_history, intent, new_docs, rewritten_query
+        )
+        return context, outcome, window, packing
+
+    def _window_docs(self, window: List[str], known_docs: List[Dict]) -> List[Dict]:
+        """取回窗口中的文档片段，本轮检索到的直接使用，其余的按ID从向量库读取"""
+        known = {doc["id"]: doc for doc in known_docs}
+        missing = [uid for uid in window if uid not in known]
+        for doc in self.vector_store.get_documents(missing):
+            known[doc["id"]] = doc
+        # 重新构建知识库后已不存在的文档片段被跳过
+        return [known[uid] for uid in window if uid in known]
+
+    def _session_context(
+        self,
+        session_id: Optional[str],
+        chat_history: Optional[List[Dict]],
+        intent: str,
+        new_docs: List[Dict],
+        query: str,
+    ) -> Tuple[str, List[str], Dict]:
+        """更新会话的上下文窗口并构建最终上下文，返回 (上下文, 窗口中的文档片段ID, 打包统计)"""
+        # 新对话（没有历史记录）从空窗口开始
+        window = []
+        if session_id and chat_history:
+            window = self.sessions.get_window(session_id)
+        window = self.update_context_window(new_docs, intent, window)
+        if session_id:
+            self.sessions.set_window(session_id, window)
+        docs = self._window_docs(window, new_docs)
+        context, packing = self._window_context(query, docs, new_docs)
+        return context, window, packing
+
+    def _window_context(
+        self, query: str, docs: List[Dict], new_docs: List[Dict]
+    ) -> Tuple[str, Dict]:
+        """把上下文窗口中的文档片段按 token 预算打包为最终上下文
+
+        本轮检索到的片段按检索结果的顺序排在前面，窗口中较早的片段按从新到旧排在后面
+        """
+        current = [doc["id"] for doc in new_docs]
+        by_id = {doc["id"]: doc for doc in docs}
+        ordered = [by_id[uid] for uid in current if uid in by_id]
+        current_ids = set(current)
+        ordered += [doc for doc in reversed(docs) if doc["id"] not in current_ids]
+
+        context, packing = self._pack_context(query, ordered)
+        if not context:
+            context = "（未检索到特别相关的课程材料）"
+
+        print(f"\n[调试] 检索到的上下文:\n{context}\n")
+        return context, packing
+
+    async def prepare_answer_async(
+        self,
+        query: str,
+        chat_history: Optional[List[Dict]] = None,
+        top_k: int = TOP_K,
+        session_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """生成回答之前的阶段：查答案缓存、意图分析、检索、构建上下文
+
+        意图分析使用异步客户端，同时在检索线程池中用原始问题进行推测检索。
+        返回 {"query": 重写后的查询, "context": 上下文, "answer": 命中缓存时的回答,
+        "answer_cache": hit / miss / skip, "speculative": 推测检索的结果,
+        "timings": 各阶段耗时（毫秒）, "context_tokens": 上下文打包统计}，交给 stream_answer_async 生成回答
+        """
+        loop = asyncio.get_running_loop()
+        timings: Dict[str, float] = {}
+        start = time.perf_counter()
+
+        (cached_answer, cache_info), timings["answer_cache"] = await loop.run_in_executor(
+            self.retrieval_executor,
+            self._timed,
+            self._lookup_answer,
+            query,
+            chat_history,
+            session_id,
+        )
+        if cached_answer is not None:
+            timings["prepare"] = self._elapsed_ms(start)
+            return {
+                "query": query,
+                "context": "",
+                "answer": cached_answer,
+                "answer_cache": "hit",
+                "speculative": "skip",
+                "timings": timings,
+                "context_tokens": None,
+            }
+
+        speculative = None
+        if self.speculative_retrieval:
+            speculative = loop.run_in_executor(
+                self.retrieval_executor,
+                self._timed,
+                self.retrieve_context,
+                query,
+                top_k,
+                None,
+                self._chat_keep(top_k),
+            )
+        intent_start = time.perf_counter()
+        analysis_result = await self.analyze_intent_async(query, chat_history)
+        timings["intent"] = self._elapsed_ms(intent_start)
+        intent = analysis_result.get("intent", "NEW_TOPIC")
+        rewritten_query = analysis_result.get("rewritten_query", query)
+
+        print(f"[Debug] 意图: {intent}, 重写查询: {rewritten_query}")
+
+        speculative_docs = None
+        if speculative is not None:
+            if intent == "CHIT_CHAT":
+                speculative.cancel()
+            else:
+                wait_start = time.perf_counter()
+                await asyncio.wait([speculative])
+                speculative_docs = self._speculative_result(speculative.result, timings)
+                timings["speculative_wait"] = self._elapsed_ms(wait_start)
+
+        # 检索和读取窗口中较早的文档片段都是同步的，放到线程池中执行
+        context, outcome, window, packing = await loop.run_in_executor(
+            self.retrieval_executor,
+            self._build_context,
+            query,
+            intent,
+            rewritten_query,
+            top_k,
+            speculative_docs,
+            chat_history,
+            session_id,
+            timings,
+        )
+        timings["prepare"] = self._elapsed_ms(start)
+        print(f"[Debug] 推测检索: {outcome}, 阶段耗时: {self.format_timings(timings)}")
+        return {
+            "query": rewritten_query,
+            "context": context,
+            "answer": None,
+            "answer_cache": "miss" if cache_info else "skip",
+            "speculative": outcome,
+            "timings": timings,
+            "context_tokens": packing,
+            "_cache_info": cache_info,
+            "_window": window,
+        }
+
+    async def stream_answer_async(
+        self, prepared: Dict[str, Any], chat_history: Optional[List[Dict]] = None
+    ) -> AsyncIterator[str]:
+        """流式输出 prepare_answer_async 准备好的回答，逐段产出回答内容
+
+        命中答案缓存时分段重放缓存的回答，否则用大模型生成，完整生成的回答写入缓存
+        """
+        if prepared["answer"] is not None:
+            for text in self._replay_answer(prepared["answer"]):
+                yield text
+            return
+
+        start = time.perf_counter()
+        response = await self.generate_response_async(
+            prepared["query"], prepared["context"], chat_history, stream=True
+        )
+        if isinstance(response, str):
+            # 请求失败时返回的是错误信息
+            yield response
+            return
+
+        first_token = None
+        parts = []
+        completed = False
+        try:
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    if first_token is None:
+                        first_token = self._elapsed_ms(start)
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            completed = True
+        except Exception as e:
+            yield f"生成回答时出错: {str(e)}"
+        finally:
+            # 客户端断开时及时关闭上游连接，把连接归还连接池
+            await response.close()
+            if first_token is not None:
+                print(
+                    f"[Debug] 生成耗时: first_token;dur={first_token:.1f}, "
+                    f"generate;dur={self._elapsed_ms(start):.1f}"
+                )
+        if completed:
+            self._store_answer(prepared["_cache_info"], "".join(parts), prepared["_window"])
+
+    async def answer_question_async(
+        self,
+        query: str,
+        chat_history: Optional[List[Dict]] = None,
+        top_k: int = TOP_K,
+        session_id: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """流式回答问题的异步版本，逐段产出回答内容
+
+        模型调用使用异步客户端，检索在线程池中执行，整个过程不阻塞事件循环，
+        一个慢请求不会拖住同一进程中的其他请求
+        """
+        prepared = await self.prepare_answer_async(query, chat_history, top_k, session_id)
+        async for text in self.stream_answer_async(prepared, chat_history):
+            yield text
+
     def chat(self) -> None:
         """交互式对话"""
         print("=" * 60)
@@ -475,6 +1086,7 @@ class RAGAgent:
         print("=" * 60)
 
         chat_history = []
+        session_id = uuid.uuid4().hex
 
         while True:
             try:
@@ -483,7 +1095,9 @@ class RAGAgent:
                 if not query:
                     continue
 
-                answer = self.answer_question(query, chat_history=chat_history)
+                answer = self.answer_question(
+                    query, chat_history=chat_history, session_id=session_id
+                )
 
                 print(f"\n助教: {answer}")
 
@@ -0,0 +1,133 @@
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from ttl_cache import TTLCache
+from config import RERANK_MODEL, RERANK_BATCH_SIZE, RERANK_BUDGET_MS, RERANK_CACHE_SIZE
+
+
+class CrossEncoderReranker:
+    """用本地 CPU 上的 cross-encoder 对候选文档片段重新打分排序
+
+    模型（sentence-transformers 的 CrossEncoder）在第一次重排时才加载，加载失败
+    （例如没有安装 sentence-transformers）时关闭重排，候选保持融合后的顺序。
+    (查询, 片段内容) 的得分缓存在进程内；未缓存的候选按原有顺序分批打分，
+    累计耗时超过 budget_ms 后不再计算剩余的批次，未打分的候选排在已打分的候选之后。
+    """
+
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL,
+        batch_size: int = RERANK_BATCH_SIZE,
+        budget_ms: float = RERANK_BUDGET_MS,
+        cache_size: int = RERANK_CACHE_SIZE,
+        device: str = "cpu",
+    ):
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.budget_ms = budget_ms
+        self.device = device
+        self._model = None
+        self._disabled = not model_name
+        self._load_lock = threading.Lock()
+        # (查询, 片段内容) -> 得分，内容变化（重新构建知识库）后自然不再命中
+        self._scores: Optional[TTLCache] = TTLCache(cache_size) if cache_size > 0 else None
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.batches = 0
+        self.scored = 0
+        self.over_budget = 0
+
+    @property
+    def enabled(self) -> bool:
+        return not self._disabled
+
+    def load(self):
+        """加载模型，返回模型实例；不可用时返回 None"""
+        if self._model is not None or self._disabled:
+            return self._model
+        with self._load_lock:
+            if self._model is None and not self._disabled:
+                try:
+                    from sentence_transformers import CrossEncoder
+
+                    start = time.perf_counter()
+                    self._model = CrossEncoder(self.model_name, device=self.device)
+                    print(
+                        f"重排模型 {self.model_name} 加载完成，"
+                        f"耗时 {time.perf_counter() - start:.1f}s"
+                    )
+                except Exception as e:
+                    print(f"加载重排模型 {self.model_name} 失败，将不使用重排: {e}")
+                    self._disabled = True
+        return self._model
+
+    def _predict(self, model, pairs: List[Tuple[str, str]]) -> List[float]:
+        return [float(score) for score in model.predict(pairs, batch_size=self.batch_size)]
+
+    def rerank(self, query: str, docs: List[Dict], top_k: int) -> Tuple[List[Dict], bool]:
+        """返回 (重排后的前 top_k 个片段, 是否完成了重排)
+
+        重排后的片段带有 rerank_score 字段；没有完成重排（模型不可用）时原样返回前 top_k 个
+        """
+        model = self.load()
+        if model is None or not docs:
+            return docs[:top_k], False
+
+        start = time.perf_counter()
+        scores: Dict[int, float] = {}
+        pending = []
+        for i, doc in enumerate(docs):
+            cached = self._scores.get((query, doc["content"])) if self._scores is not None else None
+            if cached is None:
+                pending.append(i)
+            else:
+                scores[i] = cached
+
+        batches = 0
+        over_budget = False
+        for offset in range(0, len(pending), self.batch_size):
+            # 至少计算一批；超出预算后剩余的候选保持原有顺序
+            if batches and (time.perf_counter() - start) * 1000 > self.budget_ms:
+                over_budget = True
+                break
+            batch = pending[offset : offset + self.batch_size]
+            batch_scores = self._predict(model, [(query, docs[i]["content"]) for i in batch])
+            for i, score in zip(batch, batch_scores):
+                scores[i] = score
+                if self._scores is not None:
+                    self._scores.put((query, docs[i]["content"]), score)
+            batches += 1
+
+        ranked = sorted(scores, key=lambda i: scores[i], reverse=True)
+        ranked += [i for i in range(len(docs)) if i not in scores]
+        results = [
+            {**docs[i], "rerank_score": scores[i]} if i in scores else docs[i]
+            for i in ranked[:top_k]
+        ]
+
+        with self._stats_lock:
+            self.calls += 1
+            self.batches += batches
+            self.scored += len(scores)
+            self.over_budget += over_budget
+        print(
+            f"[Debug] 重排 {len(docs)} 个候选（缓存命中 {len(docs) - len(pending)}，"
+            f"{batches} 批），耗时 {(time.perf_counter() - start) * 1000:.1f}ms"
+            + ("，超出预算" if over_budget else "")
+        )
+        return results, True
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            stats = {
+                "model": self.model_name,
+                "enabled": self.enabled,
+                "loaded": self._model is not None,
+                "calls": self.calls,
+                "batches": self.batches,
+                "scored": self.scored,
+                "over_budget": self.over_budget,
+            }
+        stats["score_cache"] = self._scores.stats() if self._scores is not None else None
+        return stats
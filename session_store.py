@@ -0,0 +1,32 @@
+from typing import Dict, List, Optional
+
+from ttl_cache import TTLCache
+from config import SESSION_MAX_ENTRIES, SESSION_TTL
+
+
+class SessionStore:
+    """按会话ID保存每个对话的上下文窗口
+
+    同一个进程服务多个学生时，各自的检索上下文互不干扰。每个会话只保存窗口中
+    文档块的ID，内容在生成回答时从向量库取回，占用的内存与窗口大小成正比而不是与文本长度。
+    会话数量超过 max_entries 时淘汰最久未使用的会话，超过 ttl 秒未访问的会话自动过期。
+    """
+
+    def __init__(self, max_entries: int = SESSION_MAX_ENTRIES, ttl: Optional[float] = SESSION_TTL):
+        self._cache = TTLCache(max_entries, ttl)
+
+    def get_window(self, session_id: str) -> List[str]:
+        """会话当前上下文窗口中的文档块ID，会话不存在或已过期时为空"""
+        return list(self._cache.get(session_id, ()))
+
+    def set_window(self, session_id: str, doc_ids: List[str]) -> None:
+        self._cache.put(session_id, tuple(doc_ids))
+
+    def reset(self, session_id: str) -> None:
+        self._cache.pop(session_id)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def stats(self) -> Dict:
+        return self._cache.stats()
@@ -0,0 +1,99 @@
+"""TextSplitter 与原来的逐字符回扫算法的一致性测试
+
+legacy_split_text 是改写前的切分算法，作为参考实现；benchmarks/bench_text_splitter.py
+也从这里导入它和合成文本的生成函数。
+
+运行（在项目根目录下）:
+    python -m pytest tests
+"""
+
+import os
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from text_splitter import TextSplitter  # noqa: E402
+
+
+def legacy_split_text(text: str, chunk_size: int, chunk_overlap: int) -> list:
+    """原来的切分算法：每个窗口复制一次子串，再从后往前逐字符查找句子结束符"""
+    if not text:
+        return []
+
+    chunks = []
+    start = 0
+    text_len = len(text)
+
+    while start < text_len:
+        end = min(start + chunk_size, text_len)
+        if end < text_len:
+            chunk_text = text[start:end]
+            split_point = -1
+            for i in range(len(chunk_text) - 1, -1, -1):
+                if chunk_text[i] in "。！？.!?\n":
+                    split_point = start + i + 1
+                    break
+            if split_point != -1:
+                end = split_point
+
+        chunks.append(text[start:end])
+        if end == text_len:
+            break
+
+        next_start = end - chunk_overlap
+        if next_start <= start:
+            next_start = start + 1
+        start = next_start
+
+    return chunks
+
+
+WORDS = ["检索", "增强", "生成", "向量", "数据库", "文档", "模型", "the", "index", "query", "chunk"]
+ENDINGS = ["。", "！", "？", ".", "!", "?", "\n", "\n\n", "，", " ", ""]
+
+# (chunk_size, chunk_overlap)：常规配置、无重叠、重叠接近或超过块大小、块大小为 1 和 0
+PARAMS = [(500, 100), (100, 0), (50, 49), (30, 30), (10, 25), (1, 0), (1, 1), (0, 0)]
+EDGE_TEXTS = ["", "。", "a", "\n" * 50, "无标点" * 400, "。" * 300, "abc.def!ghi?" * 100]
+
+
+def synthetic_text(rng: random.Random, num_chars: int, punctuation: float = 1.0) -> str:
+    """生成中英文混合文本；punctuation 控制句子长度，越小句子越长"""
+    parts, total = [], 0
+    while total < num_chars:
+        sentence = "".join(rng.choice(WORDS) for _ in range(rng.randint(1, int(20 / punctuation))))
+        sentence += rng.choice(ENDINGS)
+        parts.append(sentence)
+        total += len(sentence)
+    return "".join(parts)[:num_chars]
+
+
+def random_texts(cases: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return [
+        synthetic_text(rng, rng.randint(0, 3000), punctuation=rng.choice([0.05, 0.3, 1.0]))
+        for _ in range(cases)
+    ]
+
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", PARAMS)
+@pytest.mark.parametrize("text", EDGE_TEXTS, ids=range(len(EDGE_TEXTS)))
+def test_edge_cases_match_legacy(text, chunk_size, chunk_overlap):
+    expected = legacy_split_text(text, chunk_size, chunk_overlap)
+    assert TextSplitter(chunk_size, chunk_overlap).split_text(text) == expected
+
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", PARAMS)
+def test_random_texts_match_legacy(chunk_size, chunk_overlap):
+    splitter = TextSplitter(chunk_size, chunk_overlap)
+    for i, text in enumerate(random_texts(100, seed=0)):
+        expected = legacy_split_text(text, chunk_size, chunk_overlap)
+        assert splitter.split_text(text) == expected, f"文本 #{i}（{len(text)} 字符）"
+
+
+def test_iter_text_matches_split_text():
+    splitter = TextSplitter(50, 10)
+    for text in EDGE_TEXTS + random_texts(20, seed=1):
+        assert list(splitter.iter_text(text)) == splitter.split_text(text)
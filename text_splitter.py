@@ -1,26 +1,33 @@
-from typing import List, Dict
+import re
+from bisect import bisect_right
+from typing import Dict, Iterator, List
+
 from tqdm import tqdm
 
+# 句子结束符，切分点位于结束符之后
+_SENTENCE_END = re.compile(r"[。！？.!?\n]")
+
 
 class TextSplitter:
     def __init__(self, chunk_size: int, chunk_overlap: int):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
 
-    def split_text(self, text: str) -> List[str]:
-        """将文本切分为块
-
-        TODO: 实现文本切分算法
-        要求：
-        1. 将文本按照chunk_size切分为多个块
-        2. 相邻块之间要有chunk_overlap的重叠（用于保持上下文连续性）
-        3. 尽量在句子边界处切分（查找句子结束符：。！？.!?\n\n）
-        4. 返回切分后的文本块列表
+    def sentence_boundaries(self, text: str) -> List[int]:
+        """返回所有句子边界的位置（句子结束符之后的下标），升序排列"""
+        return [match.end() for match in _SENTENCE_END.finditer(text)]
+
+    def iter_text(self, text: str) -> Iterator[str]:
+        """逐个生成文本块
+
+        - 每块最多 chunk_size 个字符，相邻块之间有 chunk_overlap 个字符的重叠
+        - 不是最后一块时，在块内最后一个句子结束符（。！？.!?\n）之后切分，块内没有结束符时按长度切分
+        - 句子边界只在开始时用正则扫描一遍，之后每个块用二分查找定位切分点
         """
         if not text:
-            return []
+            return
 
-        chunks = []
+        boundaries = self.sentence_boundaries(text)
         start = 0
         text_len = len(text)
 
@@ -28,23 +35,13 @@ class TextSplitter:
             # 确定当前块的结束位置（不超过 chunk_size）
             end = min(start + self.chunk_size, text_len)
 
-            # 如果不是最后一段，尝试在 chunk_size 范围内寻找句子结束符
+            # 不是最后一段时，在 (start, end] 内取最后一个句子边界，尽量让块更长
             if end < text_len:
-                chunk_text = text[start:end]
-                split_point = -1
-                # 从后往前查找句子结束符，尽量让块更长
-                for i in range(len(chunk_text) - 1, -1, -1):
-                    if chunk_text[i] in "。！？.!?\n":
-                        split_point = start + i + 1
-                        break
-
-                # 如果找到了结束符，就在结束符处切分
-                if split_point != -1:
-                    end = split_point
-
-            # 添加当前块
-            chunk = text[start:end]
-            chunks.append(chunk)
+                i = bisect_right(boundaries, end) - 1
+                if i >= 0 and boundaries[i] > start:
+                    end = boundaries[i]
+
+            yield text[start:end]
 
             # 如果已经处理完所有文本，退出循环
             if end == text_len:
@@ -59,16 +56,20 @@ class TextSplitter:
 
             start = next_start
 
-        return chunks
+    def split_text(self, text: str) -> List[str]:
+        """将文本切分为块，返回切分后的文本块列表"""
+        return list(self.iter_text(text))
 
-    def split_documents(self, documents: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    def split_documents(
+        self, documents: List[Dict[str, str]], show_progress: bool = True
+    ) -> List[Dict[str, str]]:
         """切分多个文档。
         对于PDF和PPT，已经按页/幻灯片分割，不再进行二次切分
         对于DOCX和TXT，进行文本切分
         """
         chunks_with_metadata = []
 
-        for doc in tqdm(documents, desc="处理文档", unit="文档"):
+        for doc in tqdm(documents, desc="处理文档", unit="文档", disable=not show_progress):
             content = doc.get("content", "")
             filetype = doc.get("filetype", "")
 
@@ -77,6 +78,7 @@ class TextSplitter:
                     "content": content,
                     "filename": doc.get("filename", "unknown"),
                     "filepath": doc.get("filepath", ""),
+                    "source": doc.get("source", doc.get("filepath", "")),
                     "filetype": filetype,
                     "page_number": doc.get("page_number", 0),
                     "chunk_id": 0,
@@ -86,12 +88,12 @@ class TextSplitter:
                 chunks_with_metadata.append(chunk_data)
 
             elif filetype in [".docx", ".txt"]:
-                chunks = self.split_text(content)
-                for i, chunk in enumerate(chunks):
+                for i, chunk in enumerate(self.iter_text(content)):
                     chunk_data = {
                         "content": chunk,
                         "filename": doc.get("filename", "unknown"),
                         "filepath": doc.get("filepath", ""),
+                        "source": doc.get("source", doc.get("filepath", "")),
                         "filetype": filetype,
                         "page_number": 0,
                         "chunk_id": i,
@@ -0,0 +1,101 @@
+import re
+import abc
+import functools
+from typing import List, Dict, Tuple, Type
+
+# 中日韩文字：CJK 统一表意文字（含扩展A和兼容区）、日文假名、韩文音节
+_CJK_RANGES = r"\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af"
+_TOKEN_RE = re.compile(
+    rf"[{_CJK_RANGES}]+|[a-z0-9]+(?:[._'-][a-z0-9]+)*"
+)
+_CJK_RE = re.compile(rf"[{_CJK_RANGES}]")
+
+STOPWORDS = frozenset(
+    """
+    的 了 是 在 和 与 及 或 也 就 都 而 着 之 其 这 那 个 我 你 他 她 它 们 吗 呢 吧 啊 呀 么
+    把 被 让 给 从 对 于 以 为 所 并 等 又 还 很 更 最 此 该 每 各 有 没 不
+    什么 怎么 如何 哪些 一个 一些 我们 你们 他们 这个 那个 这些 那些 因为 所以 如果
+    但是 而且 或者 可以 以及 其中 进行 通过 请问
+    a an the of to in on at by for from with as is are was were be been being
+    and or not no this that these those it its into than then so such
+    what which who how why when where do does did can could will would should
+    """.split()
+)
+
+
+class Tokenizer(abc.ABC):
+    """稀疏检索分词器基类
+
+    子类实现 _tokenize；tokenize 带有按文本缓存的 LRU，
+    建索引和查询使用同一个实例时可以共享分词结果。
+    """
+
+    name = "base"
+
+    def __init__(self, stopwords: bool = False, cache_size: int = 10000):
+        self.stopwords = STOPWORDS if stopwords else frozenset()
+        self._cached = functools.lru_cache(maxsize=cache_size)(self._tokenize_tuple)
+
+    @property
+    def signature(self) -> str:
+        """分词方式的标识，记录在索引中，变化时需要重建索引"""
+        return f"{self.name}+stopwords" if self.stopwords else self.name
+
+    @abc.abstractmethod
+    def _tokenize(self, text: str) -> List[str]:
+        """把文本切成词列表（不去停用词）"""
+
+    def _tokenize_tuple(self, text: str) -> Tuple[str, ...]:
+        tokens = self._tokenize(text)
+        if self.stopwords:
+            tokens = [token for token in tokens if token not in self.stopwords]
+        return tuple(tokens)
+
+    def tokenize(self, text: str) -> List[str]:
+        if not text:
+            return []
+        return list(self._cached(text))
+
+    def cache_info(self):
+        return self._cached.cache_info()
+
+
+class WhitespaceTokenizer(Tokenizer):
+    """按空白切分（旧的分词方式），适合纯英文语料"""
+
+    name = "whitespace"
+
+    def _tokenize(self, text: str) -> List[str]:
+        return [token for token in text.lower().split() if token.strip()]
+
+
+class CJKTokenizer(Tokenizer):
+    """中英混合分词：拉丁文字按单词切分，中日韩文字生成单字和相邻双字
+
+    例如 "词向量 embedding" -> 词 向 量 词向 向量 embedding
+    """
+
+    name = "cjk"
+
+    def _tokenize(self, text: str) -> List[str]:
+        tokens = []
+        for match in _TOKEN_RE.finditer(text.lower()):
+            run = match.group()
+            if not _CJK_RE.match(run):
+                tokens.append(run)
+                continue
+            tokens.extend(run)
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+        return tokens
+
+
+TOKENIZERS: Dict[str, Type[Tokenizer]] = {
+    WhitespaceTokenizer.name: WhitespaceTokenizer,
+    CJKTokenizer.name: CJKTokenizer,
+}
+
+
+def get_tokenizer(name: str, stopwords: bool = False, cache_size: int = 10000) -> Tokenizer:
+    if name not in TOKENIZERS:
+        raise ValueError(f"未知的分词器: {name}，可选: {', '.join(TOKENIZERS)}")
+    return TOKENIZERS[name](stopwords=stopwords, cache_size=cache_size)
@@ -0,0 +1,118 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class TTLCache:
+    """线程安全的 LRU 缓存，条目在 ttl 秒内未被访问即过期
+
+    条目按最近访问顺序排列，超过 max_entries 时淘汰最久未访问的条目；
+    每次读写都会刷新条目的过期时间，因此最久未访问的条目也最先过期，
+    清理过期条目只需从头部检查。ttl 为 0 或 None 时条目不会过期。
+    on_evict(key, value) 在条目过期或被淘汰后调用（在锁外调用，pop 和 clear 不触发）。
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl or None
+        self._clock = clock
+        self._on_evict = on_evict
+        # key -> (value, 过期时间)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expires_at(self, now: float) -> float:
+        return now + self.ttl if self.ttl else float("inf")
+
+    def _purge_expired(self, now: float) -> List[Tuple[Hashable, Any]]:
+        """删除过期条目，返回被删除的 [(key, value)]"""
+        evicted = []
+        while self._data:
+            key, (value, expires_at) = next(iter(self._data.items()))
+            if expires_at > now:
+                break
+            del self._data[key]
+            self.evictions += 1
+            evicted.append((key, value))
+        return evicted
+
+    def _notify(self, evicted: List[Tuple[Hashable, Any]]) -> None:
+        if self._on_evict is not None:
+            for key, value in evicted:
+                self._on_evict(key, value)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = self._clock()
+        with self._lock:
+            evicted = self._purge_expired(now)
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+            else:
+                self._data[key] = (item[0], self._expires_at(now))
+                self._data.move_to_end(key)
+                self.hits += 1
+        self._notify(evicted)
+        return default if item is None else item[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        now = self._clock()
+        with self._lock:
+            evicted = self._purge_expired(now)
+            self._data[key] = (value, self._expires_at(now))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                old_key, (old_value, _) = self._data.popitem(last=False)
+                self.evictions += 1
+                evicted.append((old_key, old_value))
+        self._notify(evicted)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """未过期条目的快照，不刷新访问顺序"""
+        with self._lock:
+            evicted = self._purge_expired(self._clock())
+            items = [(key, value) for key, (value, _) in self._data.items()]
+        self._notify(evicted)
+        return items
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            evicted = self._purge_expired(self._clock())
+            size = len(self._data)
+        self._notify(evicted)
+        return size
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and item[1] > self._clock()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
@@ -0,0 +1,166 @@
+import abc
+from typing import Callable, Dict, List, Optional, Tuple
+
+from vector_index import LocalVectorIndex
+
+
+class VectorBackend(abc.ABC):
+    """向量检索后端
+
+    文档块的向量、内容和元数据始终写入 Chroma，后端只负责按查询向量找出最近的文档块ID。
+    add / remove 在写入或删除 Chroma 之后调用，只更新内存；save 持久化后端自己的索引。
+    """
+
+    name = "base"
+
+    @abc.abstractmethod
+    def add(self, ids: List[str], embeddings: List[List[float]]) -> None:
+        """加入已写入 Chroma 的向量"""
+
+    @abc.abstractmethod
+    def remove(self, ids: List[str]) -> None:
+        """移除已从 Chroma 删除的向量"""
+
+    @abc.abstractmethod
+    def search(self, query_embedding: List[float], top_k: int) -> Tuple[List[str], List[float]]:
+        """返回距离最近的 top_k 个 (ID列表, 距离列表)，按距离升序排列"""
+
+    @abc.abstractmethod
+    def save(self, compact: bool = False) -> None:
+        """持久化上次保存以来的改动"""
+
+    def clear(self) -> None:
+        """清空索引"""
+
+    def sync(self, collection, where: Optional[Dict] = None) -> bool:
+        """与 collection 中可见的文档块（where 为版本过滤条件）比对并补齐缺失、移除多余的向量
+
+        返回索引是否有变化
+        """
+        return False
+
+    def reload(self, index_dir: Optional[str] = None) -> None:
+        """索引目录被替换或切换到另一个目录后重新打开"""
+
+
+class ChromaVectorBackend(VectorBackend):
+    """直接查询 Chroma collection，向量已随文档块写入 Chroma，不需要额外维护索引"""
+
+    name = "chroma"
+
+    def __init__(
+        self,
+        get_collection: Callable[[], object],
+        get_where: Callable[[], Optional[Dict]] = lambda: None,
+    ):
+        # collection 在清空或切换时会被替换，每次检索时重新获取，同时取当前的版本过滤条件
+        self._get_collection = get_collection
+        self._get_where = get_where
+
+    def add(self, ids: List[str], embeddings: List[List[float]]) -> None:
+        pass
+
+    def remove(self, ids: List[str]) -> None:
+        pass
+
+    def save(self, compact: bool = False) -> None:
+        pass
+
+    def search(self, query_embedding: List[float], top_k: int) -> Tuple[List[str], List[float]]:
+        results = self._get_collection().query(
+            query_embeddings=[query_embedding],
+            n_results=top_k,
+            where=self._get_where(),
+            include=["distances"],
+        )
+        ids = results["ids"][0] if results.get("ids") else []
+        distances = results["distances"][0] if results.get("distances") else []
+        return ids, distances
+
+
+class LocalVectorBackend(VectorBackend):
+    """进程内 mmap 加载的本地向量索引（见 LocalVectorIndex），向量同时写入 Chroma"""
+
+    name = "local"
+
+    def __init__(self, index_dir: str, dtype: str = "float32", nlist: int = 0, nprobe: int = 16):
+        self.index_dir = index_dir
+        self.dtype = dtype
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.index = self._open()
+
+    def _open(self) -> LocalVectorIndex:
+        return LocalVectorIndex(self.index_dir, dtype=self.dtype, nlist=self.nlist, nprobe=self.nprobe)
+
+    def reload(self, index_dir: Optional[str] = None) -> None:
+        self.index_dir = index_dir or self.index_dir
+        self.index = self._open()
+
+    def add(self, ids: List[str], embeddings: List[List[float]]) -> None:
+        self.index.add(ids, embeddings)
+
+    def remove(self, ids: List[str]) -> None:
+        self.index.remove(ids)
+
+    def save(self, compact: bool = False) -> None:
+        self.index.save(compact)
+
+    def clear(self) -> None:
+        self.index.clear()
+
+    def search(self, query_embedding: List[float], top_k: int) -> Tuple[List[str], List[float]]:
+        ranked = self.index.search(query_embedding, top_k)
+        return [uid for uid, _ in ranked], [distance for _, distance in ranked]
+
+    def sync(self, collection, where: Optional[Dict] = None) -> bool:
+        """从 Chroma 补充缺失的向量
+
+        不分代的collection比较数量，不一致时（例如构建在两次保存之间中断）补齐；分代的
+        collection每一代的索引在构建时随写入一起保存，只在索引不存在时从 Chroma 重建
+        """
+        if where is not None:
+            if self.index.exists():
+                return False
+        elif len(self.index) == collection.count():
+            return False
+
+        page_size = 1000
+        stored = set()
+        offset = 0
+        while True:
+            page = collection.get(where=where, include=[], limit=page_size, offset=offset)
+            stored.update(page["ids"])
+            if len(page["ids"]) < page_size:
+                break
+            offset += page_size
+        indexed = self.index.ids()
+        missing = sorted(stored - indexed)
+        extra = sorted(indexed - stored)
+        print(
+            f"向量索引与向量数据库不一致，补充 {len(missing)} 个、移除 {len(extra)} 个文档块..."
+        )
+
+        self.index.remove(extra)
+        for start in range(0, len(missing), page_size):
+            page = collection.get(ids=missing[start : start + page_size], include=["embeddings"])
+            self.index.add(page["ids"], page["embeddings"])
+        self.index.save()
+        return True
+
+
+def create_vector_backend(
+    backend: str,
+    index_dir: str,
+    get_collection: Callable[[], object],
+    get_where: Callable[[], Optional[Dict]] = lambda: None,
+    dtype: str = "float32",
+    nlist: int = 0,
+    nprobe: int = 16,
+) -> VectorBackend:
+    """按配置创建向量检索后端："chroma" 直接查询 Chroma，"local" 使用 index_dir 下的本地向量索引"""
+    if backend == "chroma":
+        return ChromaVectorBackend(get_collection, get_where)
+    if backend == "local":
+        return LocalVectorBackend(index_dir, dtype=dtype, nlist=nlist, nprobe=nprobe)
+    raise ValueError(f"未知的向量检索后端: {backend}，可选: chroma, local")
@@ -0,0 +1,446 @@
+import os
+import json
+import math
+import shutil
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+
+class LocalVectorIndex:
+    """进程内的向量索引：mmap 加载的向量矩阵 + NumPy 实现的 IVF 倒排聚类
+
+    作为 Chroma 之外的另一种向量检索后端，只保存文档块ID和向量，内容和元数据仍在
+    Chroma 中。磁盘上每一代索引是 index_dir 下的一个 gen-XXXXXX 目录，CURRENT
+    文件指向当前代。每一代包含：
+    - meta.json: 文档ID（按行顺序）、向量维度、存储精度和聚类数
+    - vectors.npy: 按聚类排序的向量矩阵（float32 或 float16），每个聚类是连续的若干行
+    - norms.npy: 每个向量的模长平方
+    - centroids.npy / offsets.npy: 聚类中心和每个聚类在矩阵中的起止行
+    - seg-XXXXXX.json / seg-XXXXXX.npy: 该代之后的增删操作日志和新增的向量，按编号顺序重放
+
+    加载时向量矩阵通过 mmap 映射，不复制到内存。检索时先找出距离查询最近的 nprobe
+    个聚类，只在这些聚类中计算距离；文档数较少时只有一个聚类，即精确检索。
+    新增的向量先保存在内存中的增量段（检索时全部扫描），删除只标记失效。
+    save() 只在有改动时写盘：通常只把上次保存以来的增删追加为一个日志段，日志累计的
+    操作数超过基础段文档数的 COMPACT_RATIO（且不少于 COMPACT_MIN_OPS）时，才合并并
+    重新分配聚类。已写出的文件不再修改。距离与 Chroma 默认的 l2 空间一致，为欧氏距离的平方。
+    """
+
+    FORMAT_VERSION = 1
+    # 日志段累计的操作数超过 max(COMPACT_MIN_OPS, 基础段文档数 * COMPACT_RATIO) 时合并
+    COMPACT_MIN_OPS = 1000
+    COMPACT_RATIO = 0.2
+    # 文档数少于该值时不聚类，直接扫描全部向量
+    MIN_IVF_SIZE = 4096
+    # 训练聚类中心时每个聚类最多采样的向量数
+    TRAIN_SAMPLES_PER_LIST = 64
+
+    def __init__(
+        self,
+        index_dir: str,
+        dtype: str = "float32",
+        nlist: int = 0,
+        nprobe: int = 16,
+    ):
+        self.index_dir = index_dir
+        self.dtype = np.dtype(dtype)
+        self.nlist = nlist
+        self.nprobe = max(1, nprobe)
+        self.dirty = False
+        self._loaded = False
+        self._reset()
+
+    def _reset(self) -> None:
+        # 行号 -> 文档ID，已删除的行为 None；基础段在前，增量段在后
+        self._ids: List[Optional[str]] = []
+        self._slots: Dict[str, int] = {}
+        self._alive = bytearray()
+        self._num_docs = 0
+        self.dim: Optional[int] = None
+        # 基础段：从磁盘 mmap 加载的只读矩阵
+        self._num_base = 0
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._centroids = np.zeros((0, 0), dtype=np.float32)
+        self._centroid_norms = np.zeros(0, dtype=np.float32)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        # 增量段：新增的向量，检索时按需拼接成矩阵
+        self._delta: List[np.ndarray] = []
+        self._delta_cache: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        # 有效标记数组缓存，增删后失效
+        self._alive_cache: Optional[np.ndarray] = None
+        # 当前代已写入日志段的操作数、下一个日志段编号
+        self._logged_ops = 0
+        self._next_segment = 0
+        # 上次保存以来尚未写盘的操作：("add", ID列表, 向量矩阵) 或 ("remove", ID列表)
+        self._pending: List[tuple] = []
+        # 为 True 时下次 save() 必须合并成新的一代（清空索引或没有可追加的代时）
+        self._needs_compact = True
+
+    # ---------- 加载与持久化 ----------
+
+    def _current_generation(self) -> Optional[str]:
+        pointer = os.path.join(self.index_dir, "CURRENT")
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        path = os.path.join(self.index_dir, name)
+        return path if os.path.isdir(path) else None
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        gen_dir = self._current_generation()
+        if not gen_dir:
+            return
+        try:
+            with open(os.path.join(gen_dir, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != self.FORMAT_VERSION:
+                print("向量索引格式版本不匹配，将重新构建")
+                return
+            self._ids = meta["ids"]
+            self._slots = {uid: slot for slot, uid in enumerate(self._ids)}
+            self._alive = bytearray(b"\x01" * len(self._ids))
+            self._num_docs = self._num_base = len(self._ids)
+            self.dim = meta["dim"]
+            # np.asarray 去掉 memmap 子类（切片开销较大），仍然是同一块映射内存的视图
+            self._vectors = np.asarray(
+                np.load(os.path.join(gen_dir, "vectors.npy"), mmap_mode="r")
+            )
+            self._norms = np.asarray(np.load(os.path.join(gen_dir, "norms.npy"), mmap_mode="r"))
+            self._centroids = np.load(os.path.join(gen_dir, "centroids.npy"))
+            self._centroid_norms = np.einsum("ij,ij->i", self._centroids, self._centroids)
+            self._offsets = np.load(os.path.join(gen_dir, "offsets.npy"))
+            self._replay_segments(gen_dir)
+            self._needs_compact = False
+        except Exception as e:
+            print(f"加载向量索引失败，将重新构建: {e}")
+            self._reset()
+
+    def _replay_segments(self, gen_dir: str) -> None:
+        """按顺序重放该代之后写入的日志段，操作日志 .json 写入完成才算该段有效"""
+        names = sorted(
+            name for name in os.listdir(gen_dir)
+            if name.startswith("seg-") and name.endswith(".json")
+        )
+        for name in names:
+            with open(os.path.join(gen_dir, name), "r", encoding="utf-8") as f:
+                ops = json.load(f)["ops"]
+            vectors = None
+            if any(op[0] == "add" for op in ops):
+                vectors = np.load(os.path.join(gen_dir, name[:-5] + ".npy"))
+            row = 0
+            for kind, ids in ops:
+                if kind == "add":
+                    self._add_vectors(ids, vectors[row : row + len(ids)])
+                    row += len(ids)
+                else:
+                    self._remove_ids(ids)
+                self._logged_ops += len(ids)
+            self._next_segment = int(name[4:10]) + 1
+
+    def _merged_vectors(self) -> np.ndarray:
+        """合并基础段和增量段中的有效向量，按行号顺序返回 float32 矩阵"""
+        alive = self._alive_mask()
+        parts = []
+        if self._num_base:
+            parts.append(np.asarray(self._vectors, dtype=np.float32)[alive[: self._num_base]])
+        if self._delta:
+            delta, _ = self._delta_arrays()
+            parts.append(delta[alive[self._num_base :]])
+        if not parts:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+    def _target_nlist(self, size: int) -> int:
+        if self.nlist:
+            return max(1, min(self.nlist, size))
+        if size < self.MIN_IVF_SIZE:
+            return 1
+        return int(math.sqrt(size))
+
+    def _train(self, vectors: np.ndarray, nlist: int, iterations: int = 10) -> np.ndarray:
+        """在采样的向量上运行 k-means，返回聚类中心"""
+        rng = np.random.default_rng(0)
+        sample_size = min(len(vectors), nlist * self.TRAIN_SAMPLES_PER_LIST)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = self._assign(sample, centroids)
+            counts = np.bincount(assign, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+            # 空聚类重新随机选一个样本作为中心
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+        return centroids
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, batch: int = 65536) -> np.ndarray:
+        """把每个向量分配到最近的聚类中心"""
+        centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+        assign = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), batch):
+            block = vectors[start : start + batch]
+            assign[start : start + batch] = np.argmin(
+                centroid_norms[None, :] - 2 * block @ centroids.T, axis=1
+            )
+        return assign
+
+    def save(self, compact: bool = False) -> None:
+        """把上次保存以来的改动写盘，没有改动时什么也不做
+
+        改动通常追加为当前代的一个日志段（不重新聚类）；compact=True、日志过长或当前
+        没有可追加的代时，合并成新的一代
+        """
+        self._ensure_loaded()
+        if not self.dirty and not compact:
+            return
+        gen_dir = None if self._needs_compact else self._current_generation()
+        threshold = max(self.COMPACT_MIN_OPS, self._num_base * self.COMPACT_RATIO)
+        pending_ops = sum(len(op[1]) for op in self._pending)
+        if compact or gen_dir is None or self._logged_ops + pending_ops > threshold:
+            self._compact()
+            return
+
+        # 先写新增的向量，再写操作日志；只有操作日志存在的段在加载时才会被重放
+        seg_name = f"seg-{self._next_segment:06d}"
+        added = [op[2] for op in self._pending if op[0] == "add"]
+        if added:
+            vectors_tmp = os.path.join(gen_dir, seg_name + ".npy.tmp")
+            with open(vectors_tmp, "wb") as f:
+                np.save(f, np.concatenate(added) if len(added) > 1 else added[0])
+            os.replace(vectors_tmp, os.path.join(gen_dir, seg_name + ".npy"))
+        ops_tmp = os.path.join(gen_dir, seg_name + ".json.tmp")
+        with open(ops_tmp, "w", encoding="utf-8") as f:
+            json.dump({"ops": [[op[0], op[1]] for op in self._pending]}, f, ensure_ascii=False)
+        os.replace(ops_tmp, os.path.join(gen_dir, seg_name + ".json"))
+        self._next_segment += 1
+        self._logged_ops += pending_ops
+        self._pending = []
+        self.dirty = False
+
+    def _compact(self) -> None:
+        """合并增量、重新分配聚类并写出新的一代索引，然后切换 CURRENT 指针
+
+        聚类数与目标值相差不超过一倍时沿用原有的聚类中心，只重新分配向量
+        """
+        vectors = self._merged_vectors()
+        ids = [uid for uid in self._ids if uid is not None]
+        dim = self.dim or 0
+
+        nlist = self._target_nlist(len(vectors))
+        current = len(self._centroids)
+        if nlist == 1 or not len(vectors):
+            centroids = np.zeros((1, dim), dtype=np.float32)
+        elif current > 1 and self._centroids.shape[1] == dim and nlist / 2 <= current <= nlist * 2:
+            centroids = np.asarray(self._centroids, dtype=np.float32)
+        else:
+            centroids = self._train(vectors, nlist)
+        assign = (
+            self._assign(vectors, centroids)
+            if len(centroids) > 1
+            else np.zeros(len(vectors), dtype=np.int64)
+        )
+        order = np.argsort(assign, kind="stable")
+        vectors = vectors[order]
+        ids = [ids[i] for i in order]
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=len(centroids)), out=offsets[1:])
+        stored = vectors.astype(self.dtype)
+        # 模长按存储精度计算，与检索时读到的向量一致
+        norms = np.einsum("ij,ij->i", stored.astype(np.float32), stored.astype(np.float32))
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        current_dir = self._current_generation()
+        generation = 0
+        if current_dir:
+            generation = int(os.path.basename(current_dir).split("-")[1]) + 1
+        gen_name = f"gen-{generation:06d}"
+        gen_dir = os.path.join(self.index_dir, gen_name)
+        # 中断的合并可能留下同名目录，其中的文件可能与其他代的索引目录硬链接共用，先删除再写入
+        shutil.rmtree(gen_dir, ignore_errors=True)
+        os.makedirs(gen_dir)
+
+        np.save(os.path.join(gen_dir, "vectors.npy"), stored)
+        np.save(os.path.join(gen_dir, "norms.npy"), norms.astype(np.float32))
+        np.save(os.path.join(gen_dir, "centroids.npy"), centroids.astype(np.float32))
+        np.save(os.path.join(gen_dir, "offsets.npy"), offsets)
+        with open(os.path.join(gen_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": self.FORMAT_VERSION,
+                    "dim": self.dim,
+                    "dtype": self.dtype.name,
+                    "metric": "l2",
+                    "nlist": len(centroids),
+                    "ids": ids,
+                },
+                f,
+                ensure_ascii=False,
+            )
+
+        pointer_tmp = os.path.join(self.index_dir, "CURRENT.tmp")
+        with open(pointer_tmp, "w", encoding="utf-8") as f:
+            f.write(gen_name)
+        os.replace(pointer_tmp, os.path.join(self.index_dir, "CURRENT"))
+
+        # 释放旧的 mmap 后从新的一代重新加载
+        self._reset()
+        self._loaded = False
+        self._ensure_loaded()
+        self.dirty = False
+
+        # 清理旧的代（其他进程可能仍在使用，失败时忽略）
+        for name in os.listdir(self.index_dir):
+            if name.startswith("gen-") and name != gen_name:
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+
+    # ---------- 增量更新 ----------
+
+    def add(self, ids: List[str], embeddings: List[List[float]]) -> None:
+        """添加向量，已存在的ID会先被删除再重新添加"""
+        self._ensure_loaded()
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("向量数量与ID数量不一致")
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"向量维度 {vectors.shape[1]} 与索引维度 {self.dim} 不一致")
+
+        ids = list(ids)
+        self._add_vectors(ids, vectors)
+        self._pending.append(("add", ids, vectors))
+        self.dirty = True
+
+    def remove(self, ids: List[str]) -> None:
+        """删除向量：只标记失效，合并成新的一代时再从矩阵中清除"""
+        self._ensure_loaded()
+        removed = self._remove_ids(ids)
+        if removed:
+            self._pending.append(("remove", removed))
+            self.dirty = True
+
+    def _add_vectors(self, ids: List[str], vectors: np.ndarray) -> None:
+        for uid in ids:
+            # 已存在的ID（包括同一批中重复的ID）只保留最后一个
+            self._remove_ids([uid])
+            self._slots[uid] = len(self._ids)
+            self._ids.append(uid)
+            self._alive.append(1)
+            self._num_docs += 1
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+        self._delta.append(vectors)
+        self._delta_cache = None
+        self._alive_cache = None
+
+    def _remove_ids(self, ids: List[str]) -> List[str]:
+        """标记失效，返回实际存在并被删除的ID"""
+        removed = []
+        for uid in ids:
+            slot = self._slots.pop(uid, None)
+            if slot is None:
+                continue
+            self._ids[slot] = None
+            self._alive[slot] = 0
+            self._alive_cache = None
+            self._num_docs -= 1
+            removed.append(uid)
+        return removed
+
+    def clear(self) -> None:
+        self._ensure_loaded()
+        self._reset()
+        self.dirty = True
+
+    def exists(self) -> bool:
+        """磁盘上是否已有保存过的索引"""
+        return self._current_generation() is not None
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return self._num_docs
+
+    def ids(self) -> Set[str]:
+        """索引中所有有效向量的ID"""
+        self._ensure_loaded()
+        return set(self._slots)
+
+    # ---------- 检索 ----------
+
+    def _alive_mask(self) -> np.ndarray:
+        if self._alive_cache is None:
+            self._alive_cache = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+        return self._alive_cache
+
+    def _delta_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """增量段的 (向量矩阵, 模长平方)"""
+        if self._delta_cache is None:
+            vectors = np.concatenate(self._delta) if len(self._delta) > 1 else self._delta[0]
+            self._delta = [vectors]
+            self._delta_cache = (vectors, np.einsum("ij,ij->i", vectors, vectors))
+        return self._delta_cache
+
+    def _probe_ranges(self, query: np.ndarray, nprobe: int) -> List[Tuple[int, int]]:
+        """距离查询最近的 nprobe 个聚类在基础段中的行范围"""
+        nlist = len(self._centroids)
+        if nlist <= 1:
+            return [(0, self._num_base)]
+        distances = self._centroid_norms - 2 * (self._centroids @ query)
+        if nprobe < nlist:
+            probe = np.argpartition(distances, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(nlist)
+        return [(int(self._offsets[c]), int(self._offsets[c + 1])) for c in np.sort(probe)]
+
+    def search(
+        self, query_embedding: List[float], top_k: int, nprobe: Optional[int] = None
+    ) -> List[Tuple[str, float]]:
+        """返回距离最近的 top_k 个 (文档ID, 欧氏距离平方)，按距离升序排列"""
+        self._ensure_loaded()
+        if not self._num_docs or top_k <= 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape != (self.dim,):
+            raise ValueError(f"查询向量维度 {query.shape[-1]} 与索引维度 {self.dim} 不一致")
+
+        slot_parts, dist_parts = [], []
+        if self._num_base:
+            for start, end in self._probe_ranges(query, nprobe or self.nprobe):
+                if start == end:
+                    continue
+                block = self._vectors[start:end]
+                if block.dtype != np.float32:
+                    block = block.astype(np.float32)
+                dist_parts.append(self._norms[start:end] - 2 * (block @ query))
+                slot_parts.append(np.arange(start, end))
+        if self._delta:
+            vectors, norms = self._delta_arrays()
+            dist_parts.append(norms - 2 * (vectors @ query))
+            slot_parts.append(np.arange(self._num_base, self._num_base + len(vectors)))
+        if not slot_parts:
+            return []
+
+        slots = np.concatenate(slot_parts)
+        distances = np.concatenate(dist_parts) + np.float32(query @ query)
+        if self._num_docs != len(self._ids):
+            keep = self._alive_mask()[slots]
+            slots, distances = slots[keep], distances[keep]
+        if len(slots) > top_k:
+            top = np.argpartition(distances, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(slots))
+        top = top[np.argsort(distances[top], kind="stable")]
+        # 浮点误差可能让距离略小于 0
+        return [(self._ids[int(slots[i])], max(float(distances[i]), 0.0)) for i in top]
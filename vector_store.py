@@ -1,21 +1,67 @@
 import os
+import glob
+import time
+import shutil
 from typing import List, Dict, Optional
 from collections import defaultdict
 
 import chromadb
 from chromadb.config import Settings
-from openai import OpenAI
-from tqdm import tqdm
-from rank_bm25 import BM25Okapi
 
 from config import (
+    DATA_DIR,
     VECTOR_DB_PATH,
     COLLECTION_NAME,
     OPENAI_API_KEY,
     OPENAI_API_BASE,
-    OPENAI_EMBEDDING_MODEL,
     TOP_K,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    BM25_TOKENIZER,
+    BM25_STOPWORDS,
+    BM25_TOKEN_CACHE_SIZE,
+    RETRIEVAL_CACHE_MAX_ENTRIES,
+    RETRIEVAL_CACHE_TTL,
+    VECTOR_BACKEND,
+    VECTOR_INDEX_DTYPE,
+    VECTOR_INDEX_NLIST,
+    VECTOR_INDEX_NPROBE,
+    EMBEDDING_COALESCE_WAIT_MS,
 )
+from embedder import create_embedder
+from embedding_coalescer import EmbeddingCoalescer
+from embedding_cache import EmbeddingCache
+from bm25_index import BM25Index
+from tokenizer import get_tokenizer
+from collection_registry import active_collection
+from ttl_cache import TTLCache
+from vector_backend import VectorBackend, create_vector_backend
+
+
+# 分代collection中尚未删除的文档块的 kb_removed 取值
+KB_NEVER_REMOVED = 2**31 - 1
+
+
+def _link_or_copy(source: str, target: str) -> None:
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _link_tree(source_dir: str, target_dir: str) -> None:
+    """用硬链接复制索引目录：索引文件写出后不再修改，新旧目录可以共用同一份数据；
+    不支持硬链接的文件系统上退回复制"""
+    shutil.rmtree(target_dir, ignore_errors=True)
+    shutil.copytree(source_dir, target_dir, copy_function=_link_or_copy)
+
+
+def _relative_source(path: str) -> str:
+    """源文件相对数据目录的路径，统一用 / 分隔；不在同一盘符时退回绝对路径"""
+    try:
+        relative = os.path.relpath(path, DATA_DIR)
+    except ValueError:
+        relative = os.path.abspath(path)
+    return relative.replace(os.sep, "/")
 
 
 class VectorStore:
@@ -23,43 +69,253 @@ class VectorStore:
     def __init__(
         self,
         db_path: str = VECTOR_DB_PATH,
-        collection_name: str = COLLECTION_NAME,
+        collection_name: Optional[str] = None,
         api_key: str = OPENAI_API_KEY,
         api_base: str = OPENAI_API_BASE,
+        kb_generation: Optional[int] = None,
     ):
         self.db_path = db_path
-        self.collection_name = collection_name
+        # 默认使用当前对外提供检索的collection和代数（见 CollectionRegistry）
+        if collection_name is None:
+            collection_name, kb_generation = active_collection(db_path, COLLECTION_NAME)
 
-        # 初始化OpenAI客户端
-        self.client = OpenAI(api_key=api_key, base_url=api_base)
+        # 初始化批量向量化引擎（EMBEDDING_BACKEND 选择远程接口或本地模型）
+        self.embedder = create_embedder(api_key=api_key, api_base=api_base)
+        # 并发请求的查询向量化合并成批次发送，EMBEDDING_COALESCE_WAIT_MS 为 0 时逐条请求
+        self.coalescer: Optional[EmbeddingCoalescer] = None
+        if EMBEDDING_COALESCE_WAIT_MS > 0:
+            self.coalescer = EmbeddingCoalescer(self.embedder.embed_batch)
 
         # 初始化ChromaDB
         os.makedirs(db_path, exist_ok=True)
+
+        # 持久化的embedding缓存，与向量数据库放在同一目录
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        if EMBEDDING_CACHE_MAX_ENTRIES > 0:
+            self.embedding_cache = EmbeddingCache(
+                os.path.join(db_path, "embedding_cache.sqlite3"),
+                max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+            )
         self.chroma_client = chromadb.PersistentClient(
             path=db_path, settings=Settings(anonymized_telemetry=False)
         )
 
-        # 获取或创建collection
-        self.collection = self.chroma_client.get_or_create_collection(
-            name=collection_name, metadata={"description": "课程材料向量数据库"}
+        # BM25 稀疏索引和检索时共用同一个分词器，分词结果按文本缓存
+        self.tokenizer = get_tokenizer(
+            BM25_TOKENIZER, stopwords=BM25_STOPWORDS, cache_size=BM25_TOKEN_CACHE_SIZE
         )
 
-        # BM25 相关缓存
-        self._bm25_tokens: List[List[str]] = []
-        self._bm25_documents: List[str] = []
-        self._bm25_metadatas: List[Dict] = []
-        self._bm25_ids: List[str] = []
-        self._bm25_model: Optional[BM25Okapi] = None
+        # 检索结果缓存，键中包含索引代数；写入、删除、清空或切换collection时代数加一，
+        # 旧代数的缓存不再命中，随 LRU 淘汰
+        self.generation = 0
+        self.retrieval_cache: Optional[TTLCache] = None
+        if RETRIEVAL_CACHE_MAX_ENTRIES > 0:
+            self.retrieval_cache = TTLCache(RETRIEVAL_CACHE_MAX_ENTRIES, RETRIEVAL_CACHE_TTL)
 
-    @staticmethod
-    def _tokenize(text: str) -> List[str]:
-        return [token for token in text.lower().split() if token.strip()]
+        self.vector_backend: Optional[VectorBackend] = None
+        self.open_collection(collection_name, kb_generation)
+
+    def open_collection(self, collection_name: str, kb_generation: Optional[int] = None) -> None:
+        """切换到某个collection的某一代（collection不存在时创建），之后的读写都在这一代上进行
 
-    def _rebuild_bm25_index(self) -> None:
-        if self._bm25_tokens:
-            self._bm25_model = BM25Okapi(self._bm25_tokens)
+        分代的collection中，读取只能看到 kb_added <= 代数 < kb_removed 的文档块，写入的文档块
+        标记为该代新增；kb_generation 为 None 或collection由旧版本创建（没有分代标记）时不分代
+        """
+        self.collection_name = collection_name
+        # 获取或创建collection，元数据中记录构建它的embedding模型、向量维度和是否分代
+        self.collection = self.chroma_client.get_or_create_collection(
+            name=collection_name, metadata=self._new_collection_metadata(kb_generation is not None)
+        )
+        self._collection_metadata = dict(self.collection.metadata or {})
+        self.kb_generation = (
+            kb_generation if self._collection_metadata.get("kb_versioned") else None
+        )
+
+        # BM25 稀疏索引，每一代一个目录，首次使用时通过 mmap 加载
+        self.bm25_index = BM25Index(
+            self._bm25_dir(collection_name, self.kb_generation),
+            tokenizer=self.tokenizer.signature,
+        )
+        self._bm25_checked = False
+
+        # 向量检索后端："chroma" 直接查询 Chroma；"local" 使用进程内 mmap 加载的向量索引，
+        # 向量同时写入 Chroma 和本地索引，文档内容和元数据仍从 Chroma 读取
+        vector_dir = self._vector_dir(collection_name, self.kb_generation)
+        if self.vector_backend is None:
+            self.vector_backend = create_vector_backend(
+                VECTOR_BACKEND,
+                vector_dir,
+                lambda: self.collection,
+                self._visible_where,
+                dtype=VECTOR_INDEX_DTYPE,
+                nlist=VECTOR_INDEX_NLIST,
+                nprobe=VECTOR_INDEX_NPROBE,
+            )
         else:
-            self._bm25_model = None
+            self.vector_backend.reload(vector_dir)
+        self._vector_index_checked = False
+        self._bump_generation()
+
+    def _new_collection_metadata(self, versioned: bool) -> Dict:
+        metadata = {"description": "课程材料向量数据库", "embedding_model": self.embedder.model}
+        if versioned:
+            metadata["kb_versioned"] = True
+        return metadata
+
+    def _visible_where(self) -> Optional[Dict]:
+        """当前代可见文档块的过滤条件，不分代时为 None"""
+        if self.kb_generation is None:
+            return None
+        return {
+            "$and": [
+                {"kb_added": {"$lte": self.kb_generation}},
+                {"kb_removed": {"$gt": self.kb_generation}},
+            ]
+        }
+
+    def _visible_ids(self) -> set:
+        """当前代所有可见文档块的ID"""
+        page_size = 1000
+        stored = set()
+        offset = 0
+        while True:
+            page = self.collection.get(
+                where=self._visible_where(), include=[], limit=page_size, offset=offset
+            )
+            stored.update(page["ids"])
+            if len(page["ids"]) < page_size:
+                return stored
+            offset += page_size
+
+    def embedding_info(self) -> Dict:
+        """collection 记录的 {"model": 构建时的embedding模型, "dim": 向量维度}
+
+        较早构建的collection没有记录时模型为 None，维度从已有的向量中读取
+        """
+        model = self._collection_metadata.get("embedding_model")
+        dim = self._collection_metadata.get("embedding_dim")
+        if dim is None and self.collection.count():
+            page = self.collection.get(limit=1, include=["embeddings"])
+            if len(page["embeddings"]):
+                dim = len(page["embeddings"][0])
+                self._collection_metadata["embedding_dim"] = dim
+        return {"model": model, "dim": dim}
+
+    def check_embedding_model(self) -> None:
+        """当前配置的embedding模型与构建collection的模型不一致时抛出异常"""
+        model = self.embedding_info()["model"]
+        if model and model != self.embedder.model:
+            raise ValueError(
+                f"知识库 {self.collection_name} 由embedding模型 {model} 构建，"
+                f"当前配置为 {self.embedder.model}，请重新构建知识库"
+            )
+
+    def _check_dimension(self, dim: int) -> None:
+        """向量维度与collection中已有的向量不一致时抛出异常"""
+        expected = self.embedding_info()["dim"]
+        if expected is not None and dim != expected:
+            raise ValueError(
+                f"向量维度 {dim} 与知识库 {self.collection_name} 的维度 {expected} 不一致"
+                f"（由embedding模型 {self.embedding_info()['model'] or '未知'} 构建），"
+                "请检查 EMBEDDING_BACKEND 配置或重新构建知识库"
+            )
+
+    def _record_embedding_info(self, dim: int) -> None:
+        """把embedding模型和向量维度写入collection的元数据"""
+        self._check_dimension(dim)
+        metadata = {**self._collection_metadata, "embedding_dim": dim}
+        if not metadata.get("embedding_model"):
+            metadata["embedding_model"] = self.embedder.model
+        if metadata != self.collection.metadata:
+            self.collection.modify(metadata=metadata)
+        self._collection_metadata = metadata
+
+    def _bump_generation(self) -> None:
+        self.generation += 1
+
+    def _cache_get(self, key: tuple) -> Optional[List[Dict]]:
+        if self.retrieval_cache is None:
+            return None
+        cached = self.retrieval_cache.get((*key, self.generation))
+        # 返回副本，调用方修改结果不影响缓存
+        return None if cached is None else [dict(doc) for doc in cached]
+
+    def _cache_put(self, key: tuple, results: List[Dict]) -> None:
+        if self.retrieval_cache is not None:
+            self.retrieval_cache.put((*key, self.generation), [dict(doc) for doc in results])
+
+    def retrieval_cache_stats(self) -> Optional[Dict]:
+        if self.retrieval_cache is None:
+            return None
+        return {**self.retrieval_cache.stats(), "generation": self.generation}
+
+    def _index_dir(self, prefix: str, collection_name: str, kb_generation: Optional[int]) -> str:
+        suffix = "" if kb_generation is None else f"@g{kb_generation}"
+        return os.path.join(self.db_path, f"{prefix}_{collection_name}{suffix}")
+
+    def _bm25_dir(self, collection_name: str, kb_generation: Optional[int] = None) -> str:
+        return self._index_dir("bm25", collection_name, kb_generation)
+
+    def _vector_dir(self, collection_name: str, kb_generation: Optional[int] = None) -> str:
+        return self._index_dir("vectors", collection_name, kb_generation)
+
+    def _generation_dirs(self, collection_name: str) -> Dict[int, List[str]]:
+        """某个collection各代的索引目录 {代数: [目录]}"""
+        dirs: Dict[int, List[str]] = defaultdict(list)
+        for prefix in ("bm25", "vectors"):
+            pattern = glob.escape(self._index_dir(prefix, collection_name, None)) + "@g*"
+            for path in glob.glob(pattern):
+                generation = path.rsplit("@g", 1)[1]
+                if generation.isdigit():
+                    dirs[int(generation)].append(path)
+        return dirs
+
+    def _tokenize(self, text: str) -> List[str]:
+        return self.tokenizer.tokenize(text)
+
+    def _ensure_bm25_index(self) -> None:
+        """首次使用时校验BM25索引与collection是否一致
+
+        不一致时（例如构建在两次保存之间中断）只补充缺失的文档块、移除多余的文档块，
+        不必从头重建；分代的collection只在这一代的索引不存在时补齐
+        """
+        if self._bm25_checked:
+            return
+        self._bm25_checked = True
+        # 分代collection每一代的索引在构建时随写入一起保存，只在索引不存在时从collection重建
+        if self.kb_generation is not None:
+            if self.bm25_index.exists():
+                return
+        elif len(self.bm25_index) == self.collection.count():
+            return
+
+        page_size = 1000
+        stored = self._visible_ids()
+        indexed = self.bm25_index.ids()
+        missing = sorted(stored - indexed)
+        extra = sorted(indexed - stored)
+        print(
+            f"BM25索引与向量数据库不一致，补充 {len(missing)} 个、移除 {len(extra)} 个文档块..."
+        )
+
+        self.bm25_index.remove(extra)
+        for start in range(0, len(missing), page_size):
+            page = self.collection.get(
+                ids=missing[start : start + page_size], include=["documents"]
+            )
+            self.bm25_index.add(
+                page["ids"], [self._tokenize(doc or "") for doc in page["documents"]]
+            )
+        self.bm25_index.save()
+        self._bump_generation()
+
+    def _ensure_vector_index(self) -> None:
+        """首次使用时校验向量检索后端的索引与collection是否一致，从Chroma补充缺失的向量"""
+        if self._vector_index_checked:
+            return
+        self._vector_index_checked = True
+        if self.vector_backend.sync(self.collection, self._visible_where()):
+            self._bump_generation()
 
     def get_embedding(self, text: str) -> List[float]:
         """获取文本的向量表示
@@ -67,59 +323,84 @@ class VectorStore:
         TODO: 使用OpenAI API获取文本的embedding向量
 
         """
-        # 移除换行符以获得更好的embedding效果
-        text = text.replace("\n", " ")
+        model = self.embedder.model
+        if self.embedding_cache:
+            cached = self.embedding_cache.get(model, text)
+            if cached is not None:
+                return cached
         try:
-            response = self.client.embeddings.create(
-                input=[text], model=OPENAI_EMBEDDING_MODEL
-            )
-            return response.data[0].embedding
+            if self.coalescer is not None:
+                embedding = self.coalescer.embed(text)
+            else:
+                embedding = self.embedder.embed_query(text)
         except Exception as e:
             print(f"获取Embedding失败: {e}")
             raise e
+        if self.embedding_cache:
+            self.embedding_cache.put(model, text, embedding)
+        return embedding
 
-    def add_documents(self, chunks: List[Dict[str, str]]) -> None:
-        """添加文档块到向量数据库
-        TODO: 实现文档块添加到向量数据库
-        要求：
-        1. 遍历文档块
-        2. 获取文档块内容
-        3. 获取文档块元数据
-        5. 打印添加进度
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """批量获取文本的向量表示，返回顺序与输入一致
+
+        先查询缓存，只对未命中的文本调用接口
         """
+        model = self.embedder.model
+        if self.embedding_cache:
+            embeddings = self.embedding_cache.get_many(model, texts)
+        else:
+            embeddings = [None] * len(texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not missing:
+            return embeddings
+
+        try:
+            fetched = self.embedder.embed_batch([texts[i] for i in missing])
+        except Exception as e:
+            print(f"批量获取Embedding失败: {e}")
+            raise e
+        for i, embedding in zip(missing, fetched):
+            embeddings[i] = embedding
+        if self.embedding_cache:
+            self.embedding_cache.put_many(model, [texts[i] for i in missing], fetched)
+        return embeddings
+
+    @staticmethod
+    def make_chunk_id(chunk: Dict) -> str:
+        """生成唯一ID (源文件相对数据目录的路径_页码_块ID)
+
+        用相对路径而不是文件名，不同子目录下的同名文件不会共用ID；数据目录顶层的文件ID与原来相同
+        PDF/PPT: chunk_id为0，依靠page_number区分
+        DOCX/TXT: page_number为0，依靠chunk_id区分
+        """
+        source = chunk.get("source") or chunk.get("filepath")
+        name = _relative_source(source) if source else chunk.get("filename", "unknown")
+        page_number = chunk.get("page_number", 0)
+        if chunk.get("chunk_type", "text") == "image":
+            return f"{name}_p{page_number}_img{chunk.get('image_id', 0)}"
+        return f"{name}_p{page_number}_c{chunk.get('chunk_id', 0)}"
+
+    def prepare_chunks(self, chunks: List[Dict[str, str]]):
+        """把文档块转换为 (ids, documents, metadatas)，跳过没有内容的块"""
         ids = []
         documents = []
         metadatas = []
-        embeddings = []
-
-        print(f"正在处理 {len(chunks)} 个文档块...")
 
-        for chunk in tqdm(chunks, desc="生成向量并准备数据"):
+        for chunk in chunks:
             content = chunk.get("content", "")
             if not content:
                 continue
 
-            # 1. 获取Embedding
-            embedding = self.get_embedding(content)
-            if not embedding:
-                continue
+            # 1. 生成唯一ID；分代collection中加上代数后缀，修改过的文件重新写入时
+            # 不会覆盖当前对外版本仍在使用的旧文档块
+            uid = self.make_chunk_id(chunk)
+            if self.kb_generation is not None:
+                uid = f"{uid}@g{self.kb_generation}"
 
-            # 2. 生成唯一ID (文件名_页码_块ID)
-            # PDF/PPT: chunk_id为0，依靠page_number区分
-            # DOCX/TXT: page_number为0，依靠chunk_id区分
-            filename = chunk.get("filename", "unknown")
+            # 2. 准备元数据 (过滤掉复杂对象)
             chunk_id = chunk.get("chunk_id", 0)
-            page_number = chunk.get("page_number", 0)
-            chunk_type = chunk.get("chunk_type", "text")
-            image_id = chunk.get("image_id", 0)
-            if chunk_type == "image":
-                uid = f"{filename}_p{page_number}_img{image_id}"
-            else:
-                uid = f"{filename}_p{page_number}_c{chunk_id}"
-
-            # 3. 准备元数据 (过滤掉复杂对象)
             meta = {
-                "filename": filename,
+                "filename": chunk.get("filename", "unknown"),
                 "filepath": chunk.get("filepath", ""),
                 "filetype": chunk.get("filetype", ""),
                 "page_number": chunk.get("page_number", 0),
@@ -128,31 +409,130 @@ class VectorStore:
 
             ids.append(uid)
             documents.append(content)
-            embeddings.append(embedding)
             metadatas.append(meta)
 
-            tokens = self._tokenize(content)
-            if tokens:
-                self._bm25_tokens.append(tokens)
-                self._bm25_documents.append(content)
-                self._bm25_metadatas.append(meta)
-                self._bm25_ids.append(uid)
-
-        # 批量添加到ChromaDB
-        if ids:
-            try:
-                self.collection.add(
-                    documents=documents,
-                    embeddings=embeddings,
-                    metadatas=metadatas,
-                    ids=ids,
+        return ids, documents, metadatas
+
+    def upsert_embeddings(
+        self,
+        ids: List[str],
+        documents: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict],
+    ) -> None:
+        """把已向量化的文档块写入ChromaDB并加入BM25索引，写入失败时抛出异常
+
+        BM25索引和向量检索后端的索引只更新内存，需要调用 flush() 持久化
+        """
+        self._ensure_bm25_index()
+        self._ensure_vector_index()
+        if embeddings:
+            self._record_embedding_info(len(embeddings[0]))
+        metadatas = self._stamp(metadatas)
+        self._bump_generation()
+        # upsert：重新构建同一文件时覆盖旧块；Chroma 单次写入有数量上限，分段提交
+        step = self.chroma_client.get_max_batch_size()
+        for start in range(0, len(ids), step):
+            end = start + step
+            self.collection.upsert(
+                documents=documents[start:end],
+                embeddings=embeddings[start:end],
+                metadatas=metadatas[start:end],
+                ids=ids[start:end],
+            )
+        self.bm25_index.add(ids, [self._tokenize(doc) for doc in documents])
+        self.vector_backend.add(ids, embeddings)
+
+    def _stamp(self, metadatas: List[Dict]) -> List[Dict]:
+        """分代collection中给写入的文档块加上新增代数和删除标记"""
+        if self.kb_generation is None:
+            return metadatas
+        return [
+            {**(meta or {}), "kb_added": self.kb_generation, "kb_removed": KB_NEVER_REMOVED}
+            for meta in metadatas
+        ]
+
+    def flush(self) -> None:
+        """持久化BM25索引和向量检索后端的索引（只追加改动，超过阈值才合并）"""
+        self.bm25_index.save()
+        self.vector_backend.save()
+
+    def add_documents(self, chunks: List[Dict[str, str]]) -> List[str]:
+        """添加文档块到向量数据库
+        TODO: 实现文档块添加到向量数据库
+        要求：
+        1. 遍历文档块
+        2. 获取文档块内容
+        3. 获取文档块元数据
+        5. 打印添加进度
+
+        返回成功写入的文档块ID列表
+        """
+        print(f"正在处理 {len(chunks)} 个文档块...")
+        ids, documents, metadatas = self.prepare_chunks(chunks)
+        if not ids:
+            return []
+
+        # 3. 批量并发获取Embedding
+        start_time = time.perf_counter()
+        embeddings = self.get_embeddings(documents)
+        elapsed = max(time.perf_counter() - start_time, 1e-9)
+        print(
+            f"向量化完成: {len(ids)} 个文档块, 耗时 {elapsed:.1f}s, "
+            f"吞吐 {len(ids) / elapsed:.1f} 块/秒"
+        )
+        if self.embedding_cache:
+            print(f"Embedding缓存: {self.embedding_cache.stats()}")
+
+        # 4. 批量写入ChromaDB，增量更新BM25索引
+        try:
+            self.upsert_embeddings(ids, documents, embeddings, metadatas)
+            print(f"成功添加 {len(ids)} 个文档块到向量数据库")
+        except Exception as e:
+            print(f"添加文档到向量数据库失败: {e}")
+            return []
+
+        # 5. 持久化BM25索引
+        self.flush()
+        return ids
+
+    def delete_documents(self, ids: List[str]) -> None:
+        """从向量数据库和BM25索引中删除指定ID的文档块（分代collection中只对当前代删除）"""
+        if not ids:
+            return
+        # 先校验BM25索引，避免把本次删除误判为索引不一致
+        self._ensure_bm25_index()
+        self._ensure_vector_index()
+        self._bump_generation()
+        step = self.chroma_client.get_max_batch_size()
+        for start in range(0, len(ids), step):
+            batch = ids[start : start + step]
+            if self.kb_generation is None:
+                self.collection.delete(ids=batch)
+                continue
+            # 分代collection中，本代写入的文档块直接删除；之前各代写入的只标记为在本代删除，
+            # 当前对外的版本仍能读到，之后的构建开始时再物理删除
+            records = self.collection.get(ids=batch, include=["metadatas"])
+            own, older = [], []
+            for uid, meta in zip(records["ids"], records["metadatas"]):
+                (own if (meta or {}).get("kb_added") == self.kb_generation else older).append(uid)
+            if own:
+                self.collection.delete(ids=own)
+            if older:
+                self.collection.update(
+                    ids=older, metadatas=[{"kb_removed": self.kb_generation}] * len(older)
                 )
-                print(f"成功添加 {len(ids)} 个文档块到向量数据库")
-                self._rebuild_bm25_index()
-            except Exception as e:
-                print(f"添加文档到向量数据库失败: {e}")
 
-    def search(self, query: str, top_k: int = TOP_K) -> List[Dict]:
+        # 只把删除记录追加到索引的日志段，不重写整个索引
+        self.bm25_index.remove(ids)
+        self.bm25_index.save()
+        self.vector_backend.remove(ids)
+        self.vector_backend.save()
+        print(f"已从向量数据库删除 {len(ids)} 个文档块")
+
+    def search(
+        self, query: str, top_k: int = TOP_K, known: Optional[Dict[str, Dict]] = None
+    ) -> List[Dict]:
         """搜索相关文档
 
         TODO: 实现向量相似度搜索
@@ -163,73 +543,103 @@ class VectorStore:
            - content: 文档内容
            - metadata: 元数据（文件名、页码等）
         4. 返回格式化的结果列表
+
+        known: 调用方已取回的文档块 {ID: 文档块}。向量检索后端（见 vector_backend）只返回
+        ID和距离，只有不在 known 中的文档块才从 Chroma 读取内容，各后端的返回格式一致
         """
+        cache_key = ("dense", query, top_k)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
         # 1. 获取查询文本的embedding
         query_embedding = self.get_embedding(query)
         if not query_embedding:
             return []
 
-        # 2. 搜索
+        # 2. 搜索：后端返回ID和距离，再从 Chroma 读取 known 中没有的文档块
         try:
-            results = self.collection.query(
-                query_embeddings=[query_embedding], n_results=top_k
-            )
-
-            # 3. 格式化结果
-            formatted_results = []
-            if results["documents"]:
-                # Chroma返回的是列表的列表
-                docs = results["documents"][0]
-                metas = results["metadatas"][0]
-                ids = results["ids"][0] if results.get("ids") else []
-                distances = results["distances"][0] if results["distances"] else []
-
-                for i in range(len(docs)):
-                    doc_id = ids[i] if i < len(ids) else f"vec_{i}"
-                    formatted_results.append(
-                        {
-                            "id": doc_id,
-                            "content": docs[i],
-                            "metadata": metas[i],
-                            "score": distances[i] if i < len(distances) else 0.0,
-                        }
-                    )
-
+            self._check_dimension(len(query_embedding))
+            formatted_results = self._search_delta(query_embedding, top_k, known or {})
+            self._cache_put(cache_key, formatted_results)
             return formatted_results
-
         except Exception as e:
             print(f"搜索失败: {e}")
             return []
 
-    def bm25_search(self, query: str, top_k: int = TOP_K) -> List[Dict]:
-        if not self._bm25_model:
-            self._rebuild_bm25_index()
-        if not self._bm25_model:
-            return []
+    def _search_delta(
+        self, query_embedding: List[float], top_k: int, known: Dict[str, Dict]
+    ) -> List[Dict]:
+        ids, distances = self._query_ids(query_embedding, top_k)
+        fetched = {
+            doc["id"]: doc for doc in self.get_documents([uid for uid in ids if uid not in known])
+        }
+        formatted_results = []
+        for i, uid in enumerate(ids):
+            doc = known.get(uid) or fetched.get(uid)
+            if doc:
+                score = distances[i] if i < len(distances) else 0.0
+                formatted_results.append({**doc, "score": score})
+        return formatted_results
+
+    def _query_ids(self, query_embedding: List[float], top_k: int):
+        """向量搜索，只返回 (ID列表, 距离列表)"""
+        self._ensure_vector_index()
+        return self.vector_backend.search(query_embedding, top_k)
+
+    def bm25_search(
+        self, query: str, top_k: int = TOP_K, known: Optional[Dict[str, Dict]] = None
+    ) -> List[Dict]:
+        """BM25 检索，known 的含义与 search 相同"""
+        cache_key = ("bm25", query, top_k)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
 
+        self._ensure_bm25_index()
         tokens = self._tokenize(query)
         if not tokens:
             return []
 
-        scores = self._bm25_model.get_scores(tokens)
-        ranked = sorted(
-            ((idx, score) for idx, score in enumerate(scores)),
-            key=lambda item: item[1],
-            reverse=True,
-        )[:top_k]
+        ranked = self.bm25_index.search(tokens, top_k)
+        if not ranked:
+            return []
 
+        # 倒排索引只保存ID，内容和元数据从collection中取回
+        known = known or {}
+        missing = [uid for uid, _ in ranked if uid not in known]
+        fetched = {doc["id"]: doc for doc in self.get_documents(missing)}
         results = []
-        for idx, score in ranked:
-            results.append(
-                {
-                    "id": self._bm25_ids[idx],
-                    "content": self._bm25_documents[idx],
-                    "metadata": self._bm25_metadatas[idx],
-                    "score": float(score),
-                }
-            )
+        for uid, score in ranked:
+            doc = known.get(uid) or fetched.get(uid)
+            if doc:
+                results.append({**doc, "score": float(score)})
+        # 读取失败时结果为空，不缓存
+        if results:
+            self._cache_put(cache_key, results)
         return results
 
+    def get_documents(self, ids: List[str]) -> List[Dict]:
+        """按ID取回文档块，按传入的顺序返回，已不存在的ID被跳过"""
+        if not ids:
+            return []
+        try:
+            records = self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+        except Exception as e:
+            print(f"读取文档块失败: {e}")
+            return []
+        by_id = {
+            uid: (doc, meta)
+            for uid, doc, meta in zip(
+                records["ids"], records["documents"], records["metadatas"]
+            )
+        }
+        return [
+            {"id": uid, "content": by_id[uid][0], "metadata": by_id[uid][1]}
+            for uid in ids
+            if uid in by_id
+        ]
+
     @staticmethod
     def _rrf_fuse(result_lists: List[List[Dict]], top_k: int, k: int = 60) -> List[Dict]:
         scores = defaultdict(float)
@@ -255,27 +665,168 @@ class VectorStore:
         top_k: int = TOP_K,
         vector_k: int = TOP_K,
         bm25_k: int = TOP_K,
+        known: Optional[Dict[str, Dict]] = None,
     ) -> List[Dict]:
-        dense_results = self.search(query, vector_k)
-        sparse_results = self.bm25_search(query, bm25_k)
+        """向量检索和 BM25 检索的结果按 RRF 融合，known 的含义与 search 相同"""
+        cache_key = ("hybrid", query, top_k, vector_k, bm25_k)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        dense_results = self.search(query, vector_k, known=known)
+        sparse_results = self.bm25_search(query, bm25_k, known=known)
         if not dense_results and not sparse_results:
             return []
         fused = self._rrf_fuse([dense_results, sparse_results], top_k=top_k)
+        self._cache_put(cache_key, fused)
         return fused
 
     def clear_collection(self) -> None:
         """清空collection"""
         self.chroma_client.delete_collection(name=self.collection_name)
         self.collection = self.chroma_client.create_collection(
-            name=self.collection_name, metadata={"description": "课程向量数据库"}
+            name=self.collection_name,
+            metadata=self._new_collection_metadata(self.kb_generation is not None),
         )
-        self._bm25_tokens.clear()
-        self._bm25_documents.clear()
-        self._bm25_metadatas.clear()
-        self._bm25_ids.clear()
-        self._bm25_model = None
+        self._collection_metadata = dict(self.collection.metadata or {})
+        self.bm25_index.clear()
+        self.bm25_index.save()
+        self._bm25_checked = True
+        self.vector_backend.clear()
+        self.vector_backend.save(compact=True)
+        self._vector_index_checked = True
+        self._bump_generation()
         print("向量数据库已清空")
 
+    def fork_indexes(self, source_generation: int) -> None:
+        """从当前collection的另一代派生当前代的BM25索引和本地向量索引
+
+        索引文件写出后不再修改，新的一代用硬链接共用旧一代的文件，只追加自己的改动，
+        不随语料规模复制数据。旧一代没有索引时，首次使用时从collection补齐
+        """
+        for source_dir, target_dir in (
+            (self._bm25_dir(self.collection_name, source_generation), self.bm25_index.index_dir),
+            (
+                self._vector_dir(self.collection_name, source_generation),
+                self._vector_dir(self.collection_name, self.kb_generation),
+            ),
+        ):
+            if os.path.isdir(source_dir):
+                _link_tree(source_dir, target_dir)
+            else:
+                shutil.rmtree(target_dir, ignore_errors=True)
+        self.bm25_index = BM25Index(self.bm25_index.index_dir, tokenizer=self.tokenizer.signature)
+        self._bm25_checked = False
+        self.vector_backend.reload()
+        self._vector_index_checked = False
+        self._bump_generation()
+
+    def purge_removed(self, generation: int) -> None:
+        """物理删除在 generation 及之前各代已被删除的文档块，之后的各代都不会再读到它们"""
+        if self.kb_generation is not None:
+            self.collection.delete(where={"kb_removed": {"$lte": generation}})
+
+    def rollback_generation(self, generation: int) -> None:
+        """撤销中断的构建在当前collection中写入的某一代：删除该代新增的文档块，
+        恢复该代删除的文档块，并删除该代的索引目录"""
+        if self._collection_metadata.get("kb_versioned"):
+            self.collection.delete(where={"kb_added": generation})
+            page_size = 1000
+            while True:
+                page = self.collection.get(
+                    where={"kb_removed": generation}, include=[], limit=page_size
+                )
+                if not page["ids"]:
+                    break
+                self.collection.update(
+                    ids=page["ids"], metadatas=[{"kb_removed": KB_NEVER_REMOVED}] * len(page["ids"])
+                )
+        for path in self._generation_dirs(self.collection_name).get(generation, []):
+            shutil.rmtree(path, ignore_errors=True)
+        self._bump_generation()
+
+    def remove_stale_generations(self, keep: List[int]) -> None:
+        """删除当前collection中不在 keep 里的各代索引目录"""
+        for generation, paths in self._generation_dirs(self.collection_name).items():
+            if generation not in keep:
+                for path in paths:
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def copy_collection(self, source_name: str, progress=None) -> int:
+        """把旧版本不分代的collection的文档块（含向量）和索引复制到当前collection
+
+        不调用embedding接口，只在迁移旧版本的向量库时使用一次，复制的文档块标记为当前代新增。
+        返回复制的文档块数量
+        """
+        try:
+            source = self.chroma_client.get_collection(source_name)
+        except Exception:
+            return 0
+        total = source.count()
+        page_size = 1000
+        for offset in range(0, total, page_size):
+            page = source.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=page_size,
+                offset=offset,
+            )
+            if offset == 0 and len(page["embeddings"]):
+                self._record_embedding_info(len(page["embeddings"][0]))
+            self.collection.upsert(
+                ids=page["ids"],
+                embeddings=page["embeddings"],
+                documents=page["documents"],
+                metadatas=self._stamp(page["metadatas"]),
+            )
+            if progress:
+                progress({"copied": offset + len(page["ids"]), "total": total})
+
+        # BM25索引和本地向量索引直接链接文件，与collection不一致时会在首次使用时补齐
+        for source_dir, target_dir in (
+            (self._bm25_dir(source_name), self.bm25_index.index_dir),
+            (self._vector_dir(source_name), self._vector_dir(self.collection_name, self.kb_generation)),
+        ):
+            if os.path.isdir(source_dir):
+                _link_tree(source_dir, target_dir)
+        self.bm25_index = BM25Index(self.bm25_index.index_dir, tokenizer=self.tokenizer.signature)
+        self._bm25_checked = False
+        self.vector_backend.reload()
+        self._vector_index_checked = False
+        self._bump_generation()
+        print(f"已从 {source_name} 复制 {total} 个文档块")
+        return total
+
+    def drop_collection(self, collection_name: str) -> None:
+        """删除另一个collection及其各代的BM25索引和本地向量索引"""
+        if collection_name == self.collection_name:
+            raise ValueError("不能删除当前正在使用的collection")
+        try:
+            self.chroma_client.delete_collection(name=collection_name)
+        except Exception:
+            pass
+        paths = [self._bm25_dir(collection_name), self._vector_dir(collection_name)]
+        for generation_paths in self._generation_dirs(collection_name).values():
+            paths.extend(generation_paths)
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+
+    @property
+    def version(self) -> str:
+        """知识库版本，用于让依赖检索结果的缓存随知识库重建失效
+
+        collection名称和知识库代数区分各次构建（见 CollectionRegistry），
+        检索缓存代数区分本进程内对同一代的修改
+        """
+        return f"{self.collection_name}@{self.kb_generation}:{self.generation}"
+
+    def close(self) -> None:
+        """停止查询向量化合并的后台线程和线程池"""
+        if self.coalescer is not None:
+            self.coalescer.close()
+
     def get_collection_count(self) -> int:
-        """获取collection中的文档数量"""
-        return self.collection.count()
+        """获取collection中当前代可见的文档数量"""
+        if self.kb_generation is None:
+            return self.collection.count()
+        self._ensure_bm25_index()
+        return len(self.bm25_index)